@@ -1,25 +1,45 @@
-import json
 import os
-from flask import Flask, flash, redirect, request, send_from_directory, url_for
+from flask import Flask, abort, flash, jsonify, redirect, request, send_from_directory, url_for
+from typing import List
 from werkzeug.utils import secure_filename
 
-from onesource import create_and_run_job
+from journal import load_control_data
+from job_queue import JOB_PROCESSED, JobQueue
+from model_registry import preload_models
+from onesource import create_and_run_job, import_pipeline_steps
+from pipeline import get_temp_path
+import settings
 
 
-UPLOAD_FOLDER = '/var/data/in'
-DOWNLOAD_FOLDER = '/var/data/out/tika_extract'
+JOBS_FOLDER = os.getenv('JOBS_FOLDER', '/var/data/jobs')
 ALLOWED_EXTENSIONS = {'pdf', 'docx'}
 
+# number of background processes running jobs
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '1'))
+
+# maximum seconds a status request waits for a job to end
+MAX_WAIT = 30
+
 DEBUG = os.getenv('DEBUG', 'false') == 'true'
 
+# registers the models of the steps, so that they are preloaded by `preload_models`
+import_pipeline_steps()
+
 
 app = Flask(__name__)
 app.secret_key = b'one source for file extraction'
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['DOWNLOAD_FOLDER'] = DOWNLOAD_FOLDER
-app.add_url_rule(
-    "/uploads/<name>", endpoint="download_file", build_only=True
-)
+
+
+def run_pipeline_job(read_dir: str, write_dir: str, temp_dir: str) -> List[str]:
+    create_and_run_job(read_dir, write_dir, temp_dir, overwrite=True, delete=True)
+    job_info = load_control_data(get_temp_path(read_dir, temp_dir))
+    if job_info['job']['status'] != JOB_PROCESSED:
+        raise Exception(job_info['job'].get('message', 'job failed'))
+
+    return [x['path'] for x in job_info.get('tika_extract', []) if x['status'] == 'processed']
+
+
+job_queue = JobQueue(JOBS_FOLDER, run_pipeline_job, max_workers=JOB_WORKERS)
 
 
 def allowed_file(filename):
@@ -27,11 +47,6 @@ def allowed_file(filename):
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
-@app.route('/uploads/<name>')
-def download_file(name):
-    return send_from_directory(app.config["DOWNLOAD_FOLDER"], name)
-
-
 @app.route('/', methods=['GET', 'POST'])
 def upload_file():
     print('request: ' + str(request))
@@ -52,16 +67,12 @@ def upload_file():
             return redirect(request.url)
         if file and allowed_file(file.filename):
             filename = secure_filename(file.filename)
-            file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-            process()
-            with open('/var/data/temp/var-data-in.json') as f:
-                job_info = json.load(f)
-            output_path = job_info['tika_extract'][0]['path']
-            output_file = os.path.basename(output_path)
-            # url = url_for('download_file', name=output_file, _external=True, _scheme='https')
-            url = url_for('download_file', name=output_file)
+            job_id = job_queue.create_job()
+            file.save(os.path.join(job_queue.get_input_dir(job_id), filename))
+            job_queue.submit(job_id)
+            url = url_for('job_status', job_id=job_id)
             print('url: ' + str(url))
-            return redirect(url)
+            return jsonify(job_id=job_id, status_url=url), 202, {'Location': url}
     return '''
     <!doctype html>
     <title>Upload new File</title>
@@ -73,12 +84,38 @@ def upload_file():
     '''
 
 
-@app.route('/process', methods=['POST'])
-def process():
-    create_and_run_job('/var/data/in', '/var/data/out', '/var/data/temp', overwrite=True, delete=True)
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """
+    Get the status of a job, with the urls of its output files once processed.
+    Pass `wait` seconds to wait for the job to end before responding.
+    """
+    wait = min(request.args.get('wait', 0, type=float), MAX_WAIT)
+    if wait > 0:
+        status = job_queue.wait(job_id, wait)
+    else:
+        status = job_queue.get_status(job_id)
+
+    if not status:
+        abort(404)
+
+    if status['status'] == JOB_PROCESSED:
+        status['output_urls'] = [url_for('job_output_file', job_id=job_id, path=p) for p in status['outputs']]
+
+    return jsonify(status)
+
+
+@app.route('/jobs/<job_id>/files/<path:path>')
+def job_output_file(job_id, path):
+    if not job_queue.get_status(job_id):
+        abort(404)
+
+    return send_from_directory(job_queue.get_output_dir(job_id), path)
 
 
 if __name__ == '__main__':
+    # job processes are forked from this process, so share its models
+    preload_models()
     if DEBUG:
         app.run(debug=True, port=5001)
     else:
@@ -0,0 +1,96 @@
+from argparse import ArgumentParser
+from dateutil.parser import parse
+import os
+import random
+import sys
+from timeit import default_timer as timer
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'onesource'))
+
+from entity_spans import is_valid_date_value, is_valid_entity, prune_contained_entities  # noqa: E402
+
+DATES = ['1 March 2018', '2019-06-30', '15/07/2017', 'March 2020', '31 December 1985']
+
+
+def create_entities(count: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    Matches of a text of a table of prices: each row has a number within a
+    price within a row, and some rows have a date.
+    """
+    rnd = random.Random(seed)
+    entities = []
+    pos = 0
+    while len(entities) < count:
+        row_start = pos
+        price_start = pos + rnd.randint(2, 10)
+        entities.append({'entity': 'sys-number', 'location': [price_start + 1, price_start + 6], 'value': 1.0})
+        entities.append({'entity': 'price', 'location': [price_start, price_start + 6], 'value': 'price'})
+        if rnd.random() < 0.5:
+            date_start = price_start + 8
+            entities.append({'entity': 'sys-date', 'location': [date_start, date_start + 12],
+                             'value': rnd.choice(DATES)})
+
+        pos = price_start + 25
+        entities.append({'entity': 'row', 'location': [row_start, pos], 'value': 'row'})
+
+    return entities
+
+
+def prune_pairwise(entities: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # the previous implementation, comparing each entity with every other
+    def is_contained(entity):
+        start, end = entity['location']
+        for ent in entities:
+            s, e = ent['location']
+            if (start == s and end < e) or (start > s and end == e) or (start > s and end < e):
+                return True
+
+        return False
+
+    def is_valid(entity):
+        if entity['entity'] == 'sys-date':
+            start, end = entity['location']
+            if (end - start) < 8:
+                return False
+
+            try:
+                date = parse(entity['value'])
+            except ValueError:
+                return False
+
+            if date.year < 1990 or date.year > 2025:
+                return False
+
+        return True
+
+    return [ent for ent in entities if not is_contained(ent) and is_valid(ent)]
+
+
+def prune_sweep(entities: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [ent for ent in prune_contained_entities(entities) if is_valid_entity(ent)]
+
+
+def run(counts: List[int], texts: int) -> None:
+    for count in counts:
+        docs = [create_entities(count, seed) for seed in range(texts)]
+        is_valid_date_value.cache_clear()
+        results = {}
+        for name, prune in (('pairwise', prune_pairwise), ('sweep', prune_sweep)):
+            start = timer()
+            results[name] = [prune(entities) for entities in docs]
+            results[name + '_time'] = timer() - start
+
+        assert results['pairwise'] == results['sweep']
+        print('{} entities x {} texts: pairwise {:.1f} ms, sweep {:.1f} ms ({:.0f}x)'.format(
+            count, texts, results['pairwise_time'] * 1000, results['sweep_time'] * 1000,
+            results['pairwise_time'] / results['sweep_time']))
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Measure the time to prune contained entity spans of dense matches')
+    parser.add_argument('--counts', type=int, nargs='+', default=[10, 100, 1000], help='entities per text')
+    parser.add_argument('--texts', type=int, default=20, help='number of texts of each size')
+    args = parser.parse_args()
+
+    run(args.counts, args.texts)
@@ -0,0 +1,90 @@
+from argparse import ArgumentParser
+import os
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+root_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+# modules that light imports must not load
+HEAVY_MODULES = ['duckling', 'dotenv', 'flair', 'pandas', 'psycopg2', 'py2neo', 'pycorenlp', 'ray', 'spacy',
+                 'tensorflow']
+
+DEFAULT_MODULES = ['onesource', 'pipeline', 'journal', 'cache']
+
+CHECK_SCRIPT = '''
+import sys
+import {module}
+print(','.join(m for m in {heavy_modules!r} if m in sys.modules))
+'''
+
+
+def get_env() -> Dict[str, str]:
+    env = dict(os.environ)
+    paths = [root_path, os.path.join(root_path, 'onesource'), os.path.join(root_path, 'v2')]
+    if env.get('PYTHONPATH'):
+        paths.append(env['PYTHONPATH'])
+
+    env['PYTHONPATH'] = os.pathsep.join(paths)
+    return env
+
+
+def measure_import(module: str) -> Tuple[int, List[Tuple[int, str]], List[str]]:
+    """
+    Import a module in a new interpreter.
+
+    :param module: module name
+    :return: cumulative microseconds of the import, cumulative microseconds and
+             names of the modules it imported, and names of heavy modules loaded
+    """
+    script = CHECK_SCRIPT.format(module=module, heavy_modules=HEAVY_MODULES)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', script], env=get_env(), cwd=root_path,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    imports = []
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+
+        _, cumulative, name = line[len('import time:'):].split('|')
+        cumulative = int(cumulative)
+        name = name.strip()
+        if name == 'site':
+            # imported at startup, before the module
+            imports = []
+            continue
+
+        if name == module:
+            total = cumulative
+        else:
+            imports.append((cumulative, name))
+
+    loaded = [m for m in result.stdout.strip().split(',') if m]
+    return total, imports, loaded
+
+
+def run(modules: List[str], repeat: int, top: int) -> bool:
+    ok = True
+    for module in modules:
+        # the fastest of several runs is least affected by other processes
+        runs = [measure_import(module) for _ in range(repeat)]
+        total, imports, loaded = min(runs, key=lambda r: r[0])
+        print('{}: {:.1f} ms'.format(module, total / 1000))
+        for cumulative, name in sorted(imports, reverse=True)[:top]:
+            print('  {:>9.1f} ms  {}'.format(cumulative / 1000, name))
+
+        if loaded:
+            print('  loads heavy modules: {}'.format(', '.join(loaded)))
+            ok = False
+
+    return ok
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Measure the time to import modules in a new interpreter')
+    parser.add_argument('modules', nargs='*', default=DEFAULT_MODULES, help='modules to import')
+    parser.add_argument('--repeat', type=int, default=5, help='number of runs of each import')
+    parser.add_argument('--top', type=int, default=5, help='number of slowest imports to show')
+    args = parser.parse_args()
+
+    sys.exit(0 if run(args.modules, args.repeat, args.top) else 1)
@@ -0,0 +1,82 @@
+from argparse import ArgumentParser
+import json
+import random
+from timeit import default_timer as timer
+from typing import Any, List
+
+SAMPLE_TEXTS = [
+    'The report was approved by {} and sent to the board on Monday.',
+    '{} joined the team in March, after six years working with {} on the northern region.',
+    'Contact {} for questions about the contract.',
+    'Revenue grew by 12 percent, according to a statement from {}.',
+    'The meeting between {} and {} was postponed until the audit is complete.',
+    'No changes were made to the schedule.'
+]
+
+SAMPLE_NAMES = ['Alice Smith', 'Bob Jones', 'Carol White', 'David Brown', 'Erin Green', 'Frank Miller']
+
+
+def create_texts(count: int) -> List[str]:
+    rnd = random.Random(0)
+    texts = []
+    for _ in range(count):
+        template = rnd.choice(SAMPLE_TEXTS)
+        texts.append(template.format(*rnd.sample(SAMPLE_NAMES, template.count('{}'))))
+
+    return texts
+
+
+def read_texts(paths: List[str]) -> List[str]:
+    # output files of the collect step
+    texts = []
+    for path in paths:
+        with open(path) as f:
+            texts.extend(json.load(f)['data']['text'])
+
+    return texts
+
+
+def tag_one_by_one(tagger: Any, texts: List[str]) -> int:
+    from flair.data import Sentence
+    span_count = 0
+    for text in texts:
+        sentence = Sentence(text)
+        tagger.predict(sentence)
+        span_count += len(sentence.get_spans('ner'))
+
+    return span_count
+
+
+def tag_batched(tagger: Any, texts: List[str], batch_size: int) -> int:
+    from flair.data import Sentence
+    sentences = [Sentence(text) for text in texts]
+    tagger.predict(sentences, mini_batch_size=batch_size)
+    return sum(len(sentence.get_spans('ner')) for sentence in sentences)
+
+
+def run(texts: List[str], batch_sizes: List[int]) -> None:
+    from flair.models import SequenceTagger
+    tagger = SequenceTagger.load('ner')
+
+    # warm up
+    tag_batched(tagger, texts[:8], 8)
+
+    start = timer()
+    span_count = tag_one_by_one(tagger, texts)
+    elapsed = timer() - start
+    print('one by one: {:.1f} sentences/s, {} spans'.format(len(texts) / elapsed, span_count))
+    for batch_size in batch_sizes:
+        start = timer()
+        span_count = tag_batched(tagger, texts, batch_size)
+        elapsed = timer() - start
+        print('batch size {}: {:.1f} sentences/s, {} spans'.format(batch_size, len(texts) / elapsed, span_count))
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Measure the throughput of NER tagging one sentence at a time and in batches')
+    parser.add_argument('paths', nargs='*', help='output files of the collect step, else sample texts are tagged')
+    parser.add_argument('--count', type=int, default=500, help='number of sample texts')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[8, 32, 64], help='batch sizes to measure')
+    args = parser.parse_args()
+
+    run(read_texts(args.paths) if args.paths else create_texts(args.count), args.batch_sizes)
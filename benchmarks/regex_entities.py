@@ -0,0 +1,103 @@
+from argparse import ArgumentParser
+import os
+import random
+import re
+import sys
+from timeit import default_timer as timer
+from typing import Any, Dict, List, Pattern
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'onesource'))
+
+from entity_patterns import compile_regexprs, match_regexprs  # noqa: E402
+
+WORDS = ('the price of SKU-12345 is $ 10.50 and Acme Widget 5 plus AB2-77 item 3.5 each for customers in '
+         'the region').split()
+
+# number of patterns of each alternation of the merged variant
+CHUNK_SIZE = 100
+
+
+def create_regexprs(count: int) -> Dict[str, List[str]]:
+    templates = [r'\bSKU-{}\d{{3}}\b', r'Widget {}\b', r'[A-Z]{{2}}{}-(\d+)', r'\$\s?{}\d*(?:\.\d\d)?']
+    return {'value_{}'.format(i): [templates[i % len(templates)].format(i)] for i in range(count)}
+
+
+def create_texts(count: int, word_count: int = 80) -> List[str]:
+    rnd = random.Random(0)
+    return [' '.join(rnd.choice(WORDS) for _ in range(word_count)) for _ in range(count)]
+
+
+def match_uncompiled(texts: List[str], regexprs: Dict[str, List[str]]) -> List[List[Dict[str, Any]]]:
+    # the previous implementation, relying on the cache of the `re` module
+    results = []
+    for text in texts:
+        matches = []
+        for entity_value, exprs in regexprs.items():
+            for expr in exprs:
+                for match in re.finditer(expr, text):
+                    matches.append((entity_value, list(match.span())))
+
+        results.append(matches)
+
+    return results
+
+
+def match_compiled(texts: List[str], regexprs: Dict[str, List[Pattern]]) -> List[List[Dict[str, Any]]]:
+    return [[(m['value'], m['location']) for m in match_regexprs(text, regexprs)] for text in texts]
+
+
+def match_merged(texts: List[str], regexprs: Dict[str, List[Pattern]]) -> List[List[Dict[str, Any]]]:
+    # each text is searched with an alternation of each chunk of patterns, and
+    # only the patterns of chunks that match are run, so that matches are the
+    # same as running each pattern
+    patterns = [(entity_value, expr) for entity_value, exprs in regexprs.items() for expr in exprs]
+    chunks = []
+    for i in range(0, len(patterns), CHUNK_SIZE):
+        chunk = patterns[i:i + CHUNK_SIZE]
+        chunks.append((re.compile('|'.join('(?:{})'.format(expr.pattern) for _, expr in chunk)), chunk))
+
+    results = []
+    for text in texts:
+        matches = []
+        for alternation, chunk in chunks:
+            if alternation.search(text):
+                for entity_value, expr in chunk:
+                    for match in expr.finditer(text):
+                        matches.append((entity_value, list(match.span())))
+
+        results.append(matches)
+
+    return results
+
+
+def run(pattern_count: int, text_count: int) -> None:
+    regexprs = create_regexprs(pattern_count)
+    texts = create_texts(text_count)
+    start = timer()
+    compiled = compile_regexprs(regexprs)
+    print('compile {} patterns: {:.1f} ms'.format(pattern_count, (timer() - start) * 1000))
+
+    # cleared so that uncompiled matching starts from the same state as a new process
+    re.purge()
+    expected = None
+    for name, match, patterns in (('uncompiled', match_uncompiled, regexprs),
+                                  ('compiled', match_compiled, compiled),
+                                  ('merged', match_merged, compiled)):
+        start = timer()
+        results = match(texts, patterns)
+        elapsed = timer() - start
+        if expected is None:
+            expected = results
+
+        assert results == expected
+        print('{}: {:.1f} ms per text, {} matches'.format(name, elapsed * 1000 / len(texts),
+                                                          sum(len(r) for r in results)))
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Measure the time to match regular expression entities')
+    parser.add_argument('--patterns', type=int, default=2000, help='number of patterns')
+    parser.add_argument('--texts', type=int, default=50, help='number of texts')
+    args = parser.parse_args()
+
+    run(args.patterns, args.texts)
@@ -3,6 +3,6 @@
 export PYTHONPATH=.:onesource
 
 # not allowing files to be uploaded
-#gunicorn -b 0.0.0.0:5000 wsgi:app
+#gunicorn --preload -b 0.0.0.0:5000 wsgi:app
 
 python app.py
\ No newline at end of file
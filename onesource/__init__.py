@@ -1,23 +1,30 @@
 from argparse import ArgumentParser
+from cache import ContentCache
 from datetime import datetime
-import json
+from journal import load_control_data, write_control_snapshot
 import logging
 from logging import Logger
 import os
-from pipeline import HIDDEN_FILE_PREFIXES, Pipeline
+from pipeline import get_temp_path, HIDDEN_FILE_PREFIXES, Pipeline
 import sys
 import tempfile
 from timeit import default_timer as timer
 
-from collect import CollectStep
-from combine import CombineStep
-from extract import ExtractStep
-from prep_for_dr_qa import PrepForDrQAStep
-from tika_extract import TikaExtractStep
+
+def import_pipeline_steps() -> None:
+    """
+    Import the modules of the pipeline steps, which register the models that
+    they use, so that the models can be preloaded before processes are forked.
+    Steps are otherwise imported when a job is run.
+
+    :return: None
+    """
+    import tika_extract  # noqa: F401
 
 
 def create_and_run_job(read_root_dir: str, write_root_dir: str, temp_dir: str, overwrite: bool, delete: bool,
-                       logger: Logger = None):
+                       logger: Logger = None, max_workers: int = None, streaming: bool = False,
+                       cache_dir: str = None):
     if not os.path.exists(read_root_dir):
         sys.exit("read dir '{}' not found".format(read_root_dir))
 
@@ -52,19 +59,21 @@ def create_and_run_job(read_root_dir: str, write_root_dir: str, temp_dir: str, o
                     'status': 'started'
                 })
 
-    control_filename = os.path.abspath(read_root_dir).replace('/', '-')[1:]
-    temp_path = os.path.join(temp_dir, control_filename + '.json')
+    temp_path = get_temp_path(read_root_dir, temp_dir)
     if not overwrite and os.path.isfile(temp_path):
-        with open(temp_path, 'r') as control_file:
-            control_data = json.load(control_file)
-            control_paths = [x['path'] for x in control_data['files']]
-            diff = set(control_paths).symmetric_difference(set(paths))
-            if diff:
-                logger.error('control fileset differs from input fileset')
-                sys.exit(-1)
+        control_data = load_control_data(temp_path)
+
+        # fold the journal into the control file, so that new events are not
+        # appended to a partial last line left by a crash
+        write_control_snapshot(temp_path, control_data)
+        control_paths = [x['path'] for x in control_data['files']]
+        diff = set(control_paths).symmetric_difference(set(paths))
+        if diff:
+            logger.error('control fileset differs from input fileset')
+            sys.exit(-1)
 
-            control_data['job']['start'] = now
-            control_data['job']['status'] = 'started'
+        control_data['job']['start'] = now
+        control_data['job']['status'] = 'started'
 
     else:
         control_data = {
@@ -76,12 +85,18 @@ def create_and_run_job(read_root_dir: str, write_root_dir: str, temp_dir: str, o
             },
             'files': files
         }
-        with open(temp_path, 'w') as output_file:
-            json.dump(control_data, output_file)
+        write_control_snapshot(temp_path, control_data)
+
+    cache = ContentCache(cache_dir) if cache_dir else None
+
+    # steps are imported when a job is run, as they load libraries such as spaCy,
+    # so that importing the package is fast
+    from tika_extract import TikaExtractStep
 
     # setup pipeline
-    pipe = Pipeline(control_data, logger, temp_path, overwrite=overwrite)([
-        TikaExtractStep('Tika extract', 'files', delete=delete),
+    pipe = Pipeline(control_data, logger, temp_path, overwrite=overwrite, max_workers=max_workers,
+                    streaming=streaming)([
+        TikaExtractStep('Tika extract', 'files', delete=delete, cache=cache),
         # ExtractStep('Extract text', 'files'),
         # CollectStep('Collect text'),
         # IdentifyQuestionsStep('Identify questions'),
@@ -112,7 +127,12 @@ if __name__ == "__main__":
     parser.add_argument('--overwrite', dest='overwrite', help='overwrite any processed files', action='store_true')
     parser.add_argument('--no-overwrite', dest='overwrite', help='overwrite any processed files', action='store_false')
     parser.add_argument('--delete', dest='delete', help='delete file after read', action='store_true')
-    parser.set_defaults(overwrite=False, delete=False)
+    parser.add_argument('--workers', dest='max_workers', help='number of processes per step', type=int)
+    parser.add_argument('--stream', dest='streaming', help='pass documents between steps in memory',
+                        action='store_true')
+    parser.add_argument('--cache', dest='cache_dir', help='cache dir of parsed and extracted content')
+    parser.set_defaults(overwrite=False, delete=False, streaming=False)
     args = parser.parse_args()
 
-    create_and_run_job(args.read_root_dir, args.write_root_dir, args.temp_dir, args.overwrite, args.delete)
+    create_and_run_job(args.read_root_dir, args.write_root_dir, args.temp_dir, args.overwrite, args.delete,
+                       max_workers=args.max_workers, streaming=args.streaming, cache_dir=args.cache_dir)
@@ -0,0 +1,166 @@
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import tempfile
+from typing import Any, Dict
+
+# 1 GiB
+DEFAULT_MAX_SIZE = 1 << 30
+
+READ_BLOCK_SIZE = 1 << 20
+
+# the cache dir is scanned again after a process writes this fraction of the
+# maximum size, so that entries written by other processes are counted
+RESCAN_FRACTION = 16
+
+
+class ContentCache(object):
+    """
+    On-disk cache of JSON values by content key, e.g. the SHA-256 of an input
+    file plus the configuration and version of whatever produced the value.
+
+    The cache is bounded in size. When full, the least recently used entries
+    are evicted. Recency is kept in the modification time of each entry, so
+    the cache can be reopened and shared between processes. Each process keeps
+    its own index of the cache dir, and scans the dir again after it writes
+    `max_size / RESCAN_FRACTION` bytes, so when shared by n processes the cache
+    may exceed its size by up to n * max_size / RESCAN_FRACTION.
+    """
+
+    def __init__(self, cache_dir: str, max_size: int = DEFAULT_MAX_SIZE):
+        """
+
+        :param cache_dir: path to cache directory
+        :param max_size: maximum total size of entries in bytes
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # size of each entry by key, from least to most recently used
+        self.__index: Dict[str, int] = OrderedDict()
+        self.__size = 0
+
+        # bytes written by this process since the cache dir was scanned
+        self.__written_size = 0
+        self.__scan()
+
+    @property
+    def size(self) -> int:
+        return self.__size
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.__index
+
+    def get(self, key: str) -> Any:
+        """
+        Get cached value.
+
+        :param key: content key
+        :return: value, or None if not cached
+        """
+        path = self.__get_path(key)
+        try:
+            with open(path, 'r') as f:
+                value = json.load(f)
+
+            os.utime(path)
+        except (OSError, ValueError):
+            # evicted by another process, or partially written before a crash
+            self.__remove(key)
+            self.misses += 1
+            return None
+
+        if key in self.__index:
+            self.__index.move_to_end(key)
+
+        self.hits += 1
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        """
+        Cache value, evicting the least recently used entries if full.
+
+        :param key: content key
+        :param value: JSON serializable value
+        :return: None
+        """
+        path = self.__get_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # write then rename so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(value, f)
+
+        os.replace(tmp_path, path)
+        self.__size -= self.__index.pop(key, 0)
+        self.__index[key] = os.path.getsize(path)
+        self.__size += self.__index[key]
+        self.__written_size += self.__index[key]
+        if self.__size > self.max_size or self.__written_size > self.max_size // RESCAN_FRACTION:
+            self.__scan()
+
+        while self.__size > self.max_size and len(self.__index) > 1:
+            self.__remove(next(iter(self.__index)))
+
+    def __scan(self) -> None:
+        entries = []
+        for root, _, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                if filename.endswith('.json'):
+                    try:
+                        stat = os.stat(os.path.join(root, filename))
+                    except OSError:
+                        # evicted by another process
+                        continue
+
+                    entries.append((stat.st_mtime, filename[:-5], stat.st_size))
+
+        self.__index = OrderedDict()
+        self.__size = 0
+        self.__written_size = 0
+        for _, key, size in sorted(entries):
+            self.__index[key] = size
+            self.__size += size
+
+    def __remove(self, key: str) -> None:
+        self.__size -= self.__index.pop(key, 0)
+        try:
+            os.remove(self.__get_path(key))
+        except OSError:
+            pass
+
+    def __get_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key + '.json')
+
+
+def get_file_hash(path: str) -> str:
+    """
+    Get SHA-256 digest of file content.
+
+    :param path: path of file
+    :return: hex digest
+    """
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(READ_BLOCK_SIZE), b''):
+            h.update(block)
+
+    return h.hexdigest()
+
+
+def get_cache_key(content_hash: str, config: Dict[str, Any]) -> str:
+    """
+    Combine the hash of some content with the configuration used to process it.
+
+    :param content_hash: hex digest of content
+    :param config: JSON serializable configuration, including a version
+    :return: content key
+    """
+    h = hashlib.sha256(content_hash.encode('utf-8'))
+    h.update(json.dumps(config, sort_keys=True).encode('utf-8'))
+    return h.hexdigest()
@@ -1,14 +1,11 @@
+from config_service import ConfigService, get_config_service
 from datetime import datetime
 import json
 from logging import Logger
 import os
-from pipeline import AbstractStep, file_iter, json_output_handler as oh
-from typing import Any, AnyStr, Callable, Dict, Iterator, IO, List
+from pipeline import AbstractStep, file_iter, json_output_handler as oh, process_files
+from typing import Any, AnyStr, Callable, Dict, Iterator, IO, List, Tuple
 from utils import convert_name_to_underscore
-import yaml
-
-dir_path = os.path.dirname(os.path.realpath(__file__))
-CONFIG_FILE_PATH = os.path.join(dir_path, '../config/config.yml')
 
 
 class CollectStep(AbstractStep):
@@ -21,10 +18,23 @@ class CollectStep(AbstractStep):
                  source_key: str = None,
                  overwrite: bool = False,
                  source_iter: Callable[[List[str]], Iterator[IO[AnyStr]]] = file_iter,
-                 output_handler: Callable[[str, Dict[str, Any]], None] = oh):
-        super().__init__(name, source_key, overwrite)
+                 output_handler: Callable[[str, Dict[str, Any]], None] = oh,
+                 persist: bool = True,
+                 config: ConfigService = None):
+        """
+
+        :param name: human-readable name of step
+        :param source_key: `control_data` key for source list
+        :param overwrite: overwrite files flag
+        :param source_iter: data source iterable
+        :param output_handler: receives output
+        :param persist: write output when streamed to the next step
+        :param config: config service, defaults to the service of the process
+        """
+        super().__init__(name, source_key, overwrite, persist=persist)
         self.__source_iter = source_iter
         self.__output_handler = output_handler
+        self.__config = config or get_config_service()
 
     def process_file(self,
                      file: IO[AnyStr],
@@ -34,12 +44,21 @@ class CollectStep(AbstractStep):
                      accumulator: Dict[str, Any]
                      ) -> str:
         logger.debug('process file: {}'.format(file.name))
-        config = load_config()
-        input_doc = json.load(file)
+        output_path, _ = self.process_content(json.load(file), path, control_data, logger, accumulator)
+        return output_path
+
+    def process_content(self,
+                        input_doc: Dict[str, Any],
+                        path: str,
+                        control_data: Dict[str, Any],
+                        logger: Logger,
+                        accumulator: Dict[str, Any]
+                        ) -> Tuple[str, Dict[str, Any]]:
+        config = self.__config.get()
         metadata = input_doc['metadata']
         record_id = metadata['record_id']
         doc_type = metadata['doc_type']
-        text_props = set(config['doc_types'][doc_type]['text_props'])
+        text_props = config.text_props[doc_type]
         data = input_doc['data']
         structured_content = []
         text = []
@@ -62,10 +81,12 @@ class CollectStep(AbstractStep):
         step_name = convert_name_to_underscore(self.name)
         output_filename = '{}_{}.json'.format(step_name, record_id)
         output_path = os.path.join(write_root_dir, step_name, output_filename)
-        update_control_info_(file.name, path, output_filename, output_path, accumulator)
+        update_control_info_(path, path, output_filename, output_path, accumulator, self.output_status)
         content = {'metadata': metadata, 'data': {'structured_content': structured_content, 'text': text}}
-        self.__output_handler(output_path, content)
-        return output_path
+        if self.persist:
+            self.__output_handler(output_path, content)
+
+        return output_path, content
 
     def run(self, control_data: Dict[str, Any], logger: Logger, accumulator: Dict[str, Any]) -> None:
         file_paths = [x['path'] for x in control_data[self.source_key]]
@@ -76,27 +97,17 @@ class CollectStep(AbstractStep):
                 if x['status'] == 'processed':
                     processed_file_paths[x['input']] = x
 
-        for file, path in self.__source_iter(file_paths):
-            if not self._overwrite and path in processed_file_paths:
-                accumulator['files_output'].append(processed_file_paths[path])
-                continue
-
-            self.process_file(file, path, control_data, logger, accumulator)
-
-
-def load_config() -> Dict[str, Any]:
-    # get lists of data keys by `doc_type` to include in output
-    with open(CONFIG_FILE_PATH, 'r') as f:
-        config = yaml.load(f)
-
-    return config
+        for _ in process_files(self, self.__source_iter, file_paths, control_data, logger, accumulator,
+                               processed_file_paths):
+            pass
 
 
 def update_control_info_(source_filename: str,
                          source_path: str,
                          output_filename: str,
                          output_path: str,
-                         accumulator: Dict[str, Any]
+                         accumulator: Dict[str, Any],
+                         status: str = 'processed'
                          ) -> None:
     now = datetime.utcnow().isoformat()
     accumulator['files_processed'].append({
@@ -107,6 +118,6 @@ def update_control_info_(source_filename: str,
         'filename': output_filename,
         'input': source_path,
         'path': output_path,
-        'status': 'processed',
+        'status': status,
         'time': now
     })
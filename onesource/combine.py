@@ -1,14 +1,11 @@
+from config_service import ConfigService, get_config_service
 from datetime import datetime
 import json
 from logging import Logger
 import os
-from pipeline import AbstractStep, file_iter, text_output_handler as oh
+from pipeline import AbstractStep, file_iter, process_files, text_output_handler as oh
 from typing import Any, AnyStr, Callable, Dict, Iterator, IO, List, Optional
 from utils import convert_name_to_underscore
-import yaml
-
-dir_path = os.path.dirname(os.path.realpath(__file__))
-CONFIG_FILE_PATH = os.path.join(dir_path, '../config/config.yml')
 
 FLUSH_FILE_COUNT = 100
 
@@ -23,10 +20,21 @@ class CombineStep(AbstractStep):
                  source_key: str = None,
                  overwrite: bool = False,
                  source_iter: Callable[[List[str]], Iterator[IO[AnyStr]]] = file_iter,
-                 output_handler: Callable[[str, List[str], Optional[bool]], None] = oh):
+                 output_handler: Callable[[str, List[str], Optional[bool]], None] = oh,
+                 config: ConfigService = None):
+        """
+
+        :param name: human-readable name of step
+        :param source_key: `control_data` key for source list
+        :param overwrite: overwrite files flag
+        :param source_iter: data source iterable
+        :param output_handler: receives output
+        :param config: config service, defaults to the service of the process
+        """
         super().__init__(name, source_key, overwrite)
         self.__source_iter = source_iter
         self.__output_handler = output_handler
+        self.__config = config or get_config_service()
 
     def process_file(self,
                      file: IO[AnyStr],
@@ -36,8 +44,7 @@ class CombineStep(AbstractStep):
                      accumulator: Dict[str, Any]
                      ) -> List[str]:
         logger.debug('process file: {}'.format(file.name))
-        config = load_config()
-        doc_types_with_text = config['doc_types_with_text']
+        doc_types_with_text = self.__config.get().doc_types_with_text
         input_doc = json.load(file)
         doc_type = input_doc['metadata']['doc_type']
         text = []
@@ -68,20 +75,19 @@ class CombineStep(AbstractStep):
             'status': 'processed',
             'time': datetime.utcnow().isoformat()
         }
-        accumulator['files_output'].append(output)
         processed_file_paths = []
-        if step_name in control_data and control_data[step_name]['status'] == 'processed':
-            processed_file_paths = control_data[step_name]['input']
+        for x in control_data.get(step_name, []):
+            if x['status'] == 'processed':
+                processed_file_paths = x.get('input', [])
+
+        paths = file_paths
+        if not self._overwrite:
+            file_paths = [p for p in file_paths if p not in processed_file_paths]
 
-        paths = []
         text = []
         j = 0
-        for file, path in self.__source_iter(file_paths):
-            paths.append(path)
-            if not self._overwrite and path in processed_file_paths:
-                continue
-
-            text.extend(self.process_file(file, path, control_data, logger, accumulator))
+        for _, file_text in process_files(self, self.__source_iter, file_paths, control_data, logger, accumulator):
+            text.extend(file_text)
             j += 1
             # manage memory use - flush every 100th file
             if j % FLUSH_FILE_COUNT == 0:
@@ -91,9 +97,5 @@ class CombineStep(AbstractStep):
         self.__output_handler(output_path, text, self._overwrite)
         output['input'] = paths
 
-
-def load_config() -> Dict[str, Any]:
-    with open(CONFIG_FILE_PATH, 'r') as f:
-        config = yaml.load(f)
-
-    return config
+        # record once complete, as the journal does not see later changes
+        accumulator['files_output'].append(output)
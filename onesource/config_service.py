@@ -0,0 +1,108 @@
+import os
+from typing import Any, Dict, FrozenSet, List
+import yaml
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+CONFIG_FILE_PATH = os.path.join(dir_path, '../config/config.yml')
+
+_service = None
+
+
+class PipelineConfig(object):
+    """
+    Validated view of the pipeline config, with the lookups used for each
+    document precompiled into frozen sets.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        """
+
+        :param config: config as loaded from YAML
+        :raises ValueError: if the config is not valid
+        """
+        validate_config(config)
+        self.raw = config
+        self.doc_types_with_text: FrozenSet[str] = frozenset(config.get('doc_types_with_text') or [])
+        self.text_props: Dict[str, FrozenSet[str]] = {}
+        self.question_templates: Dict[str, List[Dict[str, str]]] = {}
+        for doc_type, doc_config in (config.get('doc_types') or {}).items():
+            doc_config = doc_config or {}
+            self.text_props[doc_type] = frozenset(doc_config.get('text_props') or [])
+            self.question_templates[doc_type] = doc_config.get('question_templates') or []
+
+    def __getitem__(self, key: str) -> Any:
+        return self.raw[key]
+
+
+class ConfigService(object):
+    """
+    Loads the pipeline config once, and again only when the modification time
+    of the config file changes, e.g. when edited under a long-running server.
+    """
+
+    def __init__(self, path: str = CONFIG_FILE_PATH):
+        """
+
+        :param path: path to YAML config file
+        """
+        self.path = path
+        self.load_count = 0
+        self.__config = None
+        self.__mtime = None
+
+    def get(self) -> PipelineConfig:
+        """
+        Get the config, reloading it if the file has changed.
+
+        :return: config
+        """
+        mtime = os.stat(self.path).st_mtime_ns
+        if self.__config is None or mtime != self.__mtime:
+            with open(self.path, 'r') as f:
+                config = PipelineConfig(yaml.safe_load(f) or {})
+
+            self.__config = config
+            self.__mtime = mtime
+            self.load_count += 1
+
+        return self.__config
+
+
+def validate_config(config: Dict[str, Any]) -> None:
+    """
+    Check the structure of the pipeline config.
+
+    :param config: config as loaded from YAML
+    :raises ValueError: if the config is not valid
+    """
+    if not isinstance(config, dict):
+        raise ValueError('config must be a mapping')
+
+    doc_types_with_text = config.get('doc_types_with_text') or []
+    if not isinstance(doc_types_with_text, list):
+        raise ValueError("'doc_types_with_text' must be a list")
+
+    doc_types = config.get('doc_types') or {}
+    if not isinstance(doc_types, dict):
+        raise ValueError("'doc_types' must be a mapping")
+
+    for doc_type, doc_config in doc_types.items():
+        if doc_config is not None and not isinstance(doc_config, dict):
+            raise ValueError("config of doc type '{}' must be a mapping".format(doc_type))
+
+        text_props = (doc_config or {}).get('text_props') or []
+        if not isinstance(text_props, list):
+            raise ValueError("'text_props' of doc type '{}' must be a list".format(doc_type))
+
+
+def get_config_service() -> ConfigService:
+    """
+    Get the config service shared by the steps in this process.
+
+    :return: config service
+    """
+    global _service
+    if _service is None:
+        _service = ConfigService()
+
+    return _service
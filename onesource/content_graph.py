@@ -0,0 +1,169 @@
+import hashlib
+import json
+import re
+from typing import Any, Callable, Dict
+
+# increment when the graph of content changes, so that documents are written again
+CONTENT_GRAPH_VERSION = 1
+
+# adds a node from its text, type, url, is question flag, sequence index and
+# position in the structure of the document, returning its id
+AddNode = Callable[..., Any]
+
+# adds an edge from the ids of its nodes and its type
+AddEdge = Callable[[Any, Any, str], None]
+
+
+def add_content_graph(content: Dict[str, Any], add_node: AddNode, add_edge: AddEdge) -> None:
+    """
+    Add the structured content of a document as a graph of content nodes, such
+    as text, lists, list items, tables, rows and cells, and of the edges between
+    them, such as before, after, has_heading and cell_of.
+
+    :param content: JSON content
+    :param add_node: adds a node, returning its id. The position of the node is
+           passed by keyword, as a tuple unique within the document
+    :param add_edge: adds an edge between the ids of two nodes
+    :return: None
+    """
+    data = content['structured_content']
+    prev_item = None
+    prev_heading = None
+    links = {}
+    for item_index, item in enumerate(data):
+        node_type = item['type']
+        if node_type in ['text', 'heading', 'link']:
+            node_text = item['text']
+            node_id = add_node(node_text, node_type, item.get('url', None), item.get('is_question', None),
+                               position=(item_index,))
+            if prev_item:
+                add_edge(prev_item['node_id'], node_id, 'before')
+                add_edge(node_id, prev_item['node_id'], 'after')
+
+            prev_item = dict(item, node_id=node_id)
+            if node_type == 'heading':
+                prev_heading = prev_item
+            elif prev_heading:
+                add_edge(node_id, prev_heading['node_id'], 'has_heading')
+
+            if node_type == 'link':
+                links[node_text] = item
+            else:
+                found_links = re.findall(r'\[\[(.*?)\]\]', node_text)
+                for link in found_links:
+                    if link[0] in links:
+                        add_edge(node_id, links[link[0]]['node_id'], 'has_link')
+
+        elif node_type == 'list':
+            list_node_id = add_node(None, 'list', None, None, position=(item_index,))
+            if prev_item:
+                add_edge(prev_item['node_id'], list_node_id, 'before')
+                add_edge(list_node_id, prev_item['node_id'], 'after')
+
+            if prev_heading:
+                add_edge(list_node_id, prev_heading['node_id'], 'has_heading')
+
+            prev_item = dict(item, node_id=list_node_id)
+
+            prev_list_item = None
+            for i, list_item in enumerate(item['items']):
+                list_item_node_id = add_node(list_item, 'list_item', None, item.get('is_question', None), i,
+                                             position=(item_index, i))
+                add_edge(list_item_node_id, list_node_id, 'item_of')
+                if prev_list_item:
+                    add_edge(prev_list_item['node_id'], list_item_node_id, 'before')
+                    add_edge(list_item_node_id, prev_list_item['node_id'], 'after')
+
+                prev_list_item = dict(node_id=list_item_node_id)
+                found_links = re.findall(r'\[\[(.*?)\]\]', list_item)
+                for link in found_links:
+                    if link[0] in links:
+                        add_edge(list_item_node_id, links[link[0]]['node_id'], 'has_link')
+
+        elif node_type == 'table':
+            table_node_id = add_node(None, 'table', None, None, position=(item_index,))
+            if prev_item:
+                add_edge(prev_item['node_id'], table_node_id, 'before')
+                add_edge(table_node_id, prev_item['node_id'], 'after')
+
+            if prev_heading:
+                add_edge(table_node_id, prev_heading['node_id'], 'has_heading')
+
+            prev_item = dict(item, node_id=table_node_id)
+
+            prev_row = None
+            prev_cell = None
+            row_node_id = None
+            for i, head_cell in enumerate(item['head']):
+                if isinstance(head_cell, list):
+                    row_node_id = add_node(None, 'table_head_row', None, None, i, position=(item_index, 'h', i))
+                    add_edge(row_node_id, table_node_id, 'head_row_of')
+                    if prev_row:
+                        add_edge(prev_row['node_id'], row_node_id, 'before')
+                        add_edge(row_node_id, prev_row['node_id'], 'after')
+
+                    prev_row = dict(node_id=row_node_id)
+
+                    prev_cell = None
+                    for j, cell in enumerate(head_cell):
+                        cell_node_id = add_node(cell, 'table_head_cell', None, item.get('is_question', None), j,
+                                                position=(item_index, 'h', i, j))
+                        add_edge(cell_node_id, row_node_id, 'cell_of')
+                        if prev_cell:
+                            add_edge(prev_cell['node_id'], cell_node_id, 'before')
+                            add_edge(cell_node_id, prev_cell['node_id'], 'after')
+
+                        prev_cell = dict(node_id=cell_node_id)
+
+                else:
+                    if not row_node_id:
+                        row_node_id = add_node(None, 'table_head_row', None, None, position=(item_index, 'h'))
+                        add_edge(row_node_id, table_node_id, 'head_row_of')
+                        if prev_row:
+                            add_edge(prev_row['node_id'], row_node_id, 'before')
+                            add_edge(row_node_id, prev_row['node_id'], 'after')
+
+                    cell_node_id = add_node(head_cell, 'table_head_cell', None, item.get('is_question', None), i,
+                                            position=(item_index, 'h', i))
+                    add_edge(cell_node_id, row_node_id, 'cell_of')
+                    if prev_cell:
+                        add_edge(prev_cell['node_id'], cell_node_id, 'before')
+                        add_edge(cell_node_id, prev_cell['node_id'], 'after')
+
+                    prev_cell = dict(node_id=cell_node_id)
+
+            prev_row = None
+            for i, row in enumerate(item['body']):
+                row_node_id = add_node(None, 'table_body_row', None, None, i, position=(item_index, 'b', i))
+                add_edge(row_node_id, table_node_id, 'body_row_of')
+                if prev_row:
+                    add_edge(prev_row['node_id'], row_node_id, 'before')
+                    add_edge(row_node_id, prev_row['node_id'], 'after')
+
+                prev_row = dict(node_id=row_node_id)
+
+                prev_cell = None
+                for j, cell in enumerate(row):
+                    cell_node_id = add_node(cell, 'table_body_cell', None, item.get('is_question', None), j,
+                                            position=(item_index, 'b', i, j))
+                    add_edge(cell_node_id, row_node_id, 'cell_of')
+                    if prev_cell:
+                        add_edge(prev_cell['node_id'], cell_node_id, 'before')
+                        add_edge(cell_node_id, prev_cell['node_id'], 'after')
+
+                    prev_cell = dict(node_id=cell_node_id)
+
+
+def get_content_fingerprint(content: Dict[str, Any]) -> str:
+    """
+    Get a fingerprint of the structured content of a document, which changes
+    when the graph of the document would change.
+
+    :param content: JSON content
+    :return: hex digest
+    """
+    key = json.dumps({
+        'version': CONTENT_GRAPH_VERSION,
+        'structured_content': content.get('structured_content')
+    }, sort_keys=True)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
@@ -0,0 +1,139 @@
+import json
+import os
+from queue import Queue
+import requests
+import settings
+from typing import Any, Dict, List, Tuple
+
+CORENLP_SERVER_ENDPOINT = os.getenv('CORENLP_SERVER_ENDPOINT', 'http://localhost:9000')
+
+# maximum number of characters of text sent in one request
+DEFAULT_MAX_BATCH_CHARS = 50000
+
+# texts of a batch are separated by blank lines, at which sentences are always split
+TEXT_SEPARATOR = '\n\n'
+
+TAGGER_PROPERTIES = {
+    'annotators': 'tokenize, ssplit, pos, ner',
+    'ssplit.newlineIsSentenceBreak': 'two',
+    'outputFormat': 'json'
+}
+
+# token, NER tag and POS tag
+TaggedToken = Tuple[str, str, str]
+
+
+class CoreNLPServerException(Exception):
+    pass
+
+
+class CoreNLPClient(object):
+    """
+    Client for a running Stanford CoreNLP server, which keeps a pool of
+    keep-alive sessions so that each request does not pay for a new connection,
+    and annotates many texts in each request.
+
+    The client must be created in the process that uses it, as open connections
+    cannot be shared with forked processes.
+
+    Any object with a `tag` method of the same signature, e.g. a stand-in for
+    tests, can be used in place of the client.
+    """
+
+    def __init__(self, endpoint: str = None, max_connections: int = 4, timeout: int = 60,
+                 max_batch_chars: int = DEFAULT_MAX_BATCH_CHARS):
+        """
+
+        :param endpoint: URL of CoreNLP server, defaults to env var CORENLP_SERVER_ENDPOINT
+        :param max_connections: maximum number of concurrent requests
+        :param timeout: request timeout in seconds
+        :param max_batch_chars: maximum number of characters of text in one request,
+               unless a single text is longer
+        """
+        self.endpoint = (endpoint or CORENLP_SERVER_ENDPOINT).rstrip('/')
+        self.max_connections = max_connections
+        self.max_batch_chars = max_batch_chars
+        self.__timeout = timeout
+        self.__sessions = Queue()
+        for _ in range(max_connections):
+            self.__sessions.put(requests.Session())
+
+    def annotate(self, text: str, properties: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Annotate text, blocking until a session is free if `max_connections`
+        requests are already in flight.
+
+        :param text: text
+        :param properties: annotation properties
+        :return: annotated document
+        """
+        session = self.__sessions.get()
+        try:
+            resp = session.post(self.endpoint, params={'properties': json.dumps(properties)},
+                                data=text.encode('utf-8'), timeout=self.__timeout)
+        finally:
+            self.__sessions.put(session)
+
+        if resp.status_code != 200:
+            raise CoreNLPServerException('CoreNLP server returned status {}: {}'.format(resp.status_code, resp.text))
+
+        resp.encoding = 'utf-8'
+        return json.loads(resp.text)
+
+    def tag(self, texts: List[str]) -> List[List[List[TaggedToken]]]:
+        """
+        Tokenize, split into sentences and tag texts, sending as many texts as
+        fit in `max_batch_chars` in each request.
+
+        :param texts: texts
+        :return: for each text, list of sentences of tagged tokens
+        """
+        tagged = []
+        batch = []
+        batch_chars = 0
+        for text in texts:
+            if batch and batch_chars + len(text) > self.max_batch_chars:
+                tagged.extend(self.__tag_batch(batch))
+                batch = []
+                batch_chars = 0
+
+            batch.append(text)
+            batch_chars += len(text) + len(TEXT_SEPARATOR)
+
+        if batch:
+            tagged.extend(self.__tag_batch(batch))
+
+        return tagged
+
+    def close(self) -> None:
+        while not self.__sessions.empty():
+            self.__sessions.get().close()
+
+    def __tag_batch(self, texts: List[str]) -> List[List[List[TaggedToken]]]:
+        doc = self.annotate(TEXT_SEPARATOR.join(texts), TAGGER_PROPERTIES)
+
+        # character offsets are counted by the server in UTF-16 code units
+        ends = []
+        end = 0
+        for text in texts:
+            end += utf16_len(text)
+            ends.append(end)
+            end += len(TEXT_SEPARATOR)
+
+        tagged = [[] for _ in texts]
+        i = 0
+        for sentence in doc.get('sentences', []):
+            tokens = sentence['tokens']
+            if not tokens:
+                continue
+
+            while i < len(ends) - 1 and tokens[0]['characterOffsetBegin'] >= ends[i]:
+                i += 1
+
+            tagged[i].append([(t['originalText'], t['ner'], t['pos']) for t in tokens])
+
+        return tagged
+
+
+def utf16_len(text: str) -> int:
+    return len(text.encode('utf-16-le')) // 2
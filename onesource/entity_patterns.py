@@ -0,0 +1,41 @@
+import re
+from typing import Any, Dict, List, Pattern
+
+
+def compile_regexprs(regexprs: Dict[str, List[str]]) -> Dict[str, List[Pattern]]:
+    """
+    Compile the regular expressions of entity values once, instead of on
+    each match. With more expressions than the `re` module caches, each would
+    otherwise be compiled again for every text.
+
+    :param regexprs: dict of entity value to regular expressions
+    :return: dict of entity value to compiled patterns
+    :raises re.error: if an expression is invalid
+    """
+    return {entity_value: [re.compile(expr) for expr in exprs] for entity_value, exprs in regexprs.items()}
+
+
+def match_regexprs(utter: str, regexprs: Dict[str, List[Pattern]]) -> List[Dict[str, Any]]:
+    matches = []
+    for entity_value, exprs in regexprs.items():
+        for expr in exprs:
+            for match in expr.finditer(utter):
+                groups = [{
+                    'group': 'group_0',
+                    'location': list(match.span())
+                }]
+                for i, g in enumerate(match.groups()):
+                    groups.append({
+                        'group': 'group_{}'.format(i + 1),
+                        'location': list(match.span(i + 1))
+                    })
+
+                entity = {
+                    'location': list(match.span()),
+                    'value': entity_value,
+                    'confidence': 1.0,
+                    'groups': groups
+                }
+                matches.append(entity)
+
+    return matches
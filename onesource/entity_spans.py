@@ -0,0 +1,60 @@
+from dateutil.parser import parse
+from functools import lru_cache
+from typing import Any, Dict, List
+
+# dates outside these years are taken to be spurious matches
+MIN_DATE_YEAR = 1990
+MAX_DATE_YEAR = 2025
+
+# minimum number of characters of a date match
+MIN_DATE_LENGTH = 8
+
+
+def prune_contained_entities(entities: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Keep the entity with the longest span where the span of an entity is
+    contained within the span of another. Entities with the same span are all
+    kept.
+
+    Spans are swept in order of start, and of longest first for the same
+    start, so a span is contained in another iff a previous distinct span ends
+    at or after its end.
+
+    :param entities: entities with a 'location' of [start, end]
+    :return: entities that are not contained, in input order
+    """
+    spans = sorted({tuple(ent['location']) for ent in entities}, key=lambda span: (span[0], -span[1]))
+    contained = set()
+    max_end = None
+    for start, end in spans:
+        if max_end is not None and end <= max_end:
+            contained.add((start, end))
+        else:
+            max_end = end
+
+    return [ent for ent in entities if tuple(ent['location']) not in contained]
+
+
+def is_valid_entity(entity: Dict[str, Any]) -> bool:
+    # remove spurious dates
+    if entity['entity'] == 'sys-date':
+        start, end = entity['location']
+        if (end - start) < MIN_DATE_LENGTH:
+            return False
+
+        value = entity['value']
+        if isinstance(value, str):
+            return is_valid_date_value(value)
+
+    return True
+
+
+@lru_cache(maxsize=4096)
+def is_valid_date_value(value: str) -> bool:
+    # the same dates recur across the texts of a document
+    try:
+        date = parse(value)
+    except (ValueError, OverflowError):
+        return False
+
+    return MIN_DATE_YEAR <= date.year <= MAX_DATE_YEAR
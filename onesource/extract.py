@@ -1,15 +1,19 @@
+from cache import ContentCache, get_cache_key
 from datetime import datetime
-from extractors import AbstractExtractor, HeadingExtractor, ListExtractor, TableExtractor, TextExtractor
+from extractors import EXTRACTORS_VERSION, HtmlExtractor, reextract_layout_tables
+import hashlib
 from io import BytesIO
 import json
 from json.decoder import JSONDecodeError
 from logging import Logger
 from lxml import etree
-import lxml.html
+from model_registry import get_model
 import os
-from pipeline import AbstractStep, file_iter, json_output_handler as oh
+from pipeline import AbstractStep, file_iter, json_output_handler as oh, process_files
+from spacy.language import Language
+from tika_extract import SENTENCE_NLP
 from typing import Any, AnyStr, Callable, Dict, IO, Iterator, List, Tuple
-from utils import clean_text, convert_name_to_underscore, fix_content, flatten, get_iso_datetime_from_millis
+from utils import clean_text, convert_name_to_underscore, fix_content, get_iso_datetime_from_millis
 
 
 class ExtractStep(AbstractStep):
@@ -24,7 +28,10 @@ class ExtractStep(AbstractStep):
                  source_iter: Callable[[List[str]], Iterator[IO[AnyStr]]] = file_iter,
                  output_handler: Callable[[str, Dict[str, Any]], None] = oh,
                  excluded_tags: List[str] = None,
-                 max_file_count: int = 100000):
+                 max_file_count: int = 100000,
+                 persist: bool = True,
+                 cache: ContentCache = None,
+                 nlp: Language = None):
         """
 
         :param name: human-readable name of step
@@ -34,12 +41,22 @@ class ExtractStep(AbstractStep):
         :param output_handler: receives output
         :param excluded_tags: do not extract from these tags
         :param max_file_count: maximum number of files to process
+        :param persist: write output when streamed to the next step
+        :param cache: optional cache of extracted content
+        :param nlp: spaCy model to split text into sentences, defaults to the model shared with the Tika extract step
         """
-        super().__init__(name, source_key, overwrite)
+        super().__init__(name, source_key, overwrite, persist=persist)
         self.__source_iter = source_iter
         self.__output_handler = output_handler
         self.__excluded_tags = excluded_tags or ['GUID']
         self.__max_file_count = max_file_count
+        self.__cache = cache
+        self.__nlp = nlp
+
+    @property
+    def nlp(self) -> Language:
+        # loaded once per process, and shared by steps
+        return self.__nlp or get_model(SENTENCE_NLP)
 
     def element_iterator(self,
                          stream: IO[AnyStr],
@@ -113,49 +130,14 @@ class ExtractStep(AbstractStep):
                     'json': maybe_json
                 })
             except (JSONDecodeError, ValueError):
-                extractors = [
-                    ListExtractor(excluded_tags=['table']),
-                    TableExtractor(),
-                    TextExtractor(excluded_tags=['ul', 'ol', 'table', 'title', 'h1', 'h2', 'h3', 'h4']),
-                    HeadingExtractor(excluded_tags=['ul', 'ol', 'table'])
-                ]
+                extractor = HtmlExtractor()
                 stream: IO[AnyStr] = BytesIO(fix_content(el.text).encode('utf-8'))
-                for ev, elem in self.element_iterator(stream, html=True):
-                    process_html_element(elem, ev, extractors, structured_content, text_list)
+                events = list(self.element_iterator(stream, html=True))
+                extractor.extract_events(events, structured_content, text_list, self.nlp)
 
                 # re-extract content in single column tables used for layout purposes only
-                html = None  # memoize
-                k = []
-                for i, c in enumerate(structured_content):
-                    typ = c['type']
-                    if typ in ['text', 'heading']:
-                        k.append(1)
-                    elif typ == 'list':
-                        k.append(len(c.get('items', [])))
-                    elif typ == 'table':
-                        k.append(len(c.get('head', [])) + len(c.get('body', [])))
-                        if len(c.get('fields', [])) == 1:
-                            if not html:
-                                # reset stream to reiterate
-                                stream.seek(0)
-
-                                # read stream into str and parse as html
-                                html = lxml.html.fromstring(stream.read())
-
-                            # find single column layout table
-                            contents = html.xpath(('/descendant::table[{0}]/tbody/tr/td/*|' +
-                                                   '/descendant::table[{0}]/tr/td/*').format(c['index']))
-                            root = etree.Element('div')
-                            root.extend(contents)
-                            sc = []
-                            tl = []
-                            for evt, ele in etree.iterwalk(root, events=('start', 'end')):
-                                process_html_element(ele, evt, extractors, sc, tl)
-
-                            j = len(c.get('references', []))
-                            structured_content = flatten([structured_content[:(i - j)], sc,
-                                                          structured_content[(i + 1):]])
-                            text_list = flatten([text_list[:sum(k[:(i - j)])], tl, text_list[sum(k[:(i + 1)]):]])
+                structured_content, text_list = reextract_layout_tables(extractor, events, structured_content,
+                                                                        text_list, self.nlp)
 
             data = {}
             if len(text_list) == 1:
@@ -176,22 +158,55 @@ class ExtractStep(AbstractStep):
                      accumulator: Dict[str, Any]
                      ) -> str:
         logger.debug('process file: {}'.format(file.name))
+        output_path, _ = self.process_content(self.load_content(file, path), path, control_data, logger, accumulator)
+        return output_path
+
+    def load_content(self, file: IO[AnyStr], path: str) -> IO[AnyStr]:
+        # XML is parsed incrementally from the file
+        return file
+
+    def process_content(self,
+                        file: IO[AnyStr],
+                        path: str,
+                        control_data: Dict[str, Any],
+                        logger: Logger,
+                        accumulator: Dict[str, Any]
+                        ) -> Tuple[str, Dict[str, Any]]:
         write_root_dir = control_data['job']['write_root_dir']
         accumulator.update({
             'data': {},
             'is_data': False,
             'metadata': {'doc_type': None, 'record_id': None}
         })
-        for event, el in self.element_iterator(file):
-            self.process_xml_element(el, event, accumulator)
+        source_filename = file.name
+        if self.__cache:
+            xml = file.read()
+            key = get_cache_key(hashlib.sha256(xml).hexdigest(), {
+                'step': 'extract',
+                'version': EXTRACTORS_VERSION,
+                'excluded_tags': self.__excluded_tags
+            })
+            cached = self.__cache.get(key)
+            if cached is None:
+                for event, el in self.element_iterator(BytesIO(xml)):
+                    self.process_xml_element(el, event, accumulator)
+
+                self.__cache.put(key, {'metadata': accumulator['metadata'], 'data': accumulator['data']})
+            else:
+                accumulator.update(cached)
+        else:
+            for event, el in self.element_iterator(file):
+                self.process_xml_element(el, event, accumulator)
 
         record_id = accumulator['metadata']['record_id']
         step_name = convert_name_to_underscore(self.name)
         output_filename = '{}_{}.json'.format(step_name, record_id)
         output_path = os.path.join(write_root_dir, step_name, output_filename)
-        update_control_info_(file.name, path, output_filename, output_path, accumulator)
-        self.write_output(accumulator, output_path)
-        return output_path
+        update_control_info_(source_filename, path, output_filename, output_path, accumulator, self.output_status)
+        if self.persist:
+            self.write_output(accumulator, output_path)
+
+        return output_path, {'metadata': accumulator['metadata'], 'data': accumulator['data']}
 
     def write_output(self, accumulator: Dict[str, Any], output_path: str) -> None:
         content = {'metadata': accumulator['metadata'], 'data': accumulator['data']}
@@ -211,33 +226,17 @@ class ExtractStep(AbstractStep):
             #                         if x['status'] == 'processed']
 
         accumulator['file_count'] = 0
-        for file, path in self.__source_iter(file_paths):
-            if path in processed_file_paths.keys() and not self._overwrite:
-                accumulator['files_output'].append(processed_file_paths[path])
-                continue
-
-            if accumulator['file_count'] > self.__max_file_count:
-                break
-
-            self.process_file(file, path, control_data, logger, accumulator)
+        for _ in process_files(self, self.__source_iter, file_paths, control_data, logger, accumulator,
+                               processed_file_paths, self.__max_file_count):
             accumulator['file_count'] += 1
 
 
-def process_html_element(el: etree.ElementBase,
-                         event: str,
-                         extractors: List[AbstractExtractor],
-                         structured_content: List[Dict[str, Any]],
-                         text_list: List[str]
-                         ) -> None:
-    for extractor in extractors:
-        extractor.extract(el, event, structured_content, text_list)
-
-
 def update_control_info_(source_filename: str,
                          source_path: str,
                          output_filename: str,
                          output_path: str,
-                         accumulator: Dict[str, Any]
+                         accumulator: Dict[str, Any],
+                         status: str = 'processed'
                          ) -> None:
     now = datetime.utcnow().isoformat()
     accumulator['files_processed'].append({
@@ -248,6 +247,6 @@ def update_control_info_(source_filename: str,
         'filename': output_filename,
         'input': source_path,
         'path': output_path,
-        'status': 'processed',
+        'status': status,
         'time': now
     })
@@ -1,15 +1,17 @@
 import csv
 from datetime import datetime
-from dateutil.parser import parse
 from duckling import DucklingWrapper
+from entity_patterns import compile_regexprs, match_regexprs
+from entity_spans import is_valid_entity, prune_contained_entities
 from flair.data import Sentence
 from flair.models import SequenceTagger
 from flashtext import KeywordProcessor
 import json
 from logging import Logger
+from model_registry import get_model, register_model
 import os
 from pathlib import Path
-from pipeline import AbstractStep, file_iter, json_output_handler as oh
+from pipeline import AbstractStep, file_iter, json_output_handler as oh, process_files
 import re
 from typing import Any, AnyStr, Callable, Dict, Iterator, IO, List, Tuple
 from utils import convert_name_to_underscore
@@ -19,6 +21,21 @@ ENTITY_NUMBER = 'number'
 ENTITY_PERSON = 'person'
 ENABLED_SYSTEM_ENTITIES = {ENTITY_DATE, ENTITY_NUMBER, ENTITY_PERSON}
 
+DUCKLING = 'duckling'
+FLAIR_NER = 'flair_ner'
+
+# number of sentences tagged in one forward pass of the NER model
+DEFAULT_NER_BATCH_SIZE = 32
+
+
+def load_flair_ner() -> SequenceTagger:
+    return SequenceTagger.load('ner')
+
+
+# the JVM of Duckling cannot be used by forked processes
+register_model(DUCKLING, DucklingWrapper, fork_safe=False)
+register_model(FLAIR_NER, load_flair_ner)
+
 
 class ExtractEntitiesStep(AbstractStep):
     """
@@ -30,21 +47,37 @@ class ExtractEntitiesStep(AbstractStep):
                  source_key: str = None,
                  overwrite: bool = False,
                  source_iter: Callable[[List[str]], Iterator[IO[AnyStr]]] = file_iter,
-                 output_handler: Callable[[str, Dict[str, Any]], None] = oh):
+                 output_handler: Callable[[str, Dict[str, Any]], None] = oh,
+                 ner_batch_size: int = DEFAULT_NER_BATCH_SIZE):
+        """
+
+        :param name: human-readable name of processor
+        :param source_key: source key of files to process
+        :param overwrite: overwrite existing output
+        :param source_iter: data source iterable
+        :param output_handler: output handler
+        :param ner_batch_size: number of sentences tagged in one forward pass
+               of the NER model
+        """
         super().__init__(name, source_key, overwrite)
         self.__source_iter = source_iter
         self.__output_handler = output_handler
+        self.__ner_batch_size = ner_batch_size
         root_path = Path(__file__).parent.parent
         entities_path = str(root_path / 'config/entities.csv')
-        self.entity_reverse_lookup, synonyms, self.regexprs = load_entities(entities_path)
+        self.entity_reverse_lookup, synonyms, regexprs = load_entities(entities_path)
+        self.regexprs = compile_regexprs(regexprs)
         self.keyword_processor = prepare_keyword_processor(synonyms)
-        duckling_entities = {ENTITY_DATE, ENTITY_NUMBER}
-        tagger_entities = {ENTITY_PERSON}
-        if len(duckling_entities.intersection(ENABLED_SYSTEM_ENTITIES)) > 0:
-            self.d = DucklingWrapper()
 
-        if len(tagger_entities.intersection(ENABLED_SYSTEM_ENTITIES)) > 0:
-            self.tagger = SequenceTagger.load('ner')
+    @property
+    def d(self) -> DucklingWrapper:
+        # loaded on first use in each process, as it cannot be preloaded
+        return get_model(DUCKLING)
+
+    @property
+    def tagger(self) -> SequenceTagger:
+        # loaded once per process, and shared by steps
+        return get_model(FLAIR_NER)
 
     def process_file(self,
                      file: IO[AnyStr],
@@ -60,7 +93,10 @@ class ExtractEntitiesStep(AbstractStep):
         data = input_doc['data']
         text = data['text']
         nlp_text = []
-        for t in text:
+
+        # all texts of the document are tagged together
+        sentences = self.tag_sentences(text)
+        for t, sentence in zip(text, sentences):
             entities = []
             keywords_found = self.keyword_processor.extract_keywords(t, span_info=True)
             for keyword in keywords_found:
@@ -76,43 +112,11 @@ class ExtractEntitiesStep(AbstractStep):
                 match['entity'] = self.entity_reverse_lookup[match['value']]
 
             entities.extend(matches)
-            entities.extend(self.match_system_entities(t))
-
-            # is the span of an entity contained within the span
-            # of another entity
-            def is_contained(entity):
-                start, end = entity['location']
-                for ent in entities:
-                    s, e = ent['location']
-                    # exclude exact span matches
-                    if (start == s and end < e) or (start > s and end == e) or (start > s and end < e):
-                        return True
-
-                return False
-
-            def is_valid(entity):
-                # remove spurious dates
-                if entity['entity'] == 'sys-date':
-                    start, end = entity['location']
-                    if (end - start) < 8:
-                        return False
-
-                    value = entity['value']
-                    if isinstance(value, str):
-                        try:
-                            date = parse(value)
-                        except ValueError:
-                            return False
-
-                        year = date.year
-                        if year < 1990 or year > 2025:
-                            return False
-
-                return True
+            entities.extend(self.match_system_entities(t, sentence))
 
             # keep the entity with the longest span where an entity
             # is contained within the span of another
-            pruned_entities = [ent for ent in entities if not is_contained(ent) and is_valid(ent)]
+            pruned_entities = [ent for ent in prune_contained_entities(entities) if is_valid_entity(ent)]
             nlp_text.append({
                 'text': t,
                 'entities': pruned_entities
@@ -144,14 +148,36 @@ class ExtractEntitiesStep(AbstractStep):
                 if x['status'] == 'processed':
                     processed_file_paths[x['input']] = x
 
-        for file, path in self.__source_iter(file_paths):
-            if not self._overwrite and path in processed_file_paths.keys():
-                accumulator['files_output'].append(processed_file_paths[path])
-                continue
+        for _ in process_files(self, self.__source_iter, file_paths, control_data, logger, accumulator,
+                               processed_file_paths):
+            pass
+
+    def tag_sentences(self, texts: List[str]) -> List[Sentence]:
+        """
+        Tag the named entities of texts in batches.
 
-            self.process_file(file, path, control_data, logger, accumulator)
+        :param texts: texts
+        :return: tagged sentence of each text, or None for each text if person
+                 entities are not enabled
+        """
+        if ENTITY_PERSON not in ENABLED_SYSTEM_ENTITIES:
+            return [None] * len(texts)
 
-    def match_system_entities(self, utter):
+        sentences = [Sentence(t) for t in texts]
+        if sentences:
+            self.tagger.predict(sentences, mini_batch_size=self.__ner_batch_size)
+
+        return sentences
+
+    def match_system_entities(self, utter: str, sentence: Sentence = None) -> List[Dict[str, Any]]:
+        """
+        Match system entities in text.
+
+        :param utter: text
+        :param sentence: tagged sentence of text from `tag_sentences`, else the
+               text is tagged alone
+        :return: entity matches
+        """
         matches = []
         if ENTITY_DATE in ENABLED_SYSTEM_ENTITIES:
             results = self.d.parse_time(utter)
@@ -173,8 +199,6 @@ class ExtractEntitiesStep(AbstractStep):
                     'confidence': 1.0
                 })
 
-        sentence = None
-
         if ENTITY_PERSON in ENABLED_SYSTEM_ENTITIES:
             if sentence is None:
                 sentence = Sentence(utter)
@@ -217,32 +241,6 @@ def load_entities(file_path: str) -> Tuple[Dict[str, str], Dict[str, list], Dict
     return entity_reverse_lookup, synonyms, regexprs
 
 
-def match_regexprs(utter: str, regexprs: Dict[str, list]) -> List[Dict[str, Any]]:
-    matches = []
-    for entity_value, exprs in regexprs.items():
-        for expr in exprs:
-            for match in re.finditer(expr, utter):
-                groups = [{
-                    'group': 'group_0',
-                    'location': list(match.span())
-                }]
-                for i, g in enumerate(match.groups()):
-                    groups.append({
-                        'group': 'group_{}'.format(i + 1),
-                        'location': list(match.span(i + 1))
-                    })
-
-                entity = {
-                    'location': list(match.span()),
-                    'value': entity_value,
-                    'confidence': 1.0,
-                    'groups': groups
-                }
-                matches.append(entity)
-
-    return matches
-
-
 def prepare_keyword_processor(synonyms: Dict[str, list]) -> KeywordProcessor:
     """
     28x faster than a compiled regexp for 1,000 keywords
@@ -2,7 +2,7 @@ from datetime import datetime
 import json
 from logging import Logger
 import os
-from pipeline import AbstractStep, file_iter, json_output_handler as oh
+from pipeline import AbstractStep, file_iter, json_output_handler as oh, process_files
 from typing import Any, AnyStr, Callable, Dict, IO, Iterator, List
 from utils import convert_name_to_underscore
 
@@ -74,9 +74,6 @@ class ExtractQuestionsStep(AbstractStep):
                 if x['status'] == 'processed':
                     processed_file_paths[x['input']] = x
 
-        for file, path in self.__source_iter(file_paths):
-            if not self._overwrite and path in processed_file_paths.keys():
-                accumulator['files_output'].append(processed_file_paths[path])
-                continue
-
-            self.process_file(file, path, control_data, logger, accumulator)
+        for _ in process_files(self, self.__source_iter, file_paths, control_data, logger, accumulator,
+                               processed_file_paths):
+            pass
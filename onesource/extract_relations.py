@@ -1,20 +1,81 @@
 from relation_extraction.core.parser import RelParser
 from relation_extraction.core import entity_extraction
 from relation_extraction.core import keras_models
+import codecs
+from corenlp_client import CoreNLPClient
 from datetime import datetime
+from glove_store import is_glove_store, load_glove_store
 import json
 from logging import Logger
+from model_registry import get_model, register_model
+import numpy as np
 import os
 from pathlib import Path
-from pipeline import AbstractStep, file_iter, json_output_handler as oh
-from pycorenlp import StanfordCoreNLP
-from typing import Any, AnyStr, Callable, Dict, Iterator, IO, List, Tuple
+from pipeline import AbstractStep, file_iter, json_output_handler as oh, process_files
+from typing import Any, AnyStr, Callable, Dict, Iterator, IO, List
 from utils import convert_name_to_underscore
 
 ROOT_DIR = Path(__file__).parent.parent
 GLOVE_PATH = ROOT_DIR / 'resources' / 'glove' / 'glove.6B.50d.txt'
+
+# converted from GLOVE_PATH by `python glove_store.py`
+GLOVE_STORE_PATH = ROOT_DIR / 'resources' / 'glove' / 'glove.6B.50d'
 MODELS_PATH = ROOT_DIR / 'models' / 'relation_extraction'
 
+RELATION_PARSER = 'relation_parser'
+RELATION_MODEL_NAME = 'model_ContextWeighted'
+
+# number of sentence graphs classified in one prediction
+DEFAULT_BATCH_SIZE = 64
+
+
+class GloveStoreRelParser(RelParser):
+    """
+    Relation parser with the vocabulary of a GloVe store, memory mapped instead
+    of parsed from the text file into a dict in each process.
+    """
+
+    def __init__(self, relext_model_name: str, models_folder: str, store_dir: str):
+        """
+
+        :param relext_model_name: name of model type and model file
+        :param models_folder: path of dir of model files, ending with a separator
+        :param store_dir: path of dir of GloVe store
+        """
+        # as `RelParser.__init__`, except for loading embeddings. The embedding
+        # weights are loaded from the model file, so the model is created with
+        # zeros, and the memory mapped vectors are not read. Each process still
+        # holds the embedding weights of its model.
+        model_params = keras_models.model_params
+        self._embeddings, self._word2idx = load_glove_store(store_dir)
+        self._model = getattr(keras_models, relext_model_name)(model_params,
+                                                               np.zeros(self._embeddings.shape, dtype='float32'),
+                                                               model_params['max_sent_len'],
+                                                               len(keras_models.property2idx))
+        self._model.load_weights(models_folder + relext_model_name + '.kerasmodel')
+        labels_path = os.path.join(os.path.dirname(keras_models.__file__), '../../resources/properties-with-labels.txt')
+        with codecs.open(labels_path, encoding='utf-8') as f:
+            self._property2label = {l.split('\t')[0]: l.split('\t')[1].strip() for l in f.readlines()}
+
+        self._graphs_to_indices = keras_models.to_indices
+        if 'Context' in relext_model_name:
+            self._graphs_to_indices = keras_models.to_indices_with_extracted_entities
+        elif 'CNN' in relext_model_name:
+            self._graphs_to_indices = keras_models.to_indices_with_relative_positions
+
+
+def load_relation_parser() -> RelParser:
+    models_folder = str(MODELS_PATH) + os.sep
+    if is_glove_store(str(GLOVE_STORE_PATH)):
+        return GloveStoreRelParser(RELATION_MODEL_NAME, models_folder, str(GLOVE_STORE_PATH))
+
+    keras_models.model_params['wordembeddings'] = str(GLOVE_PATH)
+    return RelParser(RELATION_MODEL_NAME, models_folder=models_folder)
+
+
+# the TensorFlow session of the Keras model cannot be used by forked processes
+register_model(RELATION_PARSER, load_relation_parser, fork_safe=False)
+
 
 class ExtractRelationsStep(AbstractStep):
     """
@@ -26,20 +87,47 @@ class ExtractRelationsStep(AbstractStep):
                  source_key: str = None,
                  overwrite: bool = False,
                  source_iter: Callable[[List[str]], Iterator[IO[AnyStr]]] = file_iter,
-                 output_handler: Callable[[str, Dict[str, Any]], None] = oh):
+                 output_handler: Callable[[str, Dict[str, Any]], None] = oh,
+                 annotator: CoreNLPClient = None,
+                 corenlp_endpoint: str = None,
+                 batch_size: int = DEFAULT_BATCH_SIZE):
+        """
+
+        :param name: human-readable name of processor
+        :param source_key: source key of files to process
+        :param overwrite: overwrite existing output
+        :param source_iter: data source iterable
+        :param output_handler: output handler
+        :param annotator: tags text, defaults to a client of the CoreNLP server
+               created in each process
+        :param corenlp_endpoint: URL of CoreNLP server
+        :param batch_size: number of sentence graphs classified in one prediction
+        """
         super().__init__(name, source_key, overwrite)
         self.__source_iter = source_iter
         self.__output_handler = output_handler
-        self.__corenlp = StanfordCoreNLP('http://localhost:9000')
-        self.__corenlp_properties = {
-            'annotators': 'tokenize, pos, ner',
-            'outputFormat': 'json'
-        }
+        self.__annotator = annotator
+        self.__corenlp_endpoint = corenlp_endpoint
+        self.__batch_size = batch_size
+        self.__corenlp_client = None
+        self.__corenlp_client_pid = None
+
+    @property
+    def annotator(self) -> CoreNLPClient:
+        if self.__annotator:
+            return self.__annotator
+
+        # connections cannot be shared with forked worker processes
+        if not self.__corenlp_client or self.__corenlp_client_pid != os.getpid():
+            self.__corenlp_client = CoreNLPClient(self.__corenlp_endpoint)
+            self.__corenlp_client_pid = os.getpid()
+
+        return self.__corenlp_client
 
-    def get_tagged_from_server(self, input_text: str) -> List[Tuple]:
-        output = self.__corenlp.annotate(input_text, properties=self.__corenlp_properties).get('sentences', [])[0]
-        tagged = [(t['originalText'], t['ner'], t['pos']) for t in output['tokens']]
-        return tagged
+    @property
+    def rel_parser(self) -> RelParser:
+        # loaded on first use in each process, as it cannot be preloaded
+        return get_model(RELATION_PARSER)
 
     def process_file(self,
                      file: IO[AnyStr],
@@ -54,31 +142,36 @@ class ExtractRelationsStep(AbstractStep):
         record_id = metadata['record_id']
         text = input_doc['data']['text']
         graphs = []
-        for t in text:
-            tagged = self.get_tagged_from_server(t)
+
+        # relations are extracted from the first sentence of each text
+        for sentences in self.annotator.tag(text):
+            if not sentences:
+                continue
+
+            tagged = sentences[0]
             entity_fragments = entity_extraction.extract_entities(tagged)
             edges = entity_extraction.generate_edges(entity_fragments)
-            tokens = [t for t, _, _ in tagged]
-            non_parsed_graph = {'tokens': tokens, 'edgeSet': edges}
-            keras_models.model_params['wordembeddings'] = str(GLOVE_PATH)
-            rel_parser = RelParser('model_ContextWeighted', models_foldes=str(MODELS_PATH))
-            parsed_graph = rel_parser.classify_graph_relations(non_parsed_graph)
-            # e.g.:
-            # {'tokens': ['Germany', 'is', 'a', 'country', 'in', 'Europe'], 'edgeSet': [{'left': [0],
-            # 'right': [5], 'kbID': 'P30', 'lexicalInput': 'continent'}, {'left': [0], 'right': [3],
-            # 'kbID': 'P0', 'lexicalInput': 'ALL_ZERO'}, {'left': [5], 'right': [3], 'kbID': 'P31',
-            # 'lexicalInput': 'instance of'}]}
+            if edges:
+                graphs.append({'tokens': [t for t, _, _ in tagged], 'edgeSet': edges})
 
+        # edges of the input graphs are labelled in place, e.g.:
+        # {'tokens': ['Germany', 'is', 'a', 'country', 'in', 'Europe'], 'edgeSet': [{'left': [0],
+        # 'right': [5], 'kbID': 'P30', 'lexicalInput': 'continent'}, {'left': [0], 'right': [3],
+        # 'kbID': 'P0', 'lexicalInput': 'ALL_ZERO'}, {'left': [5], 'right': [3], 'kbID': 'P31',
+        # 'lexicalInput': 'instance of'}]}
+        for i in range(0, len(graphs), self.__batch_size):
+            self.rel_parser.classify_graph_relations(graphs[i:i + self.__batch_size])
+
+        for graph in graphs:
+            tokens = graph['tokens']
             relations = []
-            if parsed_graph:
-                graphs.append(parsed_graph)
-                for edge in parsed_graph['edgeSet']:
-                    if edge['kbID'] != 'P0':
-                        left = ' '.join([tokens[t] for t in edge['left']])
-                        right = ' '.join([tokens[t] for t in edge['right']])
-                        relations.append([left, edge['lexicalInput'], right])
+            for edge in graph['edgeSet']:
+                if edge.get('kbID', 'P0') != 'P0':
+                    left = ' '.join([tokens[t] for t in edge['left']])
+                    right = ' '.join([tokens[t] for t in edge['right']])
+                    relations.append([left, edge['lexicalInput'], right])
 
-                parsed_graph['relations'] = relations
+            graph['relations'] = relations
 
         now = datetime.utcnow().isoformat()
         write_root_dir = control_data['job']['write_root_dir']
@@ -104,9 +197,6 @@ class ExtractRelationsStep(AbstractStep):
                 if x['status'] == 'processed':
                     processed_file_paths[x['input']] = x
 
-        for file, path in self.__source_iter(file_paths):
-            if not self._overwrite and path in processed_file_paths.keys():
-                accumulator['files_output'].append(processed_file_paths[path])
-                continue
-
-            self.process_file(file, path, control_data, logger, accumulator)
+        for _ in process_files(self, self.__source_iter, file_paths, control_data, logger, accumulator,
+                               processed_file_paths):
+            pass
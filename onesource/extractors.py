@@ -1,9 +1,13 @@
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
+from lxml import etree
 import re
 from tableschema import config, Schema, types
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterable, List, Tuple
 from utils import clean_text, remove_bullet_markers, strip_link_markers
 
+# increment when the output of the extractors changes, to invalidate cached output
+EXTRACTORS_VERSION = 3
+
 BULLET_MARKERS = [u'•', '*', 'o']
 
 LINK_OPEN_MARKER = '[['
@@ -47,108 +51,517 @@ class AbstractExtractor(object):
         raise NotImplementedError
 
 
-class HeadingExtractor(AbstractExtractor):
+# kinds of HTML element, looked up once per event
+(OTHER_ELEMENT, ANCHOR_ELEMENT, BREAK_ELEMENT, IMAGE_ELEMENT, PARA_ELEMENT, DIV_ELEMENT, HEADING_ELEMENT,
+ STRONG_ELEMENT, LIST_ELEMENT, LIST_ITEM_ELEMENT, TABLE_ELEMENT, TABLE_HEAD_ELEMENT, TABLE_BODY_ELEMENT,
+ TABLE_ROW_ELEMENT, TABLE_HEAD_CELL_ELEMENT, TABLE_CELL_ELEMENT) = range(16)
+
+ELEMENT_KINDS = {
+    'a': ANCHOR_ELEMENT,
+    'br': BREAK_ELEMENT,
+    'img': IMAGE_ELEMENT,
+    'p': PARA_ELEMENT,
+    'div': DIV_ELEMENT,
+    'title': HEADING_ELEMENT,
+    'h1': HEADING_ELEMENT,
+    'h2': HEADING_ELEMENT,
+    'h3': HEADING_ELEMENT,
+    'h4': HEADING_ELEMENT,
+    'strong': STRONG_ELEMENT,
+    'ul': LIST_ELEMENT,
+    'ol': LIST_ELEMENT,
+    'li': LIST_ITEM_ELEMENT,
+    'table': TABLE_ELEMENT,
+    'thead': TABLE_HEAD_ELEMENT,
+    'tbody': TABLE_BODY_ELEMENT,
+    'tr': TABLE_ROW_ELEMENT,
+    'th': TABLE_HEAD_CELL_ELEMENT,
+    'td': TABLE_CELL_ELEMENT
+}
+
+# element kinds that end a run of text within a list
+LIST_BLOCK_ELEMENTS = (PARA_ELEMENT, DIV_ELEMENT, HEADING_ELEMENT)
+
+# element kinds that may introduce a list
+LIST_HEADING_ELEMENTS = (HEADING_ELEMENT, DIV_ELEMENT, STRONG_ELEMENT)
+
+# number of texts processed by Spacy at a time when extracting a whole document
+DEFAULT_NLP_BATCH_SIZE = 64
+
+# number of texts whose token features are kept for the heading checks
+DEFAULT_TOKEN_CACHE_SIZE = 10000
+
+# types of content extracted, in the order extracted from each element
+LIST_CONTENT, TABLE_CONTENT, TEXT_CONTENT, HEADING_CONTENT = range(4)
+
+DEFAULT_EXCLUDED_TAGS = {
+    LIST_CONTENT: ['table'],
+    TABLE_CONTENT: [],
+    TEXT_CONTENT: ['ul', 'ol', 'table', 'title', 'h1', 'h2', 'h3', 'h4'],
+    HEADING_CONTENT: ['ul', 'ol', 'table']
+}
+
+
+class TextBuffer(object):
     """
-    Extracts headings from HTML (H1 - H4) as structured content and plain text.
+    Text accumulated for a type of content, including any link being read.
     """
 
-    def __init__(self, excluded_tags: List[str] = None):
+    def __init__(self):
+        self.text = ''
+        self.is_anchor = False
+        self.anchor_text = ''
+        self.anchor_url = None
+
+    def append(self, text: str) -> None:
+        self.text += text
+        if self.is_anchor:
+            self.anchor_text += text
+
+    def flush(self) -> str:
+        text = self.text
+        self.text = ''
+        return text
+
+    def extract_anchor(self, el, ev, structured_content: List[Dict[str, Any]]) -> None:
         """
+        Mark the text of a link, and extract the link as structured content.
 
-        :param excluded_tags: do not extract headings within these tags
+        :param el: anchor element
+        :param ev: the type of event ['start', 'end']
+        :param structured_content: a list to append structured content
+        :return: None
+        """
+        if ev == 'start':
+            anchor_url = el.get('href')
+            if anchor_url:
+                self.is_anchor = True
+                self.text += LINK_OPEN_MARKER
+                self.anchor_url = anchor_url
+
+        elif ev == 'end' and self.is_anchor:
+            self.is_anchor = False
+            if self.anchor_text.strip():
+                self.text += LINK_CLOSE_MARKER
+                if self.anchor_url and self.anchor_text:
+                    structured_content.append({
+                        'type': 'link',
+                        'url': self.anchor_url,
+                        'text': self.anchor_text
+                    })
+            else:
+                n = self.text.rfind(LINK_OPEN_MARKER)
+                self.text = self.text[:n] + ' '
+
+            self.anchor_url = None
+            self.anchor_text = ''
+
+
+class HtmlExtractor(AbstractExtractor):
+    """
+    Extracts lists, tables, block text and headings from HTML in a single pass
+    as structured content and plain text.
+
+    The tag of each element is looked up once in a dispatch table, which gives
+    the kind of element and the types of content excluded within it. Each type
+    of content is then extracted in turn from the element, so the output is the
+    same as from running the list, table, text and heading extractors in that
+    order.
+    """
+
+    def __init__(self,
+                 content_types: List[int] = None,
+                 excluded_tags_by_type: Dict[int, List[str]] = None):
+        """
+
+        :param content_types: types of content to extract, defaults to all
+        :param excluded_tags_by_type: do not extract a type of content within these
+               tags, by content type, defaults to `DEFAULT_EXCLUDED_TAGS`
         """
-        self.__current_text = ''
-        self.__excluded_stack_count = 0
-        self.__excluded_tags = ['ul', 'ol', 'table'] if excluded_tags is None else excluded_tags
+        if content_types is None:
+            content_types = [LIST_CONTENT, TABLE_CONTENT, TEXT_CONTENT, HEADING_CONTENT]
+
+        excluded_tags = dict(DEFAULT_EXCLUDED_TAGS)
+        excluded_tags.update(excluded_tags_by_type or {})
+        extract_fns = {
+            LIST_CONTENT: self.__extract_list,
+            TABLE_CONTENT: self.__extract_table,
+            TEXT_CONTENT: self.__extract_text,
+            HEADING_CONTENT: self.__extract_heading
+        }
+        self.__extract_fns = [(t, extract_fns[t]) for t in sorted(content_types)]
+
+        # kind of element and content types excluded within it by tag
+        dispatch = {tag: (kind, ()) for tag, kind in ELEMENT_KINDS.items()}
+        for t in sorted(content_types):
+            for tag in excluded_tags[t]:
+                kind, excluded = dispatch.get(tag, (OTHER_ELEMENT, ()))
+                if t not in excluded:
+                    dispatch[tag] = (kind, excluded + (t,))
+
+        self.__dispatch = dispatch
+        self.__content_types = content_types
+        self.__excluded_text_tags = excluded_tags[TEXT_CONTENT]
+
+        # count of open elements excluding each content type
+        self.__excluded_stack_counts = [0] * len(extract_fns)
+
+        # list state
+        self.__list_buffer = TextBuffer()
+        self.__list_heading_text = ''
+        self.__is_list_heading = False
+        self.__is_list_items = False
+        self.__is_list = False
+        self.__list_content = {'type': 'list', 'subtype': 'unordered', 'items': []}
+        self.__list_level = 0
+
+        # table state
+        self.__table_buffer = TextBuffer()
+        self.__current_table_row = []
+        self.__is_table = False
+        self.__is_table_head = False
+        self.__is_table_body = False
+        self.__table_content = None
+        self.__table_stack = []
+        self.__table_index = 1
+        self.schema = Schema()
+
+        # text state
+        self.__text_buffer = TextBuffer()
+
+        # heading state
+        self.__heading_buffer = TextBuffer()
         self.__is_heading = False
-        self.__is_anchor = False
-        self.__anchor_text = ''
-        self.__anchor_url = None
 
     def extract(self, el, ev, structured_content: List[Dict[str, Any]], text_list: List[str], nlp=None):
-        if el.tag in self.__excluded_tags:
+        kind, excluded = self.__dispatch.get(el.tag, (OTHER_ELEMENT, ()))
+        counts = self.__excluded_stack_counts
+        if excluded:
             if ev == 'start':
-                self.__excluded_stack_count += 1
+                for t in excluded:
+                    counts[t] += 1
 
             elif ev == 'end':
-                self.__excluded_stack_count -= 1
+                for t in excluded:
+                    counts[t] -= 1
+
+        for t, extract_fn in self.__extract_fns:
+            if t in excluded:
+                if t == TEXT_CONTENT:
+                    self.__exclude_text(ev, el, structured_content, text_list, nlp)
+
+            elif not counts[t]:
+                extract_fn(kind, el, ev, structured_content, text_list, nlp)
+
+    def extract_events(self,
+                       events: Iterable[Tuple[str, Any]],
+                       structured_content: List[Dict[str, Any]],
+                       text_list: List[str],
+                       nlp=None,
+                       batch_size: int = DEFAULT_NLP_BATCH_SIZE,
+                       n_process: int = 1):
+        """
+        Extract content from all the events of a document.
+
+        The blocks of text in the document are first collected and run through
+        `nlp.pipe` in batches, as are the runs of text within them that are
+        checked for headings. The docs are then reused when extracting, so no
+        text is processed by Spacy more than once.
+
+        :param events: event and element pairs, as from `etree.iterparse`
+        :param structured_content: a list to append structured content
+        :param text_list: a list to append plain text
+        :param nlp: Spacy model
+        :param batch_size: number of texts to process at a time, or 0 to
+               process each block of text when reached
+        :param n_process: number of processes used by `nlp.pipe` (Spacy >= 2.2.2),
+               which cannot be started from a worker process of the pipeline
+        :return: None
+        """
+        events = list(events)
+        if nlp is not None and batch_size and TEXT_CONTENT in self.__content_types:
+            nlp = self.__preprocess_text(events, nlp, batch_size, n_process)
+
+        for ev, el in events:
+            self.extract(el, ev, structured_content, text_list, nlp)
+
+    def __preprocess_text(self, events: List[Tuple[str, Any]], nlp, batch_size: int, n_process: int):
+        # the blocks of text do not depend on the other types of content, or
+        # on the output of processing earlier blocks
+        collector = TextBlockCollector(self.__excluded_text_tags)
+        for ev, el in events:
+            collector.extract(el, ev, [], [])
+
+        pipe_kwargs = {'batch_size': batch_size}
+        if n_process and n_process > 1:
+            pipe_kwargs['n_process'] = n_process
+
+        docs = {}
+        texts = list(OrderedDict.fromkeys(collector.text_blocks))
+        for text, doc in zip(texts, nlp.pipe(texts, **pipe_kwargs)):
+            docs[text] = doc
+
+        # runs of text that may be checked for headings or continuation
+        fragments = OrderedDict()
+        for doc in docs.values():
+            for obj in split_text_items(doc):
+                if obj['type'] == 'text':
+                    txt = clean_text(get_tokens_text(obj['tokens']))
+                    if txt not in docs and txt not in token_feature_cache:
+                        fragments[txt] = None
+
+        texts = list(fragments)
+        for text, doc in zip(texts, nlp.pipe(texts, **pipe_kwargs)):
+            docs[text] = doc
+
+        return PreprocessedNlp(nlp, docs)
+
+    def __extract_list(self, kind, el, ev, structured_content: List[Dict[str, Any]], text_list: List[str], nlp):
+        buffer = self.__list_buffer
+        if kind == LIST_ELEMENT:
+            if ev == 'start':
+                self.__is_list = True
+                self.__list_level += 1
 
-        elif not self.__is_excluded():
-            if el.tag in ['title', 'h1', 'h2', 'h3', 'h4']:
+            elif ev == 'end':
+                # flatten nested lists
+                self.__list_level -= 1
+                if self.__list_level == 0:
+                    self.__flush_list_text(buffer, structured_content, text_list)
+                    if self.__list_heading_text:
+                        self.__list_content['heading'] = clean_text(self.__list_heading_text)
+
+                    if self.__list_heading_text or self.__list_content['items']:
+                        structured_content.append(self.__list_content)
+
+                    self.__list_content = {'type': 'list', 'subtype': 'unordered', 'items': []}
+                    self.__is_list_items = False
+                    self.__is_list_heading = False
+                    self.__is_list = False
+                    self.__list_heading_text = ''
+                    buffer.text = ''
+
+        elif self.__is_list:
+            if kind in LIST_HEADING_ELEMENTS and ev == 'start' and not self.__is_list_items:
+                self.__is_list_heading = True
+
+            if kind == LIST_ITEM_ELEMENT:
                 if ev == 'start':
-                    self.__is_heading = True
+                    self.__flush_list_text(buffer, structured_content, text_list)
+                    buffer.text = ''
+                    self.__is_list_heading = False
+                    self.__is_list_items = True
                     if el.text:
-                        self.__current_text += el.text
+                        buffer.text += el.text
 
                 elif ev == 'end':
-                    self.__is_heading = False
-                    if self.__current_text:
-                        c = clean_text(self.__current_text)
-                        self.__current_text = ''
-                        if c:
-                            text_list.append(strip_link_markers(c))
-                            structured_content.append({'type': 'heading', 'text': c})
-
-            elif self.__is_heading:
-                if el.tag == 'a':
-                    if ev == 'start':
-                        anchor_url = el.get('href')
-                        if anchor_url:
-                            self.__is_anchor = True
-                            self.__current_text += LINK_OPEN_MARKER
-                            self.__anchor_url = el.get('href')
-
-                    elif ev == 'end' and self.__is_anchor:
-                        self.__is_anchor = False
-                        if self.__anchor_text.strip():
-                            self.__current_text += LINK_CLOSE_MARKER
-                            if self.__anchor_url and self.__anchor_text:
-                                structured_content.append({
-                                    'type': 'link',
-                                    'url': self.__anchor_url,
-                                    'text': self.__anchor_text
-                                })
-                        else:
-                            n = self.__current_text.rfind(LINK_OPEN_MARKER)
-                            self.__current_text = self.__current_text[:n] + ' '
-
-                        self.__anchor_url = None
-                        self.__anchor_text = ''
+                    c = clean_text(buffer.flush())
+                    if c:
+                        text_list.append(strip_link_markers(c))
+                        self.__list_content['items'].append(c)
+
+                    if el.tail:
+                        buffer.text += el.tail
+
+            elif kind == BREAK_ELEMENT and ev == 'end':
+                self.__flush_list_text(buffer, structured_content, text_list, ' ')
+                buffer.text = ''
+                if el.tail:
+                    buffer.text += el.tail
+
+            elif kind in LIST_BLOCK_ELEMENTS:
+                self.__flush_list_text(buffer, structured_content, text_list, ' ')
+                buffer.text = ''
+                if ev == 'start':
+                    if el.text:
+                        buffer.text += el.text
+
+                elif ev == 'end':
+                    if el.tail:
+                        buffer.text += el.tail
+
+            else:
+                if kind == ANCHOR_ELEMENT:
+                    buffer.extract_anchor(el, ev, structured_content)
 
                 if ev == 'start' and el.text:
-                    self.__current_text += el.text
-                    if self.__is_anchor:
-                        self.__anchor_text += el.text
+                    buffer.append(el.text)
 
-                if ev == 'end' and el.tail:
-                    self.__current_text += el.tail
-                    if self.__is_anchor:
-                        self.__anchor_text += el.tail
+                elif ev == 'end' and el.tail:
+                    buffer.append(el.tail)
+
+    def __flush_list_text(self,
+                          buffer: TextBuffer,
+                          structured_content: List[Dict[str, Any]],
+                          text_list: List[str],
+                          separator: str = ''
+                          ) -> None:
+        # text within a list that is not a list item is either the heading
+        # of the list, if before the first item, or separate text
+        if buffer.text:
+            c = clean_text(buffer.text)
+            if c:
+                text_list.append(strip_link_markers(c))
+                if self.__is_list_heading:
+                    self.__list_heading_text += buffer.text + separator
+                else:
+                    structured_content.append({'type': 'text', 'text': c})
 
-    def __is_excluded(self):
-        return self.__excluded_stack_count > 0
+    def __extract_table(self, kind, el, ev, structured_content: List[Dict[str, Any]], text_list: List[str], nlp):
+        buffer = self.__table_buffer
+        if kind == TABLE_ELEMENT:
+            if ev == 'start':
+                if self.__is_table:
+                    ref = 'table:{}'.format(self.__table_index)
+                    buffer.text += f'{{{ref}}} '
+                    self.__table_content.setdefault('references', []).append(ref)
+                    self.__table_stack.append((
+                        self.__current_table_row,
+                        buffer.text,
+                        self.__is_table_head,
+                        self.__is_table_body,
+                        self.__table_content
+                    ))
+                self.__current_table_row = []
+                buffer.text = ''
+                self.__is_table = True
+                self.__is_table_head = False
+                self.__is_table_body = False
+                self.__table_content = {'type': 'table', 'index': self.__table_index, 'head': [], 'body': []}
+                self.__table_index += 1
 
+            elif ev == 'end':
+                table = self.__table_content
+                if table['body']:
+                    if table['head']:
+                        headers = table['head']
+                        fields = self.schema.infer(table['body'], headers=headers)['fields']
+                    else:
+                        head = table['body'][0]
+                        headers = ['name%d' % (i + 1) for i in range(len(head))]
+                        fields = self.schema.infer(table['body'], headers=headers)['fields']
+                        if len(table['body']) > 1:
+                            dtypes = [field['type'] for field in fields]
+                            if any([typ != guess_type(val) for typ, val in zip(dtypes, head)]):
+                                table['head'] = [head]
+                                table['body'] = table['body'][1:]
+                                for field, name in zip(fields, head):
+                                    field['name'] = name
 
-class TextExtractor(AbstractExtractor):
-    """
-    Extracts block text from HTML (p, div) as structured content and plain text.
-    """
+                    table['fields'] = fields
 
-    def __init__(self, excluded_tags: List[str] = None):
-        """
+                structured_content.append(table)
+                if len(self.__table_stack):
+                    (self.__current_table_row, buffer.text,
+                        self.__is_table_head, self.__is_table_body,
+                        self.__table_content) = self.__table_stack.pop()
+                else:
+                    self.__is_table_body = False
+                    self.__is_table_head = False
+                    self.__is_table = False
+                    buffer.text = ''
+                    self.__current_table_row = []
+                    self.__table_content = None
+                    self.__table_index = 1
+
+        elif self.__is_table:
+            # noinspection SpellCheckingInspection
+            if kind == TABLE_HEAD_ELEMENT and ev == 'start':
+                self.__is_table_head = True
+                self.__is_table_body = False
+
+            elif kind == TABLE_BODY_ELEMENT and ev == 'start':
+                self.__is_table_head = False
+                self.__is_table_body = True
+
+            elif kind == TABLE_ROW_ELEMENT and ev == 'end':
+                if any(v for _, v in self.__current_table_row):
+                    values = [v for _, v in self.__current_table_row]
+                    text_list.append(strip_link_markers(r'\t'.join(values)))
+                    is_header_row = all(k == 'th' for k, _ in self.__current_table_row)
+                    if not self.__is_table_head and (self.__is_table_body or not is_header_row):
+                        self.__table_content['body'].append(values)
+                        self.__is_table_head = False
+                        self.__is_table_body = True
+
+                    else:
+                        self.__table_content['head'].append(values)
+
+                buffer.text = ''
+                self.__current_table_row = []
+
+            elif kind == TABLE_HEAD_CELL_ELEMENT:
+                if ev == 'end':
+                    self.__current_table_row.append(('th', clean_text(buffer.text)))
+
+                buffer.text = ''
+
+            elif kind == TABLE_CELL_ELEMENT:
+                if ev == 'end':
+                    self.__current_table_row.append(('td', clean_text(buffer.text)))
+
+                buffer.text = ''
+
+            elif kind == ANCHOR_ELEMENT:
+                buffer.extract_anchor(el, ev, structured_content)
+
+            if ev == 'start' and el.text:
+                buffer.append(el.text)
+
+            elif ev == 'end' and el.tail:
+                buffer.append(el.tail)
+
+    def __exclude_text(self, ev, el, structured_content: List[Dict[str, Any]], text_list: List[str], nlp):
+        buffer = self.__text_buffer
+        if ev == 'start':
+            if buffer.text:
+                self._process_text(buffer.flush(), structured_content, text_list, nlp)
+
+        elif ev == 'end':
+            buffer.text = ''
+            if el.tail:
+                buffer.text += el.tail
+
+    def __extract_text(self, kind, el, ev, structured_content: List[Dict[str, Any]], text_list: List[str], nlp):
+        buffer = self.__text_buffer
+        if kind == BREAK_ELEMENT and ev == 'end':
+            if buffer.text:
+                self._process_text(buffer.flush(), structured_content, text_list, nlp)
+
+            if el.tail:
+                buffer.text += el.tail
+
+        elif kind == PARA_ELEMENT or kind == DIV_ELEMENT:
+            if buffer.text:
+                self._process_text(buffer.flush(), structured_content, text_list, nlp)
+
+            if ev == 'start':
+                if el.text:
+                    buffer.text += el.text
+
+            elif ev == 'end':
+                if el.tail:
+                    buffer.text += el.tail
 
-        :param excluded_tags: do not extract text within these tags
-        """
-        self.__current_text = ''
-        self.__excluded_stack_count = 0
-        if excluded_tags is None:
-            self.__excluded_tags = ['ul', 'ol', 'table', 'title', 'h1', 'h2', 'h3', 'h4']
         else:
-            self.__excluded_tags = excluded_tags
+            if kind == ANCHOR_ELEMENT:
+                buffer.extract_anchor(el, ev, structured_content)
+
+            elif kind == IMAGE_ELEMENT and ev == 'start':
+                url = el.get('src')
+                title = el.get('title') or el.get('alt') or url
+                structured_content.append({
+                    'type': 'image',
+                    'url': url,
+                    'title': title
+                })
+                buffer.append(f'{{image:{url}}}')
+
+            if ev == 'start' and el.text:
+                buffer.append(el.text)
 
-        self.__is_anchor = False
-        self.__anchor_text = ''
-        self.__anchor_url = None
+            elif ev == 'end' and el.tail:
+                buffer.append(el.tail)
 
     def _process_text(self, text: str, structured_content: List[Dict[str, Any]], text_list: List[str], nlp=None):
         # ignore blank text
@@ -157,44 +570,7 @@ class TextExtractor(AbstractExtractor):
 
         # split into sentences
         doc = nlp(text)
-        obj_list = []
-        list_levels = defaultdict(list)
-        i = 0
-        for sent in doc.sents:
-            # ignore blank sentences
-            if len(sent.text.strip()) == 0:
-                continue
-
-            # split by bullet marker or list number if present
-            list_item_text = []
-            cur_text = []
-            n = len(sent)
-            is_list = False
-            for j, token in enumerate(sent):
-                next_token = sent[j + 1] if (j + 2) < n else None
-                if j == 0:
-                    if is_bullet(token):
-                        list_item_text = []
-                        obj = {'type': 'unordered_list_item', 'tokens': list_item_text}
-                        obj_list.append(obj)
-                        list_levels[token.shape_].append(obj)
-                        is_list = True
-                    elif is_ordered_list_item(token, next_token):
-                        list_item_text = []
-                        obj = {'type': 'ordered_list_item', 'tokens': list_item_text}
-                        obj_list.append(obj)
-                        list_levels[token.shape_].append(obj)
-                        is_list = True
-
-                if is_list:
-                    list_item_text.append(token)
-                else:
-                    cur_text.append(token)
-
-            if len(cur_text) > 0:
-                obj_list.append({'type': 'text', 'tokens': cur_text})
-
-            i += 1
+        obj_list = split_text_items(doc)
 
         def is_list_item(it):
             return it['type'] in ['unordered_list_item', 'ordered_list_item']
@@ -217,12 +593,9 @@ class TextExtractor(AbstractExtractor):
         def is_text_item(it):
             return it['type'] == 'text'
 
-        def get_text(tks):
-            return ''.join([t.text_with_ws for t in tks]).rstrip()
-
         for i, obj in enumerate(obj_list):
             tokens = obj['tokens']
-            txt = clean_text(get_text(tokens))
+            txt = clean_text(get_tokens_text(tokens))
             out = remove_bullet_markers(txt)
             if is_text_item(obj):
                 if has_length(text_list) and continues(text_list[-1], txt, nlp):
@@ -272,454 +645,324 @@ class TextExtractor(AbstractExtractor):
             else:
                 raise NotImplementedError
 
-    def extract(self, el, ev, structured_content: List[Dict[str, Any]], text_list: List[str], nlp=None):
-        if el.tag in self.__excluded_tags:
+    def __extract_heading(self, kind, el, ev, structured_content: List[Dict[str, Any]], text_list: List[str], nlp):
+        buffer = self.__heading_buffer
+        if kind == HEADING_ELEMENT:
             if ev == 'start':
-                self.__excluded_stack_count += 1
-                if self.__current_text:
-                    c = self.__current_text
-                    self.__current_text = ''
-                    if c:
-                        self._process_text(c, structured_content, text_list, nlp)
+                self.__is_heading = True
+                if el.text:
+                    buffer.text += el.text
 
             elif ev == 'end':
-                self.__excluded_stack_count -= 1
-                self.__current_text = ''
-                if el.tail:
-                    self.__current_text += el.tail
-
-        elif not self.__is_excluded():
-            if el.tag == 'br' and ev == 'end':
-                if self.__current_text:
-                    c = self.__current_text
-                    self.__current_text = ''
+                self.__is_heading = False
+                if buffer.text:
+                    c = clean_text(buffer.flush())
                     if c:
-                        self._process_text(c, structured_content, text_list, nlp)
+                        text_list.append(strip_link_markers(c))
+                        structured_content.append({'type': 'heading', 'text': c})
 
-                if el.tail:
-                    self.__current_text += el.tail
+        elif self.__is_heading:
+            if kind == ANCHOR_ELEMENT:
+                buffer.extract_anchor(el, ev, structured_content)
 
-            elif el.tag in ['p', 'div']:
-                if ev == 'start':
-                    if self.__current_text:
-                        c = self.__current_text
-                        self.__current_text = ''
-                        if c:
-                            self._process_text(c, structured_content, text_list, nlp)
+            if ev == 'start' and el.text:
+                buffer.append(el.text)
 
-                    if el.text:
-                        self.__current_text += el.text
+            if ev == 'end' and el.tail:
+                buffer.append(el.tail)
 
-                elif ev == 'end':
-                    if self.__current_text:
-                        c = self.__current_text
-                        self.__current_text = ''
-                        if c:
-                            self._process_text(c, structured_content, text_list, nlp)
 
-                    if el.tail:
-                        self.__current_text += el.tail
+class TextBlockCollector(HtmlExtractor):
+    """
+    Collects the blocks of text in HTML that would be processed by Spacy,
+    without processing them.
+    """
 
-            else:
-                if el.tag == 'a':
-                    if ev == 'start':
-                        anchor_url = el.get('href')
-                        if anchor_url:
-                            self.__is_anchor = True
-                            self.__current_text += LINK_OPEN_MARKER
-                            self.__anchor_url = anchor_url
-
-                    elif ev == 'end' and self.__is_anchor:
-                        self.__is_anchor = False
-                        if self.__anchor_text.strip():
-                            self.__current_text += LINK_CLOSE_MARKER
-                            if self.__anchor_url and self.__anchor_text:
-                                structured_content.append({
-                                    'type': 'link',
-                                    'url': self.__anchor_url,
-                                    'text': self.__anchor_text
-                                })
-                        else:
-                            n = self.__current_text.rfind(LINK_OPEN_MARKER)
-                            self.__current_text = self.__current_text[:n] + ' '
-
-                        self.__anchor_url = None
-                        self.__anchor_text = ''
-
-                elif el.tag == 'img' and ev == 'start':
-                    url = el.get('src')
-                    title = el.get('title') or el.get('alt') or url
-                    structured_content.append({
-                        'type': 'image',
-                        'url': url,
-                        'title': title
-                    })
-                    image_ref = f'{{image:{url}}}'
-                    self.__current_text += image_ref
-                    if self.__is_anchor:
-                        self.__anchor_text += image_ref
+    def __init__(self, excluded_tags: List[str] = None):
+        """
 
-                if ev == 'start' and el.text:
-                    self.__current_text += el.text
-                    if self.__is_anchor:
-                        self.__anchor_text += el.text
+        :param excluded_tags: do not collect text within these tags
+        """
+        super().__init__([TEXT_CONTENT], None if excluded_tags is None else {TEXT_CONTENT: excluded_tags})
+        self.text_blocks = []
 
-                elif ev == 'end' and el.tail:
-                    self.__current_text += el.tail
-                    if self.__is_anchor:
-                        self.__anchor_text += el.tail
+    def _process_text(self, text: str, structured_content: List[Dict[str, Any]], text_list: List[str], nlp=None):
+        if len(text.strip()) > 0:
+            self.text_blocks.append(text)
+
+
+class PreprocessedNlp(object):
+    """
+    Stands in for a Spacy model, returning docs already processed for known
+    texts and processing any other text on demand.
+    """
+
+    def __init__(self, nlp, docs: Dict[str, Any]):
+        """
+
+        :param nlp: Spacy model
+        :param docs: Spacy Doc by text
+        """
+        self.nlp = nlp
+        self.docs = docs
 
-    def __is_excluded(self):
-        return self.__excluded_stack_count > 0
+    def __call__(self, text: str):
+        doc = self.docs.get(text)
+        if doc is None:
+            doc = self.nlp(text)
 
+        return doc
 
-class ListExtractor(AbstractExtractor):
+
+class HeadingExtractor(HtmlExtractor):
     """
-    Extracts lists from HTML (ul, ol) as structured content and plain text.
+    Extracts headings from HTML (H1 - H4) as structured content and plain text.
     """
 
-    __heading_tags = ['title', 'h1', 'h2', 'h3', 'h4', 'div', 'strong']
+    def __init__(self, excluded_tags: List[str] = None):
+        """
+
+        :param excluded_tags: do not extract headings within these tags
+        """
+        super().__init__([HEADING_CONTENT], None if excluded_tags is None else {HEADING_CONTENT: excluded_tags})
+
+
+class TextExtractor(HtmlExtractor):
+    """
+    Extracts block text from HTML (p, div) as structured content and plain text.
+    """
 
     def __init__(self, excluded_tags: List[str] = None):
-        self.__excluded_tags = ['table'] if excluded_tags is None else excluded_tags
-        self.__excluded_stack_count = 0
-        self.__current_text = ''
-        self.__heading_text = ''
-        self.__is_heading = False
-        self.__is_items = False
-        self.__is_list = False
-        self.__list_content = {'type': 'list', 'subtype': 'unordered', 'items': []}
-        self.__is_anchor = False
-        self.__anchor_text = ''
-        self.__anchor_url = None
-        self.__list_level = 0
+        """
 
-    def extract(self, el, ev, structured_content: List[Dict[str, Any]], text_list: List[str], nlp=None):
-        if el.tag in self.__excluded_tags:
-            if ev == 'start':
-                self.__excluded_stack_count += 1
+        :param excluded_tags: do not extract text within these tags
+        """
+        super().__init__([TEXT_CONTENT], None if excluded_tags is None else {TEXT_CONTENT: excluded_tags})
 
-            elif ev == 'end':
-                self.__excluded_stack_count -= 1
 
-        elif not self.__is_excluded():
-            if el.tag in ['ul', 'ol']:
-                if ev == 'start':
-                    self.__is_list = True
-                    self.__list_level += 1
+class ListExtractor(HtmlExtractor):
+    """
+    Extracts lists from HTML (ul, ol) as structured content and plain text.
+    """
 
-                elif ev == 'end':
-                    # flatten nested lists
-                    self.__list_level -= 1
-                    if self.__list_level == 0:
-                        if self.__current_text:
-                            c = clean_text(self.__current_text)
-                            if c:
-                                text_list.append(strip_link_markers(c))
-                                if self.__is_heading:
-                                    self.__heading_text += self.__current_text
-                                else:
-                                    structured_content.append({'type': 'text', 'text': c})
-
-                        if self.__heading_text:
-                            self.__list_content['heading'] = clean_text(self.__heading_text)
-
-                        if self.__heading_text or self.__list_content['items']:
-                            structured_content.append(self.__list_content)
-
-                        self.__list_content = {'type': 'list', 'subtype': 'unordered', 'items': []}
-                        self.__is_items = False
-                        self.__is_heading = False
-                        self.__is_list = False
-                        self.__heading_text = ''
-                        self.__current_text = ''
-
-            elif self.__is_list:
-                if el.tag in self.__heading_tags and ev == 'start' and not self.__is_items:
-                    self.__is_heading = True
-
-                if el.tag == 'li':
-                    if ev == 'start':
-                        if self.__current_text:
-                            c = clean_text(self.__current_text)
-                            if c:
-                                text_list.append(strip_link_markers(c))
-                                if self.__is_heading:
-                                    self.__heading_text += self.__current_text
-                                else:
-                                    structured_content.append({'type': 'text', 'text': c})
-
-                            self.__current_text = ''
-
-                        self.__is_heading = False
-                        self.__is_items = True
-                        if el.text:
-                            self.__current_text += el.text
-
-                    elif ev == 'end':
-                        if self.__current_text:
-                            c = clean_text(self.__current_text)
-                            self.__current_text = ''
-                            if c:
-                                text_list.append(strip_link_markers(c))
-                                self.__list_content['items'].append(c)
-
-                        if el.tail:
-                            self.__current_text += el.tail
-
-                elif el.tag == 'br' and ev == 'end':
-                    if self.__current_text:
-                        c = clean_text(self.__current_text)
-                        if c:
-                            text_list.append(strip_link_markers(c))
-                            if self.__is_heading:
-                                self.__heading_text += self.__current_text + ' '
-                            else:
-                                structured_content.append({'type': 'text', 'text': c})
-
-                        self.__current_text = ''
+    def __init__(self, excluded_tags: List[str] = None):
+        super().__init__([LIST_CONTENT], None if excluded_tags is None else {LIST_CONTENT: excluded_tags})
 
-                    if el.tail:
-                        self.__current_text += el.tail
-
-                elif el.tag in ['p', 'div', 'title', 'h1', 'h2', 'h3', 'h4']:
-                    if ev == 'start':
-                        if self.__current_text:
-                            c = clean_text(self.__current_text)
-                            if c:
-                                text_list.append(strip_link_markers(c))
-                                if self.__is_heading:
-                                    self.__heading_text += self.__current_text + ' '
-                                else:
-                                    structured_content.append({'type': 'text', 'text': c})
-
-                            self.__current_text = ''
-
-                        if el.text:
-                            self.__current_text += el.text
-
-                    elif ev == 'end':
-                        if self.__current_text:
-                            c = clean_text(self.__current_text)
-                            if c:
-                                text_list.append(strip_link_markers(c))
-                                if self.__is_heading:
-                                    self.__heading_text += self.__current_text + ' '
-                                else:
-                                    structured_content.append({'type': 'text', 'text': c})
-
-                            self.__current_text = ''
-
-                        if el.tail:
-                            self.__current_text += el.tail
 
-                else:
-                    if el.tag == 'a':
-                        if ev == 'start':
-                            anchor_url = el.get('href')
-                            if anchor_url:
-                                self.__is_anchor = True
-                                self.__current_text += LINK_OPEN_MARKER
-                                self.__anchor_url = el.get('href')
-
-                        elif ev == 'end' and self.__is_anchor:
-                            self.__is_anchor = False
-                            if self.__anchor_text.strip():
-                                self.__current_text += LINK_CLOSE_MARKER
-                                if self.__anchor_url and self.__anchor_text:
-                                    structured_content.append({
-                                        'type': 'link',
-                                        'url': self.__anchor_url,
-                                        'text': self.__anchor_text
-                                    })
-                            else:
-                                n = self.__current_text.rfind(LINK_OPEN_MARKER)
-                                self.__current_text = self.__current_text[:n] + ' '
-
-                            self.__anchor_url = None
-                            self.__anchor_text = ''
-
-                    if ev == 'start' and el.text:
-                        self.__current_text += el.text
-                        if self.__is_anchor:
-                            self.__anchor_text += el.text
-
-                    elif ev == 'end' and el.tail:
-                        self.__current_text += el.tail
-                        if self.__is_anchor:
-                            self.__anchor_text += el.tail
-
-    def __is_excluded(self):
-        return self.__excluded_stack_count > 0
-
-
-class TableExtractor(AbstractExtractor):
+class TableExtractor(HtmlExtractor):
     """
     Extracts tables from HTML as structured content and plain text.
     """
 
     def __init__(self):
-        self.__current_table_row = []
-        self.__current_text = ''
-        self.__is_table = False
-        self.__is_table_head = False
-        self.__is_table_body = False
-        self.__table_content = None
-        self.__table_stack = []
-        self.__table_index = 1
-        self.__is_anchor = False
-        self.__anchor_text = ''
-        self.__anchor_url = None
-        self.schema = Schema()
+        super().__init__([TABLE_CONTENT])
 
-    def extract(self, el, ev, structured_content: List[Dict[str, Any]], text_list: List[str], nlp=None):
-        if el.tag == 'table':
-            if ev == 'start':
-                if self.__is_table:
-                    ref = 'table:{}'.format(self.__table_index)
-                    self.__current_text += f'{{{ref}}} '
-                    self.__table_content.setdefault('references', []).append(ref)
-                    self.__table_stack.append((
-                        self.__current_table_row,
-                        self.__current_text,
-                        self.__is_table_head,
-                        self.__is_table_body,
-                        self.__table_content
-                    ))
-                self.__current_table_row = []
-                self.__current_text = ''
-                self.__is_table = True
-                self.__is_table_head = False
-                self.__is_table_body = False
-                self.__table_content = {'type': 'table', 'index': self.__table_index, 'head': [], 'body': []}
-                self.__table_index += 1
 
-            elif ev == 'end':
-                table = self.__table_content
-                if table['body']:
-                    if table['head']:
-                        headers = table['head']
-                        fields = self.schema.infer(table['body'], headers=headers)['fields']
-                    else:
-                        head = table['body'][0]
-                        headers = ['name%d' % (i + 1) for i in range(len(head))]
-                        fields = self.schema.infer(table['body'], headers=headers)['fields']
-                        if len(table['body']) > 1:
-                            dtypes = [field['type'] for field in fields]
-                            if any([typ != guess_type(val) for typ, val in zip(dtypes, head)]):
-                                table['head'] = [head]
-                                table['body'] = table['body'][1:]
-                                for field, name in zip(fields, head):
-                                    field['name'] = name
+def reextract_layout_tables(extractor: HtmlExtractor,
+                            events: List[Tuple[str, Any]],
+                            structured_content: List[Dict[str, Any]],
+                            text_list: List[str],
+                            nlp=None,
+                            batch_size: int = DEFAULT_NLP_BATCH_SIZE,
+                            n_process: int = 1
+                            ) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    Re-extract the content of single column tables, which are used for layout
+    purposes only, in place of the tables and any tables they reference.
+
+    The element of each table is taken from the events already extracted, so
+    the HTML is not parsed again, and the structured content and plain text
+    are rebuilt once, in time linear in the amount of content. Each layout table
+    is replaced in the tree by its content, so a layout table nested in another
+    is replaced by the content of the enclosing table.
+
+    :param extractor: the extractor that extracted the content
+    :param events: event and element pairs extracted from
+    :param structured_content: extracted structured content
+    :param text_list: extracted plain text
+    :param nlp: Spacy model
+    :param batch_size: number of texts processed by Spacy at a time
+    :param n_process: number of processes used by Spacy
+    :return: structured content and plain text
+    """
+    # tables are output as they end
+    table_elements = [el for ev, el in events if ev == 'end' and el.tag == 'table']
+    table_count = 0
+
+    # prefix sums of the count of plain text by structured content
+    text_offsets = [0]
+
+    # start and end of replaced structured content and plain text, and replacements
+    replacements = []
+    for i, c in enumerate(structured_content):
+        typ = c['type']
+        if typ in ['text', 'heading']:
+            text_offsets.append(text_offsets[-1] + 1)
+        elif typ == 'list':
+            text_offsets.append(text_offsets[-1] + len(c.get('items', [])))
+        elif typ == 'table':
+            text_offsets.append(text_offsets[-1] + len(c.get('head', [])) + len(c.get('body', [])))
+            table = table_elements[table_count]
+            table_count += 1
+            if len(c.get('fields', [])) == 1:
+                root = etree.Element('div')
+                root.extend(get_table_cell_contents(table))
+                sc = []
+                tl = []
+                extractor.extract_events(etree.iterwalk(root, events=('start', 'end')), sc, tl,
+                                         nlp, batch_size, n_process)
+
+                # unwrap the table, so its content is extracted again if it is
+                # nested in another layout table
+                parent = table.getparent()
+                if parent is not None:
+                    root.tail = table.tail
+                    parent.replace(table, root)
+
+                start = max(i - len(c.get('references', [])), 0)
+                text_start = text_offsets[min(start, len(text_offsets) - 1)]
+
+                # an enclosing layout table replaces the tables it references
+                while replacements and replacements[-1][1] >= start:
+                    prev_start, _, _, prev_text_start, _, _ = replacements.pop()
+                    start = min(start, prev_start)
+                    text_start = min(text_start, prev_text_start)
+
+                replacements.append((start, i, sc, text_start, text_offsets[-1], tl))
+
+    if not replacements:
+        return structured_content, text_list
+
+    new_structured_content = []
+    new_text_list = []
+    pos = 0
+    text_pos = 0
+    for start, end, sc, text_start, text_end, tl in replacements:
+        new_structured_content.extend(structured_content[pos:start])
+        new_structured_content.extend(sc)
+        new_text_list.extend(text_list[text_pos:text_start])
+        new_text_list.extend(tl)
+        pos = end + 1
+        text_pos = text_end
+
+    new_structured_content.extend(structured_content[pos:])
+    new_text_list.extend(text_list[text_pos:])
+    return new_structured_content, new_text_list
+
+
+def get_table_cell_contents(table) -> List[Any]:
+    """
+    Get the child elements of the cells of a table, not of any nested table.
 
-                    table['fields'] = fields
+    :param table: table element
+    :return: elements in document order
+    """
+    contents = []
+    for child in table:
+        rows = child if child.tag == 'tbody' else [child]
+        for row in rows:
+            if row.tag == 'tr':
+                for cell in row:
+                    if cell.tag == 'td':
+                        contents.extend(el for el in cell if isinstance(el.tag, str))
 
-                structured_content.append(table)
-                if len(self.__table_stack):
-                    (self.__current_table_row, self.__current_text,
-                        self.__is_table_head, self.__is_table_body,
-                        self.__table_content) = self.__table_stack.pop()
-                else:
-                    self.__is_table_body = False
-                    self.__is_table_head = False
-                    self.__is_table = False
-                    self.__current_text = ''
-                    self.__current_table_row = []
-                    self.__table_content = None
-                    self.__table_index = 1
+    return contents
 
-        elif self.__is_table:
-            # noinspection SpellCheckingInspection
-            if el.tag == 'thead' and ev == 'start':
-                self.__is_table_head = True
-                self.__is_table_body = False
 
-            elif el.tag == 'tbody' and ev == 'start':
-                self.__is_table_head = False
-                self.__is_table_body = True
+def guess_type(value):
+    """
+    Guess the type for a value
+    """
+    for name in _INFER_TYPE_ORDER:
+        cast = getattr(types, 'cast_%s' % name)
+        result = cast('default', value)
+        if result != config.ERROR:
+            return name
 
-            elif el.tag == 'tr' and ev == 'end':
-                if self.__is_current_table_row_not_empty():
-                    values = [v for _, v in self.__current_table_row]
-                    text_list.append(strip_link_markers(r'\t'.join(values)))
-                    if not self.__is_table_head and (self.__is_table_body or not self.__is_header_row()):
-                        self.__table_content['body'].append(values)
-                        self.__is_table_head = False
-                        self.__is_table_body = True
 
-                    else:
-                        self.__table_content['head'].append(values)
+class TokenFeatures(object):
+    """
+    The lexical features of a Spacy Token used by the heading, list and alpha
+    predicates, which can be kept without the Doc.
+    """
 
-                self.__current_text = ''
-                self.__current_table_row = []
+    __slots__ = ('text', 'is_alpha', 'is_digit', 'is_punct', 'is_space', 'is_stop', 'is_title', 'is_upper')
 
-            elif el.tag == 'th':
-                if ev == 'end':
-                    self.__current_table_row.append(('th', clean_text(self.__current_text)))
+    def __init__(self, token):
+        self.text = token.text
+        self.is_alpha = token.is_alpha
+        self.is_digit = token.is_digit
+        self.is_punct = token.is_punct
+        self.is_space = token.is_space
+        self.is_stop = token.is_stop
+        self.is_title = token.is_title
+        self.is_upper = token.is_upper
 
-                self.__current_text = ''
+    def __len__(self):
+        return len(self.text)
 
-            elif el.tag == 'td':
-                if ev == 'end':
-                    self.__current_table_row.append(('td', clean_text(self.__current_text)))
 
-                self.__current_text = ''
+class TokenFeatureCache(object):
+    """
+    Bounded cache of the token features of texts, from least to most recently
+    used, so that text checked more than once, such as the leading text of
+    adjacent blocks or boilerplate repeated across documents, is only tokenized
+    once per process.
 
-            elif el.tag == 'a':
-                if ev == 'start':
-                    anchor_url = el.get('href')
-                    if anchor_url:
-                        self.__is_anchor = True
-                        self.__current_text += LINK_OPEN_MARKER
-                        self.__anchor_url = el.get('href')
-
-                elif ev == 'end' and self.__is_anchor:
-                    self.__is_anchor = False
-                    if self.__anchor_text.strip():
-                        self.__current_text += LINK_CLOSE_MARKER
-                        if self.__anchor_url and self.__anchor_text:
-                            structured_content.append({
-                                'type': 'link',
-                                'url': self.__anchor_url,
-                                'text': self.__anchor_text
-                            })
-                    else:
-                        n = self.__current_text.rfind(LINK_OPEN_MARKER)
-                        self.__current_text = self.__current_text[:n] + ' '
+    Texts are keyed by string alone, so the cache assumes that a process uses
+    the same tokenizer throughout.
+    """
 
-                    self.__anchor_url = None
-                    self.__anchor_text = ''
+    def __init__(self, max_size: int = DEFAULT_TOKEN_CACHE_SIZE):
+        """
 
-            if ev == 'start' and el.text:
-                self.__current_text += el.text
-                if self.__is_anchor:
-                    self.__anchor_text += el.text
+        :param max_size: maximum number of texts cached
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.__features: Dict[str, Tuple[TokenFeatures, ...]] = OrderedDict()
 
-            elif ev == 'end' and el.tail:
-                self.__current_text += el.tail
-                if self.__is_anchor:
-                    self.__anchor_text += el.tail
+    def __contains__(self, text: str) -> bool:
+        return text in self.__features
 
-    def __is_current_table_row_not_empty(self) -> bool:
-        return any(v for _, v in self.__current_table_row)
+    def __len__(self):
+        return len(self.__features)
 
-    def __is_header_row(self) -> bool:
-        return all(k == 'th' for k, _ in self.__current_table_row)
+    def get(self, text: str, nlp) -> Tuple[TokenFeatures, ...]:
+        """
+        Get the token features of text, tokenizing it if not cached.
 
+        :param text: text
+        :param nlp: Spacy model
+        :return: features of each token
+        """
+        features = self.__features.get(text)
+        if features is not None:
+            self.__features.move_to_end(text)
+            self.hits += 1
+            return features
 
-def guess_type(value):
-    """
-    Guess the type for a value
-    """
-    for name in _INFER_TYPE_ORDER:
-        cast = getattr(types, 'cast_%s' % name)
-        result = cast('default', value)
-        if result != config.ERROR:
-            return name
+        self.misses += 1
+        features = tuple(TokenFeatures(token) for token in nlp(text))
+        self.__features[text] = features
+        if len(self.__features) > self.max_size:
+            self.__features.popitem(last=False)
+
+        return features
+
+    def clear(self) -> None:
+        self.__features.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+# shared by all documents processed in a process
+token_feature_cache = TokenFeatureCache()
 
 
 def has_alpha(text, nlp):
-    doc = nlp(text)
+    doc = token_feature_cache.get(text, nlp)
     for token in doc:
         if token.is_alpha:
             return True
@@ -735,7 +978,7 @@ def maybe_heading(text_or_tokens, nlp=None):
     if nlp is None:
         doc = text_or_tokens
     else:
-        doc = nlp(text_or_tokens)
+        doc = token_feature_cache.get(text_or_tokens, nlp)
 
     n = len(doc)
     for i, token in enumerate(doc):
@@ -799,6 +1042,60 @@ def is_roman_numeral(token):
     return True if match else False
 
 
+def split_text_items(doc) -> List[Dict[str, Any]]:
+    """
+    Split the sentences of a block of text into list items, by bullet marker
+    or list number, and runs of text.
+
+    :param doc: Spacy Doc with sentence boundaries
+    :return: list of dict of item 'type' and 'tokens'
+    """
+    obj_list = []
+    list_levels = defaultdict(list)
+    i = 0
+    for sent in doc.sents:
+        # ignore blank sentences
+        if len(sent.text.strip()) == 0:
+            continue
+
+        # split by bullet marker or list number if present
+        list_item_text = []
+        cur_text = []
+        n = len(sent)
+        is_list = False
+        for j, token in enumerate(sent):
+            next_token = sent[j + 1] if (j + 2) < n else None
+            if j == 0:
+                if is_bullet(token):
+                    list_item_text = []
+                    obj = {'type': 'unordered_list_item', 'tokens': list_item_text}
+                    obj_list.append(obj)
+                    list_levels[token.shape_].append(obj)
+                    is_list = True
+                elif is_ordered_list_item(token, next_token):
+                    list_item_text = []
+                    obj = {'type': 'ordered_list_item', 'tokens': list_item_text}
+                    obj_list.append(obj)
+                    list_levels[token.shape_].append(obj)
+                    is_list = True
+
+            if is_list:
+                list_item_text.append(token)
+            else:
+                cur_text.append(token)
+
+        if len(cur_text) > 0:
+            obj_list.append({'type': 'text', 'tokens': cur_text})
+
+        i += 1
+
+    return obj_list
+
+
+def get_tokens_text(tokens) -> str:
+    return ''.join([t.text_with_ws for t in tokens]).rstrip()
+
+
 def continues(leading_text, following_text, nlp):
     if leading_text.endswith(('.', '?', '!')):
         return False
@@ -27,7 +27,7 @@ def file_iter(file_paths: List[str]) -> Iterator[Tuple[IO[AnyStr], str]]:
 def load_config(config_file_path: str) -> Dict[str, Any]:
     # get lists of data keys by `doc_type` to include in output
     with open(config_file_path, 'r') as f:
-        config = yaml.load(f)
+        config = yaml.safe_load(f)
 
     return config
 
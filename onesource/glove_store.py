@@ -0,0 +1,144 @@
+from argparse import ArgumentParser
+from collections.abc import Mapping
+import numpy as np
+import os
+from typing import Iterator, Optional, Tuple
+
+VECTORS_FILENAME = 'vectors.npy'
+WORDS_FILENAME = 'words.npy'
+ROWS_FILENAME = 'rows.npy'
+
+# special tokens of `relation_extraction.core.embeddings`, with the zero
+# vector in the first row, and the unknown vector in the last row
+ALL_ZEROES = 'ALL_ZERO'
+UNKNOWN = '_UNKNOWN'
+
+# number of rarest words of which the unknown vector is the average
+RARE_WORD_COUNT = 100
+
+
+class VocabIndex(Mapping):
+    """
+    Read-only mapping of word to row of the embedding matrix, over a sorted
+    array of UTF-8 encoded words and an array of their rows. Words are looked
+    up by binary search, so the arrays can be memory mapped and shared by
+    processes instead of each building a dict of the vocab.
+    """
+
+    def __init__(self, words: np.ndarray, rows: np.ndarray):
+        """
+
+        :param words: sorted byte strings
+        :param rows: row of each word
+        """
+        self.__words = words
+        self.__rows = rows
+
+    def get(self, word: str, default: Optional[int] = None) -> Optional[int]:
+        key = word.encode('utf-8')
+        if not key or len(key) > self.__words.itemsize:
+            return default
+
+        i = int(np.searchsorted(self.__words, key))
+        if i < len(self.__words) and self.__words[i] == key:
+            return int(self.__rows[i])
+
+        return default
+
+    def __getitem__(self, word: str) -> int:
+        row = self.get(word)
+        if row is None:
+            raise KeyError(word)
+
+        return row
+
+    def __contains__(self, word: object) -> bool:
+        return isinstance(word, str) and self.get(word) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        for word in self.__words:
+            yield word.decode('utf-8')
+
+    def __len__(self) -> int:
+        return len(self.__words)
+
+
+def convert_glove(text_path: str, store_dir: str) -> Tuple[int, int]:
+    """
+    Convert embeddings in GloVe text format to a store of a float32 matrix
+    and a sorted vocab index, with the same rows as `embeddings.load` of
+    `relation_extraction`.
+
+    :param text_path: path of text file of a word and its vector on each line
+    :param store_dir: path of dir of store
+    :return: number of rows and dimension of the matrix
+    """
+    with open(text_path, encoding='utf8') as f:
+        line_count = 0
+        dim = None
+        for line in f:
+            if dim is None:
+                dim = len(line.strip().split(' ')) - 1
+
+            line_count += 1
+
+    if not line_count:
+        raise ValueError('no embeddings in {}'.format(text_path))
+
+    os.makedirs(store_dir, exist_ok=True)
+
+    # written in place, so the matrix is never held in memory
+    vectors_path = os.path.join(store_dir, VECTORS_FILENAME)
+    vectors = np.lib.format.open_memmap(vectors_path + '.tmp', mode='w+', dtype=np.float32,
+                                        shape=(line_count + 2, dim))
+    vectors[0] = 0.
+    word2idx = {}
+    with open(text_path, encoding='utf8') as f:
+        for idx, line in enumerate(f, 1):
+            split = line.strip().split(' ')
+            vectors[idx] = np.array(split[1:], dtype=np.float32)
+            word2idx[split[0]] = idx
+
+    unknown_idx = line_count + 1
+    vectors[unknown_idx] = np.average(vectors[max(1, unknown_idx - RARE_WORD_COUNT - 1):unknown_idx - 1], axis=0)
+    vectors.flush()
+    del vectors
+
+    word2idx[ALL_ZEROES] = 0
+    word2idx[UNKNOWN] = unknown_idx
+    keys = sorted(w.encode('utf-8') for w in word2idx)
+    words = np.array(keys)
+    rows = np.array([word2idx[k.decode('utf-8')] for k in keys], dtype=np.int32)
+    np.save(os.path.join(store_dir, WORDS_FILENAME), words)
+    np.save(os.path.join(store_dir, ROWS_FILENAME), rows)
+
+    # the matrix is replaced last, so a store with a matrix is complete
+    os.replace(vectors_path + '.tmp', vectors_path)
+    return line_count + 2, dim
+
+
+def load_glove_store(store_dir: str) -> Tuple[np.ndarray, VocabIndex]:
+    """
+    Memory map a store of embeddings, so that processes share its pages.
+
+    :param store_dir: path of dir of store
+    :return: read-only embedding matrix, and index of the row of each word
+    """
+    vectors = np.load(os.path.join(store_dir, VECTORS_FILENAME), mmap_mode='r')
+    words = np.load(os.path.join(store_dir, WORDS_FILENAME), mmap_mode='r')
+    rows = np.load(os.path.join(store_dir, ROWS_FILENAME), mmap_mode='r')
+    return vectors, VocabIndex(words, rows)
+
+
+def is_glove_store(store_dir: str) -> bool:
+    return os.path.exists(os.path.join(store_dir, VECTORS_FILENAME))
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Convert GloVe embeddings from text to a memory-mapped store')
+    parser.add_argument('text_path', help='path of GloVe text file, e.g. glove.6B.50d.txt')
+    parser.add_argument('store_dir', help='path of dir of store')
+    args = parser.parse_args()
+
+    row_count, dimension = convert_glove(args.text_path, args.store_dir)
+    print('wrote {} x {} matrix to {}'.format(row_count, dimension, args.store_dir))
@@ -1,9 +1,10 @@
 from datetime import datetime
 import json
 from logging import Logger
+from model_registry import get_model, register_model
 import numpy as np
 import os
-from pipeline import AbstractStep, file_iter, json_output_handler as oh
+from pipeline import AbstractStep, file_iter, json_output_handler as oh, process_files
 import tensorflow as tf
 from tensorflow.contrib import learn
 from typing import Any, AnyStr, Callable, Dict, Iterator, IO, List
@@ -15,24 +16,18 @@ CONFIG_FILE_PATH = os.path.join(dir_path, '../config/config.yml')
 MODEL_CHECKPOINT_PATH = ('/Users/d777710/src/DeepLearning/dltemplate/src/tf_model/'
                          'question_detector/runs/1544951256/checkpoints')
 
+QUESTION_CLASSIFIER = 'question_classifier'
 
-class IdentifyQuestionsStep(AbstractStep):
+
+class QuestionClassifier(object):
     """
-    Identify questions in text.
+    Question detection model restored from a TensorFlow checkpoint.
     """
 
-    def __init__(self,
-                 name: str,
-                 source_key: str = None,
-                 overwrite: bool = False,
-                 source_iter: Callable[[List[str]], Iterator[IO[AnyStr]]] = file_iter,
-                 output_handler: Callable[[str, Dict[str, Any]], None] = oh):
-        super().__init__(name, source_key, overwrite)
-        self.__source_iter = source_iter
-        self.__output_handler = output_handler
-        vocab_path = os.path.join(MODEL_CHECKPOINT_PATH, '..', 'vocab')
+    def __init__(self, checkpoint_path: str = MODEL_CHECKPOINT_PATH):
+        vocab_path = os.path.join(checkpoint_path, '..', 'vocab')
         self.vocab_processor = learn.preprocessing.VocabularyProcessor.restore(vocab_path)
-        checkpoint_file = tf.train.latest_checkpoint(MODEL_CHECKPOINT_PATH)
+        checkpoint_file = tf.train.latest_checkpoint(checkpoint_path)
         graph = tf.Graph()
         with graph.as_default():
             session_conf = tf.ConfigProto(allow_soft_placement=True, log_device_placement=False)
@@ -49,11 +44,39 @@ class IdentifyQuestionsStep(AbstractStep):
                 # Tensors we want to evaluate
                 self.preds = graph.get_operation_by_name('output/predictions').outputs[0]
 
-    def predict_question(self, text):
+    def predict(self, text: str) -> bool:
         x = np.array(list(self.vocab_processor.transform([text])))
         preds = self.sess.run(self.preds, {self.input_x: x, self.keep_prob: 1.0})
         return int(preds[0]) == 1
 
+
+# TensorFlow sessions cannot be used by forked processes
+register_model(QUESTION_CLASSIFIER, QuestionClassifier, fork_safe=False)
+
+
+class IdentifyQuestionsStep(AbstractStep):
+    """
+    Identify questions in text.
+    """
+
+    def __init__(self,
+                 name: str,
+                 source_key: str = None,
+                 overwrite: bool = False,
+                 source_iter: Callable[[List[str]], Iterator[IO[AnyStr]]] = file_iter,
+                 output_handler: Callable[[str, Dict[str, Any]], None] = oh):
+        super().__init__(name, source_key, overwrite)
+        self.__source_iter = source_iter
+        self.__output_handler = output_handler
+
+    @property
+    def classifier(self) -> 'QuestionClassifier':
+        # loaded on first use in each process, as it cannot be preloaded
+        return get_model(QUESTION_CLASSIFIER)
+
+    def predict_question(self, text):
+        return self.classifier.predict(text)
+
     def process_file(self,
                      file: IO[AnyStr],
                      path: str,
@@ -93,12 +116,9 @@ class IdentifyQuestionsStep(AbstractStep):
                     processed_file_paths[x['input']] = x
 
         accumulator['found_questions'] = []
-        for file, path in self.__source_iter(file_paths):
-            if not self._overwrite and path in processed_file_paths.keys():
-                accumulator['files_output'].append(processed_file_paths[path])
-                continue
-
-            self.process_file(file, path, control_data, logger, accumulator)
+        for _ in process_files(self, self.__source_iter, file_paths, control_data, logger, accumulator,
+                               processed_file_paths):
+            pass
 
         np.savetxt('/tmp/found_questions.txt', accumulator['found_questions'], fmt='%s')
         del accumulator['found_questions']
@@ -107,7 +127,7 @@ class IdentifyQuestionsStep(AbstractStep):
 def load_config() -> Dict[str, Any]:
     # get lists of data keys by `doc_type` to include in output
     with open(CONFIG_FILE_PATH, 'r') as f:
-        config = yaml.load(f)
+        config = yaml.safe_load(f)
 
     return config
 
@@ -3,7 +3,7 @@ import json
 from logging import Logger
 import numpy as np
 import os
-from pipeline import AbstractStep, file_iter, json_output_handler as oh
+from pipeline import AbstractStep, file_iter, json_output_handler as oh, process_files
 from typing import Any, AnyStr, Callable, Dict, Iterator, IO, List
 from utils import convert_name_to_underscore
 import yaml
@@ -77,12 +77,9 @@ class IdentifyQuestionsNaiveStep(AbstractStep):
                     processed_file_paths[x['input']] = x
 
         accumulator['found_questions'] = []
-        for file, path in self.__source_iter(file_paths):
-            if not self._overwrite and path in processed_file_paths.keys():
-                accumulator['files_output'].append(processed_file_paths[path])
-                continue
-
-            self.process_file(file, path, control_data, logger, accumulator)
+        for _ in process_files(self, self.__source_iter, file_paths, control_data, logger, accumulator,
+                               processed_file_paths):
+            pass
 
         np.savetxt('/tmp/found_questions.txt', accumulator['found_questions'], fmt='%s')
         del accumulator['found_questions']
@@ -91,7 +88,7 @@ class IdentifyQuestionsNaiveStep(AbstractStep):
 def load_config() -> Dict[str, Any]:
     # get lists of data keys by `doc_type` to include in output
     with open(CONFIG_FILE_PATH, 'r') as f:
-        config = yaml.load(f)
+        config = yaml.safe_load(f)
 
     return config
 
@@ -0,0 +1,164 @@
+from datetime import datetime
+import json
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional
+from utils import create_fork_pool
+import uuid
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_PROCESSED = 'processed'
+JOB_ERROR = 'error'
+
+STATUS_FILENAME = 'status.json'
+
+# seconds between checks of the status of a job when waiting for it
+POLL_INTERVAL = 0.2
+
+# runs a job from its input, output and temp dirs, returning the paths of its output files
+RunJob = Callable[[str, str, str], List[str]]
+
+
+class JobQueue(object):
+    """
+    Runs jobs in background worker processes, so that requests do not wait
+    for the pipeline to run.
+
+    Each job has its own input, output and temp dirs under the root dir, so
+    concurrent jobs do not share files or control data. The status of each job
+    is kept in a file in its dir, so any process can report it.
+
+    Worker processes are forked when the first job is submitted, and are kept
+    across jobs, so modules and models loaded by a worker are loaded once.
+    """
+
+    def __init__(self, root_dir: str, run_job: RunJob, max_workers: int = 1):
+        """
+
+        :param root_dir: path to dir of job dirs
+        :param run_job: runs a job, must be defined at module level so it can be pickled
+        :param max_workers: number of worker processes
+        """
+        self.root_dir = root_dir
+        self.max_workers = max_workers
+        self.__run_job = run_job
+        self.__executor = None
+        os.makedirs(root_dir, exist_ok=True)
+
+    def create_job(self) -> str:
+        """
+        Create the dirs of a new job.
+
+        :return: job id
+        """
+        job_id = uuid.uuid4().hex
+        job_dir = self.get_job_dir(job_id)
+        for name in ('in', 'out', 'temp'):
+            os.makedirs(os.path.join(job_dir, name))
+
+        write_status(job_dir, {'job_id': job_id, 'status': JOB_QUEUED, 'created': datetime.utcnow().isoformat()})
+        return job_id
+
+    def submit(self, job_id: str) -> None:
+        """
+        Queue a job, once its input files are in its input dir.
+
+        :param job_id: job id
+        :return: None
+        """
+        if not self.__executor:
+            self.__executor = create_fork_pool(self.max_workers)
+
+        self.__executor.submit(execute_job, self.get_job_dir(job_id), self.__run_job)
+
+    def get_status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the status of a job.
+
+        :param job_id: job id
+        :return: status, or None if the job is not found
+        """
+        if not is_valid_job_id(job_id):
+            return None
+
+        return read_status(self.get_job_dir(job_id))
+
+    def wait(self, job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        Wait for a job to end.
+
+        :param job_id: job id
+        :param timeout: maximum seconds to wait
+        :return: status when the job ended or the timeout passed, or None if the
+                 job is not found
+        """
+        deadline = time.time() + timeout
+        while True:
+            status = self.get_status(job_id)
+            if not status or status['status'] in (JOB_PROCESSED, JOB_ERROR) or time.time() >= deadline:
+                return status
+
+            time.sleep(POLL_INTERVAL)
+
+    def get_job_dir(self, job_id: str) -> str:
+        return os.path.join(self.root_dir, job_id)
+
+    def get_input_dir(self, job_id: str) -> str:
+        return os.path.join(self.get_job_dir(job_id), 'in')
+
+    def get_output_dir(self, job_id: str) -> str:
+        return os.path.join(self.get_job_dir(job_id), 'out')
+
+    def shutdown(self) -> None:
+        if self.__executor:
+            self.__executor.shutdown()
+            self.__executor = None
+
+
+def execute_job(job_dir: str, run_job: RunJob) -> None:
+    """
+    Run a job in a worker process, recording its status.
+
+    :param job_dir: path to job dir
+    :param run_job: runs the job
+    :return: None
+    """
+    status = read_status(job_dir)
+    status.update(status=JOB_RUNNING, start=datetime.utcnow().isoformat())
+    write_status(job_dir, status)
+    output_dir = os.path.join(job_dir, 'out')
+    try:
+        output_paths = run_job(os.path.join(job_dir, 'in'), output_dir, os.path.join(job_dir, 'temp'))
+        status.update(status=JOB_PROCESSED, outputs=[os.path.relpath(p, output_dir) for p in output_paths])
+    except Exception as e:
+        status.update(status=JOB_ERROR, message=repr(e))
+
+    status['end'] = datetime.utcnow().isoformat()
+    write_status(job_dir, status)
+
+
+def is_valid_job_id(job_id: str) -> bool:
+    # ids are only used as dir names once known to be ids that were created
+    try:
+        return uuid.UUID(job_id).hex == job_id
+    except ValueError:
+        return False
+
+
+def read_status(job_dir: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(job_dir, STATUS_FILENAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_status(job_dir: str, status: Dict[str, Any]) -> None:
+    # replaced atomically, so readers never see a partial file
+    path = os.path.join(job_dir, STATUS_FILENAME)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(status, f)
+
+    os.replace(temp_path, path)
@@ -0,0 +1,271 @@
+import json
+from json.decoder import JSONDecodeError
+import os
+from typing import Any, Dict, List
+
+# number of events after which the journal is folded into the control file
+COMPACT_EVENT_COUNT = 50000
+
+OP_JOB = 'job'
+OP_STEP = 'step'
+OP_FILE = 'file'
+OP_OUTPUT = 'output'
+
+
+class ControlJournal(object):
+    """
+    Append-only journal of job control events.
+
+    Instead of rewriting the whole control file at every checkpoint, each change
+    to `control_data` is appended to a JSON lines file next to the control file,
+    so a checkpoint costs O(1) per file. The control file is a snapshot that the
+    journal is periodically folded into (compacted). `load_control_data` rebuilds
+    `control_data` from the snapshot and the journal after a crash.
+
+    Events are applied to `control_data` in memory as they are written, using the
+    same code as the loader, so the rebuilt control data matches exactly.
+    """
+
+    def __init__(self, temp_path: str, control_data: Dict[str, Any], compact_event_count: int = COMPACT_EVENT_COUNT):
+        """
+
+        :param temp_path: path to control file
+        :param control_data: data loaded from control file, updated in place
+        :param compact_event_count: compact after this number of events
+        """
+        self.__temp_path = temp_path
+        self.__journal_path = get_journal_path(temp_path)
+        self.__control_data = control_data
+        self.__index = create_index(control_data)
+        self.__compact_event_count = compact_event_count
+        self.__event_count = 0
+        self.__cursors = {}
+        self.__file = None
+
+    @property
+    def control_data(self) -> Dict[str, Any]:
+        return self.__control_data
+
+    def append(self, event: Dict[str, Any]) -> None:
+        apply_event(self.__control_data, self.__index, event)
+        if not self.__file:
+            truncate_partial_line(self.__journal_path)
+            self.__file = open(self.__journal_path, 'a')
+
+        self.__file.write(json.dumps(event))
+        self.__file.write('\n')
+        self.__file.flush()
+        self.__event_count += 1
+        if self.__event_count >= self.__compact_event_count:
+            self.compact()
+
+    def job_updated(self, **job) -> None:
+        self.append({'op': OP_JOB, 'job': job})
+
+    def step_started(self, step_name: str) -> None:
+        self.append({'op': OP_STEP, 'step': step_name})
+
+    def sync(self, step_name: str, accumulator: Dict[str, Any]) -> None:
+        """
+        Journal the control info accumulated by a step since the last sync.
+
+        :param step_name: name of pipeline step in underscore format
+        :param accumulator: working storage for job control or to accumulate output data
+        :return: None
+        """
+        files_processed = accumulator['files_processed']
+        files_output = accumulator['files_output']
+        i, j = self.__cursors.get(step_name, (0, 0))
+        for x in files_processed[i:]:
+            self.append({'op': OP_FILE, 'path': x['path'], 'time': x['time']})
+
+        for x in files_output[j:]:
+            self.append({'op': OP_OUTPUT, 'step': step_name, 'output': x})
+
+        self.__cursors[step_name] = (len(files_processed), len(files_output))
+
+    def compact(self) -> None:
+        """
+        Fold the journal into the control file.
+
+        :return: None
+        """
+        self.close()
+        order_outputs(self.__control_data)
+        self.__index = create_index(self.__control_data)
+        write_control_snapshot(self.__temp_path, self.__control_data)
+        self.__event_count = 0
+
+    def close(self) -> None:
+        if self.__file:
+            self.__file.close()
+            self.__file = None
+
+
+def get_journal_path(temp_path: str) -> str:
+    return os.path.splitext(temp_path)[0] + '.jsonl'
+
+
+def create_index(control_data: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    return {
+        'files': {x['path']: x for x in control_data.get('files', [])},
+        'outputs': {}
+    }
+
+
+def get_output_key(output: Dict[str, Any]) -> str:
+    # outputs of a step are identified by input, except for steps that combine inputs
+    key = output.get('input')
+    if isinstance(key, str):
+        return key
+
+    return output['path']
+
+
+def apply_event(control_data: Dict[str, Any], index: Dict[str, Dict[str, Any]], event: Dict[str, Any]) -> None:
+    """
+    Apply a journal event to control data. Events are idempotent, so replaying
+    a journal on top of a snapshot that already includes some of it is safe.
+
+    :param control_data: data loaded from control file
+    :param index: lookup of files and step outputs in `control_data`
+    :param event: journal event
+    :return: None
+    """
+    op = event['op']
+    if op == OP_JOB:
+        control_data['job'].update(event['job'])
+
+    elif op == OP_STEP:
+        steps: List[str] = control_data['job'].setdefault('steps', [])
+        if event['step'] not in steps:
+            steps.append(event['step'])
+
+        control_data.setdefault(event['step'], [])
+
+    elif op == OP_FILE:
+        file = index['files'].get(event['path'])
+        if file:
+            file['status'] = 'processed'
+            file['time'] = event['time']
+
+    elif op == OP_OUTPUT:
+        step_name = event['step']
+        output = event['output']
+        outputs = control_data.setdefault(step_name, [])
+        if step_name not in index['outputs']:
+            index['outputs'][step_name] = {get_output_key(x): i for i, x in enumerate(outputs)}
+
+        positions = index['outputs'][step_name]
+        key = get_output_key(output)
+        if key in positions:
+            outputs[positions[key]] = output
+        else:
+            positions[key] = len(outputs)
+            outputs.append(output)
+
+
+def order_outputs(control_data: Dict[str, Any]) -> None:
+    """
+    Order the outputs of each step by the order of their inputs, following
+    inputs back to the job files, as outputs are journaled in the order that
+    they are processed, and outputs of a resumed job keep their old positions.
+
+    The outputs of a step are left as they are if any input is unknown.
+
+    :param control_data: control data, updated in place
+    :return: None
+    """
+    ranks = {x['path']: i for i, x in enumerate(control_data.get('files', []))}
+    for step_name in control_data['job'].get('steps', []):
+        outputs = control_data.get(step_name)
+        if not outputs:
+            continue
+
+        output_ranks = []
+        for output in outputs:
+            inputs = output.get('input')
+            if isinstance(inputs, str):
+                inputs = [inputs]
+
+            input_ranks = [ranks.get(path) for path in inputs or []]
+            if not input_ranks or None in input_ranks:
+                output_ranks = None
+                break
+
+            output_ranks.append(min(input_ranks))
+
+        if output_ranks is None:
+            continue
+
+        ordered = sorted(zip(output_ranks, range(len(outputs))))
+        control_data[step_name] = [outputs[i] for _, i in ordered]
+        for rank, i in ordered:
+            path = outputs[i].get('path')
+            if path:
+                ranks[path] = rank
+
+
+def truncate_partial_line(path: str) -> None:
+    """
+    Remove an incomplete last line, left by a crash while writing it, so that
+    appended lines are not joined to it.
+
+    :param path: path of JSON lines file
+    :return: None
+    """
+    if not os.path.isfile(path):
+        return
+
+    with open(path, 'rb+') as f:
+        data = f.read()
+        if data and not data.endswith(b'\n'):
+            f.truncate(data.rfind(b'\n') + 1)
+
+
+def load_control_data(temp_path: str) -> Dict[str, Any]:
+    """
+    Rebuild control data from the control file and its journal.
+
+    :param temp_path: path to control file
+    :return: control data, or None if there is no control file
+    """
+    if not os.path.isfile(temp_path):
+        return None
+
+    with open(temp_path, 'r') as control_file:
+        control_data = json.load(control_file)
+
+    journal_path = get_journal_path(temp_path)
+    if os.path.isfile(journal_path):
+        index = create_index(control_data)
+        with open(journal_path, 'r') as journal_file:
+            for line in journal_file:
+                try:
+                    event = json.loads(line)
+                except (JSONDecodeError, ValueError):
+                    # last line may be incomplete after a crash
+                    break
+
+                apply_event(control_data, index, event)
+
+    return control_data
+
+
+def write_control_snapshot(temp_path: str, control_data: Dict[str, Any]) -> None:
+    """
+    Replace the control file with `control_data` and clear its journal.
+
+    :param temp_path: path to control file
+    :param control_data: data to write
+    :return: None
+    """
+    # write then rename so a crash never leaves a partial control file
+    tmp_path = temp_path + '.tmp'
+    with open(tmp_path, 'w') as output_file:
+        json.dump(control_data, output_file)
+
+    os.replace(tmp_path, temp_path)
+    journal_path = get_journal_path(temp_path)
+    if os.path.isfile(journal_path):
+        os.remove(journal_path)
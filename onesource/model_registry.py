@@ -0,0 +1,92 @@
+import os
+from threading import RLock
+from typing import Any, Callable, Dict, Iterable
+
+# spaCy English model with tagger, parser and NER
+SPACY_EN = 'spacy_en'
+
+_loaders: Dict[str, Callable[[], Any]] = {}
+_fork_safe: Dict[str, bool] = {}
+
+# loaded models by name, with the id of the process that loaded each
+_models: Dict[str, Any] = {}
+_model_pids: Dict[str, int] = {}
+
+_lock = RLock()
+
+
+def register_model(name: str, loader: Callable[[], Any], fork_safe: bool = True) -> None:
+    """
+    Register how to load a model. Registering the same loader again is a no-op,
+    as modules that share a model each register it.
+
+    :param name: model name
+    :param loader: loads the model
+    :param fork_safe: the model can be used by processes forked after it is
+           loaded, sharing its memory copy-on-write. Models that hold threads,
+           sessions or connections, e.g. a TensorFlow session or a JVM, are
+           loaded again in each process.
+    :raises ValueError: if another loader is registered with the same name
+    """
+    with _lock:
+        if name in _loaders and _loaders[name] is not loader:
+            raise ValueError("model '{}' is already registered".format(name))
+
+        _loaders[name] = loader
+        _fork_safe[name] = fork_safe
+
+
+def get_model(name: str) -> Any:
+    """
+    Get a model, loading it the first time it is used in this process.
+
+    :param name: model name
+    :return: model
+    """
+    pid = os.getpid()
+    model = _models.get(name)
+    if model is not None and (_fork_safe[name] or _model_pids[name] == pid):
+        return model
+
+    with _lock:
+        model = _models.get(name)
+        if model is None or not (_fork_safe[name] or _model_pids[name] == pid):
+            if name not in _loaders:
+                raise KeyError("model '{}' is not registered".format(name))
+
+            model = _loaders[name]()
+            _models[name] = model
+            _model_pids[name] = pid
+
+        return model
+
+
+def preload_models(names: Iterable[str] = None) -> None:
+    """
+    Load models before forking worker processes, e.g. when gunicorn is run with
+    `--preload`, so that workers share them instead of each loading them.
+
+    :param names: names of models, defaults to the registered models that are
+           fork safe
+    :return: None
+    """
+    if names is None:
+        names = [name for name, fork_safe in _fork_safe.items() if fork_safe]
+
+    for name in names:
+        get_model(name)
+
+
+def is_model_loaded(name: str) -> bool:
+    return name in _models
+
+
+def unload_models() -> None:
+    with _lock:
+        _models.clear()
+        _model_pids.clear()
+
+
+def load_spacy_en() -> Any:
+    import spacy
+    return spacy.load('en')
@@ -0,0 +1,263 @@
+from collections import OrderedDict
+from content_graph import add_content_graph, get_content_fingerprint
+import logging
+from node_ids import get_node_id, get_random_node_id
+import os
+from py2neo import Graph
+import settings
+import time
+from typing import Any, Dict, List, Optional
+
+NEO4J_HOST = os.getenv('NEO4J_HOST')
+NEO4J_USER = os.getenv('NEO4J_USER')
+NEO4J_PASSWORD = os.getenv('NEO4J_PASSWORD')
+
+# number of buffered nodes and relationships after which a write is flushed,
+# and the maximum number of rows sent in each statement
+DEFAULT_BATCH_SIZE = 5000
+
+# seconds after which buffered nodes and relationships are flushed
+DEFAULT_FLUSH_INTERVAL = 30
+
+MERGE_NODES_CYPHER = 'UNWIND $rows AS row MERGE (n:ContentNode {node_id: row.node_id}) SET n = row'
+
+# relationship types cannot be parameters, so are written a type at a time
+MERGE_RELATIONSHIPS_CYPHER = ('UNWIND $rows AS row '
+                              'MATCH (a:ContentNode {{node_id: row.node_id1}}), '
+                              '(b:ContentNode {{node_id: row.node_id2}}) '
+                              'MERGE (a)-[:{}]->(b)')
+
+# the fingerprint of each document is kept to skip documents that are unchanged
+SELECT_FINGERPRINTS_CYPHER = ('MATCH (d:ContentDocument) WHERE d.record_id IN $record_ids '
+                              'RETURN d.record_id AS record_id, d.fingerprint AS fingerprint')
+
+DELETE_DOCUMENT_NODES_CYPHER = 'MATCH (n:ContentNode) WHERE n.record_id IN $record_ids DETACH DELETE n'
+
+MERGE_DOCUMENTS_CYPHER = ('UNWIND $rows AS row MERGE (d:ContentDocument {record_id: row.record_id}) '
+                          'SET d.fingerprint = row.fingerprint')
+
+# unique constraints also index the property
+CREATE_SCHEMA_CYPHER = [
+    'CREATE CONSTRAINT ON (n:ContentNode) ASSERT n.node_id IS UNIQUE',
+    'CREATE CONSTRAINT ON (d:ContentDocument) ASSERT d.record_id IS UNIQUE',
+    'CREATE INDEX ON :ContentNode(record_id)'
+]
+
+_writer = None
+_writer_pid = None
+
+
+class BufferedDocument(object):
+    """
+    The nodes and relationships of a document waiting to be written.
+    """
+
+    def __init__(self, fingerprint: str = None):
+        self.fingerprint = fingerprint
+        self.nodes: List[Dict[str, Any]] = []
+
+        # relationships by type
+        self.relationships: Dict[str, List[Dict[str, Any]]] = {}
+        self.relationship_count = 0
+
+    @property
+    def row_count(self) -> int:
+        return len(self.nodes) + self.relationship_count
+
+
+class Neo4jBatchWriter(object):
+    """
+    Buffers the content nodes and relationships of one or more documents, and
+    writes them with a few `UNWIND $rows ... MERGE` statements in one transaction
+    per batch, over a graph connection that is kept across documents.
+
+    Node ids are derived from the record id of the document, given by the
+    'record_id' key of the content, and the position of the node. A fingerprint
+    of the content of each document is stored on a ContentDocument node.
+    Documents with an unchanged fingerprint are skipped, and the nodes of a
+    changed document are deleted and created again in the same transaction.
+    """
+
+    def __init__(self,
+                 graph: Any = None,
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+                 skip_unchanged: bool = True):
+        """
+
+        :param graph: py2neo Graph, defaults to a connection to env var NEO4J_HOST
+        :param batch_size: flush once this number of nodes and relationships are
+               buffered, also the maximum number of rows in each statement
+        :param flush_interval: flush when writing a document if the oldest buffered
+               node was added more than this number of seconds ago
+        :param skip_unchanged: skip documents whose fingerprint is unchanged
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.skip_unchanged = skip_unchanged
+        self.node_count = 0
+        self.relationship_count = 0
+        self.skipped_count = 0
+        self.__graph = graph
+
+        # documents by record id, with documents without a record id under None
+        self.__documents: Dict[Optional[str], BufferedDocument] = OrderedDict()
+        self.__document = None
+        self.__row_count = 0
+        self.__buffered_since = None
+        self.__record_id = None
+        self.__schema_created = False
+
+    @property
+    def graph(self) -> Graph:
+        if self.__graph is None:
+            self.__graph = Graph(NEO4J_HOST, auth=(NEO4J_USER, NEO4J_PASSWORD))
+
+        return self.__graph
+
+    @property
+    def buffered_row_count(self) -> int:
+        return self.__row_count
+
+    def add_node(self, node_text, node_type, url, is_question, seq_index=0, position=None) -> int:
+        if self.__buffered_since is None:
+            self.__buffered_since = time.time()
+
+        if self.__record_id is None or position is None:
+            node_id = get_random_node_id()
+        else:
+            node_id = get_node_id(self.__record_id, position)
+
+        self.__document.nodes.append({
+            'node_id': node_id,
+            'node_type': node_type,
+            'node_text': node_text,
+            'url': url,
+            'is_question': is_question,
+            'seq_index': seq_index,
+            'record_id': self.__record_id
+        })
+        return node_id
+
+    def add_edge(self, node_id1, node_id2, edge_type) -> None:
+        self.__document.relationships.setdefault(edge_type, []).append({'node_id1': node_id1,
+                                                                        'node_id2': node_id2})
+        self.__document.relationship_count += 1
+
+    def write(self, content: Dict[str, Any]) -> None:
+        """
+        Buffer the structured content of a document, flushing if the buffer is
+        full or the flush interval has passed.
+
+        :param content: JSON content
+        :return: None
+        """
+        record_id = content.get('record_id')
+        if record_id is None:
+            document = self.__documents.setdefault(None, BufferedDocument())
+        else:
+            # a later version of a document in the same batch replaces it
+            previous = self.__documents.pop(record_id, None)
+            if previous:
+                self.__row_count -= previous.row_count
+
+            document = self.__documents[record_id] = BufferedDocument(get_content_fingerprint(content))
+
+        row_count = document.row_count
+        self.__record_id = record_id
+        self.__document = document
+        add_content_graph(content, self.add_node, self.add_edge)
+        self.__record_id = None
+        self.__document = None
+        self.__row_count += document.row_count - row_count
+        if (self.__row_count >= self.batch_size or
+                (self.__buffered_since is not None and
+                 time.time() - self.__buffered_since >= self.flush_interval)):
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Write the buffered documents in one transaction.
+
+        :return: None
+        """
+        if not self.__documents:
+            return
+
+        documents = self.__documents
+        self.__documents = OrderedDict()
+        self.__row_count = 0
+        self.__buffered_since = None
+        record_ids = [r for r in documents if r is not None]
+        graph = self.graph
+        if not self.__schema_created:
+            # nodes are merged, relationships find their nodes, and documents
+            # are replaced, by indexed properties
+            for cypher in CREATE_SCHEMA_CYPHER:
+                graph.run(cypher)
+
+            self.__schema_created = True
+
+        nodes = []
+        relationships: Dict[str, List[Dict[str, Any]]] = {}
+        relationship_count = 0
+        tx = graph.begin()
+        try:
+            unchanged = set()
+            if record_ids and self.skip_unchanged:
+                fingerprints = {row['record_id']: row['fingerprint']
+                                for row in tx.run(SELECT_FINGERPRINTS_CYPHER, record_ids=record_ids).data()}
+                unchanged = {r for r in record_ids if fingerprints.get(r) == documents[r].fingerprint}
+
+            changed = [r for r in record_ids if r not in unchanged]
+            if changed:
+                tx.run(DELETE_DOCUMENT_NODES_CYPHER, record_ids=changed)
+
+            for record_id, document in documents.items():
+                if record_id not in unchanged:
+                    nodes.extend(document.nodes)
+                    for edge_type, rows in document.relationships.items():
+                        relationships.setdefault(edge_type, []).extend(rows)
+
+                    relationship_count += document.relationship_count
+
+            for batch in batches(nodes, self.batch_size):
+                tx.run(MERGE_NODES_CYPHER, rows=batch)
+
+            for edge_type, rows in relationships.items():
+                for batch in batches(rows, self.batch_size):
+                    tx.run(MERGE_RELATIONSHIPS_CYPHER.format(edge_type), rows=batch)
+
+            document_rows = [{'record_id': r, 'fingerprint': documents[r].fingerprint} for r in changed]
+            for batch in batches(document_rows, self.batch_size):
+                tx.run(MERGE_DOCUMENTS_CYPHER, rows=batch)
+
+            tx.commit()
+        except Exception as e:
+            tx.rollback()
+            logging.error('Neo4J err: {}'.format(e))
+            logging.error('failed to write {} documents'.format(len(documents)))
+            raise e
+
+        self.node_count += len(nodes)
+        self.relationship_count += relationship_count
+        self.skipped_count += len(unchanged)
+
+
+def batches(rows: List[Any], batch_size: int) -> List[List[Any]]:
+    return [rows[i:(i + batch_size)] for i in range(0, len(rows), batch_size)]
+
+
+def get_neo4j_writer() -> Neo4jBatchWriter:
+    """
+    Get the writer shared by the documents written in this process, as
+    connections cannot be shared with forked worker processes.
+
+    :return: writer
+    """
+    global _writer, _writer_pid
+    if _writer is None or _writer_pid != os.getpid():
+        _writer = Neo4jBatchWriter()
+        _writer_pid = os.getpid()
+
+    return _writer
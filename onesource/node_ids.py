@@ -0,0 +1,27 @@
+import hashlib
+from typing import Any, Tuple
+import uuid
+
+
+def get_node_id(record_id: str, position: Tuple[Any, ...]) -> int:
+    """
+    Derive a stable 64-bit id for a content node from the record id of its
+    document and its position in the structure of the document, so that
+    writing a document again gives its nodes the same ids.
+
+    :param record_id: record id of document
+    :param position: position of node, unique within the document
+    :return: signed 64-bit int, to fit a BIGINT column
+    """
+    key = '{}/{}'.format(record_id, '/'.join(str(p) for p in position))
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+def get_random_node_id() -> int:
+    """
+    Get a random 64-bit id for a content node of a document without a record id.
+
+    :return: signed 64-bit int
+    """
+    return uuid.uuid4().int % (1 << 64) - (1 << 63)
@@ -1,48 +1,60 @@
+from collections import deque
+from concurrent.futures import Future, wait
 from contextlib import contextmanager
 from copy import deepcopy
 from datetime import datetime
 import json
+from journal import ControlJournal
 import logging
 from logging import Logger
-from multiprocessing import Process
 import os
-import re
-import psycopg2
-from py2neo import Database, Graph
-from py2neo.data import Node, Relationship
-from py2neo.ogm import GraphObject, Property
-import settings
 import tempfile
 import traceback
-from typing import Any, AnyStr, Dict, IO, Iterator, List, Tuple
-from utils import convert_name_to_underscore
-import uuid
-
-DB_NAME = os.getenv('POSTGRES_DBNAME')
-DB_USER = os.getenv('POSTGRES_USER')
-NEO4J_HOST = os.getenv('NEO4J_HOST')
-NEO4J_USER = os.getenv('NEO4J_USER')
-NEO4J_PASSWORD = os.getenv('NEO4J_PASSWORD')
+from typing import Any, AnyStr, Callable, Dict, IO, Iterator, List, Tuple
+from utils import convert_name_to_underscore, create_fork_pool
+
 HIDDEN_FILE_PREFIXES = ('~', '.')
 
+# Steps hold loaded models and other state that cannot be pickled. Worker
+# processes look them up by key in this registry, which they inherit on fork.
+_registered_steps = {}
+
 
 class AbstractStep(object):
     """
     Interface for step types to implement.
     """
 
-    def __init__(self, name: str, source_key: str = None, overwrite: bool = False, delete: bool = False):
+    def __init__(self,
+                 name: str,
+                 source_key: str = None,
+                 overwrite: bool = False,
+                 delete: bool = False,
+                 persist: bool = True):
         """
 
         :param name: human-readable name of step
         :param source_key: `control_data` key for source list
         :param overwrite: overwrite files flag
         :param delete: delete file after processing flag
+        :param persist: write output when streamed to the next step, output that is
+               not written is recorded with status 'streamed'. Output is always
+               written when the step is not streamed, or is last in a stream.
         """
         self.name = name
         self.__source_key = source_key
         self._overwrite = overwrite
         self._delete = delete
+        self._persist = persist
+
+        # set by the pipeline when files are to be processed in parallel
+        self.worker_pool: 'WorkerPool' = None
+
+        # set by the pipeline to record control info as each file is processed
+        self.journal: ControlJournal = None
+
+        # set by a stream when the output of the step is passed in memory to the next step
+        self.streamed = False
 
     def process_file(self,
                      file: IO[AnyStr],
@@ -53,6 +65,41 @@ class AbstractStep(object):
                      ) -> str:
         raise NotImplementedError
 
+    def load_content(self, file: IO[AnyStr], path: str) -> Any:
+        """
+        Read the content of a file for `process_content`. Override if the step
+        does not read the JSON output of a previous step.
+
+        :param file: file object
+        :param path: path of file
+        :return: content
+        """
+        return json.load(file)
+
+    def process_content(self,
+                        content: Any,
+                        path: str,
+                        control_data: Dict[str, Any],
+                        logger: Logger,
+                        accumulator: Dict[str, Any]
+                        ) -> Tuple[str, Any]:
+        """
+        Implemented by steps that can take their input from the previous step in
+        memory when the pipeline is streaming.
+
+        :param content: output of the previous step, or from `load_content`
+        :param path: path of input
+        :param control_data: data loaded from control file
+        :param logger: Logger
+        :param accumulator: working storage for job control or to accumulate output data
+        :return: output path and content
+        """
+        raise NotImplementedError
+
+    @property
+    def streamable(self) -> bool:
+        return type(self).process_content is not AbstractStep.process_content
+
     @property
     def source_key(self) -> str:
         return self.__source_key
@@ -66,6 +113,19 @@ class AbstractStep(object):
         """
         self.__source_key = source_key
 
+    @property
+    def overwrite(self) -> bool:
+        return self._overwrite
+
+    @property
+    def persist(self) -> bool:
+        # output read from file by the next step must be written
+        return self._persist or not self.streamed
+
+    @property
+    def output_status(self) -> str:
+        return 'processed' if self.persist else 'streamed'
+
     def run(self, control_data: Dict[str, Any], logger: Logger, accumulator: Dict[str, Any]) -> None:
         """
         Must be overridden.
@@ -109,14 +169,56 @@ class InvalidStateException(Exception):
     pass
 
 
+class WorkerPool(object):
+    """
+    Process pool shared by the steps of a pipeline to process files in parallel.
+
+    Worker processes are forked when the first chunk is submitted, so steps must
+    be registered before then.
+    """
+
+    def __init__(self, max_workers: int, chunk_size: int = 16):
+        """
+
+        :param max_workers: number of worker processes
+        :param chunk_size: number of files sent to a worker at a time
+        """
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self.__executor = None
+
+    def submit(self, fn, *args) -> Future:
+        if not self.__executor:
+            self.__executor = create_fork_pool(self.max_workers)
+
+        return self.__executor.submit(fn, *args)
+
+    def shutdown(self) -> None:
+        if self.__executor:
+            self.__executor.shutdown()
+            self.__executor = None
+
+
 class Parallel(AbstractStep):
+    """
+    Runs independent child steps concurrently, each in its own worker process.
+    """
+
+    def __init__(self, name: str = None, source_key: str = None, temp_path: str = None, max_workers: int = None):
+        """
 
-    def __init__(self, name: str = None, source_key: str = None, temp_path: str = None):
+        :param name: human-readable name of step
+        :param source_key: `control_data` key for source list
+        :param temp_path: path to control file
+        :param max_workers: size of the process pool, defaults to the number of child
+               steps; set to 1 to run the child steps in sequence in this process
+        """
         if not name:
             name = 'Parallel execution'
 
         super().__init__(name, source_key)
         self.__temp_path = temp_path
+        self.__max_workers = max_workers
         self.__uninitialized_steps: List[AbstractStep] = []
         self.__initialized_steps: List[AbstractStep] = []
 
@@ -139,6 +241,10 @@ class Parallel(AbstractStep):
     def temp_path(self, temp_path: str) -> None:
         self.__temp_path = temp_path
 
+    @property
+    def max_workers(self) -> int:
+        return self.__max_workers
+
     def add_step(self, step: AbstractStep):
         if step:
             self.__uninitialized_steps.append(step)
@@ -161,29 +267,62 @@ class Parallel(AbstractStep):
         raise NotImplementedError
 
     def run(self, control_data: Dict[str, Any], logger: Logger, accumulator: Dict[str, Any]) -> None:
+        """
+        Run the child steps and merge their control data updates into `control_data`
+        in the order the steps were added, regardless of the order they finish.
+
+        :param control_data: data loaded from control file, updated in place
+        :param logger: Logger
+        :param accumulator: working storage for job control or to accumulate output data
+        :return: None
+        """
         if not self.__temp_path:
             raise InvalidStateException('temp_path not set')
 
-        # for debugging purposes
-        # for step in self.steps:
-        #     control_data = run_step(step, control_data, logger, accumulator, self.__temp_path)
-
-        def __run(s):
-            nonlocal control_data
-            try:
-                control_data = run_step(s, control_data, logger, accumulator, self.__temp_path)
-            except Exception as e:
-                logger.error(e)
-                traceback.print_exc()
-                raise e
-
-        for step in self.steps:
-            __run(step)
-        # processes = [Process(target=__run, args=step) for step in self.steps]
-        # processes = [Process(target=run_step, args=(step, control_data, logger, accumulator, self.temp_path))
-        #              for step in self.steps]
-        # [process.start() for process in processes]
-        # [process.join() for process in processes]  # wait for all parallel steps to finish
+        steps = self.steps
+        step_names = [convert_name_to_underscore(step.name) for step in steps]
+        for step_name in step_names:
+            control_data.update(write_control_file_start(step_name, control_data, self.__temp_path, self.journal))
+
+        keys = [register_step(step) for step in steps]
+        try:
+            if self.__max_workers == 1:
+                # for debugging purposes
+                results = [_run_registered_step(key, control_data, logger.name) for key in keys]
+            else:
+                max_workers = self.__max_workers or len(steps)
+                with create_fork_pool(max_workers) as executor:
+                    futures = [executor.submit(_run_registered_step, key, control_data, logger.name)
+                               for key in keys]
+
+                    # wait for all parallel steps to finish, so the output of steps
+                    # that succeeded is recorded even if another step fails
+                    wait(futures)
+
+                results = []
+                for step, future in zip(steps, futures):
+                    error = future.exception()
+                    if error:
+                        logger.error('Abnormal end %s: %s', step.name, error)
+                        results.append(error)
+                    else:
+                        results.append(future.result())
+        finally:
+            for key in keys:
+                unregister_step(key)
+
+        error = None
+        for step_name, result in zip(step_names, results):
+            if isinstance(result, BaseException):
+                error = error or result
+                continue
+
+            accumulator['files_processed'].extend(result['files_processed'])
+            accumulator['files_output'].extend(result['files_output'])
+            write_control_file(step_name, control_data, result, self.__temp_path, self.journal)
+
+        if error:
+            raise error
 
     def __initialize_steps(self):
         for step in self.__uninitialized_steps:
@@ -199,6 +338,188 @@ class Parallel(AbstractStep):
             self.__initialized_steps.append(step)
 
 
+class Stream(AbstractStep):
+    """
+    Runs a chain of steps over each file in turn, passing the content output by
+    each step directly to the next step instead of through intermediate files.
+
+    Each step records its output under its own name as if run separately, so a
+    job can be resumed whether or not it is streamed.
+    """
+
+    def __init__(self,
+                 steps: List[AbstractStep],
+                 name: str = None,
+                 temp_path: str = None,
+                 source_iter: Callable[[List[str]], Iterator[Tuple[IO[AnyStr], str]]] = None):
+        """
+
+        :param steps: streamable steps, each taking the output of the previous step
+        :param name: human-readable name of step
+        :param temp_path: path to control file
+        :param source_iter: data source iterable of the first step, defaults to `file_iter`
+        """
+        if not name:
+            name = ' -> '.join(step.name for step in steps)
+
+        super().__init__(name, steps[0].source_key, any(step.overwrite for step in steps))
+        self.__steps = steps
+        self.__step_names = [convert_name_to_underscore(step.name) for step in steps]
+        self.__temp_path = temp_path
+        self.__source_iter = source_iter or file_iter
+        for step in steps[:-1]:
+            step.streamed = True
+
+    @property
+    def steps(self) -> List[AbstractStep]:
+        return self.__steps
+
+    @property
+    def temp_path(self) -> str:
+        return self.__temp_path
+
+    @temp_path.setter
+    def temp_path(self, temp_path: str) -> None:
+        self.__temp_path = temp_path
+
+    def process_file(self,
+                     file: IO[AnyStr],
+                     path: str,
+                     control_data: Dict[str, Any],
+                     logger: Logger,
+                     accumulator: Dict[str, Any]
+                     ) -> str:
+        logger.debug('stream file: {}'.format(path))
+        content = self.__steps[0].load_content(file, path)
+        for step, step_name in zip(self.__steps, self.__step_names):
+            step_accumulator = {
+                'files_processed': accumulator['files_processed'],
+                'files_output': accumulator[step_name]
+            }
+            path, content = step.process_content(content, path, control_data, logger, step_accumulator)
+
+        return path
+
+    def run(self, control_data: Dict[str, Any], logger: Logger, accumulator: Dict[str, Any]) -> None:
+        """
+        Stream each file through the steps. A file is skipped if every step has
+        recorded output for it, unless a step overwrites.
+
+        :param control_data: data loaded from control file, updated in place
+        :param logger: Logger
+        :param accumulator: working storage for job control or to accumulate output data
+        :return: None
+        """
+        step_names = self.__step_names
+        outputs_by_input = []
+        for step_name in step_names:
+            control_data.update(write_control_file_start(step_name, control_data, self.__temp_path, self.journal))
+            accumulator[step_name] = []
+            outputs_by_input.append({x['input']: x for x in control_data.get(step_name, [])
+                                     if x['status'] in ('processed', 'streamed')})
+
+        file_paths = []
+        for path in [x['path'] for x in control_data[self.source_key]]:
+            # follow the output of each step to the input of the next
+            outputs = []
+            input_path = path
+            for step_outputs in outputs_by_input:
+                if input_path not in step_outputs:
+                    break
+
+                outputs.append(step_outputs[input_path])
+                input_path = step_outputs[input_path]['path']
+
+            if self.overwrite or len(outputs) < len(step_names):
+                file_paths.append(path)
+            else:
+                for step_name, output in zip(step_names, outputs):
+                    accumulator[step_name].append(output)
+
+        try:
+            for _ in process_files(self, self.__source_iter, file_paths, control_data, logger, accumulator):
+                self.__write_control_files(control_data, accumulator)
+        finally:
+            self.__write_control_files(control_data, accumulator)
+
+    def __write_control_files(self, control_data: Dict[str, Any], accumulator: Dict[str, Any]) -> None:
+        for i, step_name in enumerate(self.__step_names):
+            write_control_file(step_name, control_data, {
+                # files processed are already journaled by `process_files`
+                'files_processed': [] if self.journal or i else accumulator['files_processed'],
+                'files_output': accumulator[step_name]
+            }, self.__temp_path, self.journal)
+
+
+def create_streams(steps: List[AbstractStep]) -> List[AbstractStep]:
+    """
+    Replace each run of streamable steps, where each step takes the output of the
+    step before, with a `Stream` of those steps.
+
+    :param steps: pipeline steps
+    :return: pipeline steps
+    """
+    result = []
+    chain = []
+    for step in steps + [None]:
+        if step and chain and step.streamable and step.source_key == convert_name_to_underscore(chain[-1].name):
+            chain.append(step)
+            continue
+
+        if len(chain) > 1:
+            result.append(Stream(chain))
+        else:
+            result.extend(chain)
+
+        chain = []
+        if step and step.streamable:
+            chain.append(step)
+        elif step:
+            result.append(step)
+
+    return result
+
+
+def register_step(step: AbstractStep) -> int:
+    """
+    Make a step available to worker processes forked after this call.
+
+    :param step: pipeline step
+    :return: registry key
+    """
+    key = id(step)
+    _registered_steps[key] = step
+    return key
+
+
+def unregister_step(key: int) -> None:
+    _registered_steps.pop(key, None)
+
+
+def _run_registered_step(key: int, control_data: Dict[str, Any], logger_name: str) -> Dict[str, Any]:
+    """
+    Run a registered step with its own accumulator. Called in a worker process.
+
+    :param key: registry key of step
+    :param control_data: data loaded from control file
+    :param logger_name: name of logger, as loggers cannot be pickled
+    :return: accumulated control info of the step
+    """
+    step = _registered_steps[key]
+    logger = logging.getLogger(logger_name)
+    accumulator = {
+        'files_processed': [],
+        'files_output': []
+    }
+    with logged_decorator(logger, step.name):
+        step.run(control_data, logger, accumulator)
+
+    return {
+        'files_processed': accumulator['files_processed'],
+        'files_output': accumulator['files_output']
+    }
+
+
 class Pipeline(object):
     """
     Executes a sequence of steps in a job.
@@ -208,18 +529,29 @@ class Pipeline(object):
                  control_data: Dict[str, Any],
                  logger: Logger = logging.getLogger(),
                  temp_path: str = None,
-                 overwrite: bool = False):
+                 overwrite: bool = False,
+                 max_workers: int = None,
+                 chunk_size: int = 16,
+                 streaming: bool = False):
         """
 
         :param control_data: data loaded from control file, passed to each step
         :param logger: Logger
         :param temp_path: path to directory to write control files
         :param overwrite: overwrite files flag
+        :param max_workers: number of worker processes used by each step to process
+               files in parallel, files are processed in this process if not > 1
+        :param chunk_size: number of files sent to a worker process at a time
+        :param streaming: pass content in memory between consecutive steps that
+               support it, instead of through intermediate files
         """
         self.__control_data = control_data
         self.__logger = logger
         self.__temp_path = temp_path
         self.__overwrite = overwrite
+        self.__max_workers = max_workers
+        self.__chunk_size = chunk_size
+        self.__streaming = streaming
         self.__steps: List[AbstractStep] = []
 
     def __call__(self, steps: List[AbstractStep]):
@@ -247,10 +579,18 @@ class Pipeline(object):
         control_data = self.__control_data
         logger = self.__logger
         temp_path = self.__temp_path
+        steps = create_streams(self.__steps) if self.__streaming else self.__steps
+        worker_pool = self.__start_worker_pool(steps)
+        journal = None
+        if control_data:
+            journal = ControlJournal(temp_path or get_temp_path(control_data['job']['read_root_dir']), control_data)
+
+        for step in steps:
+            step.journal = journal
 
         # noinspection PyBroadException
         try:
-            for step in self.__steps:
+            for step in steps:
                 files_processed = []
                 files_output = []
 
@@ -260,7 +600,7 @@ class Pipeline(object):
                     'files_output': files_output
                 }
 
-                if isinstance(step, Parallel):
+                if isinstance(step, (Parallel, Stream)):
                     if not step.temp_path:
                         step.temp_path = temp_path
 
@@ -269,18 +609,48 @@ class Pipeline(object):
                 else:
                     # as control_data is mutated within the context manager's scope,
                     # it must be returned or else changes to it is lost
-                    control_data = run_step(step, control_data, logger, accumulator, temp_path)
+                    control_data = run_step(step, control_data, logger, accumulator, temp_path, journal)
 
-            write_control_file_end(control_data, temp_path)
+            write_control_file_end(control_data, temp_path, journal=journal)
 
         except Exception as e:
             # logger.error(e)
             # traceback.print_exc()
 
-            write_control_file_end(control_data, temp_path, e)
+            write_control_file_end(control_data, temp_path, e, journal)
             # we've already logged so exit gracefully
             pass
 
+        finally:
+            if worker_pool:
+                self.__stop_worker_pool(worker_pool, steps)
+
+            for step in steps:
+                step.journal = None
+                if isinstance(step, Stream):
+                    for stream_step in step.steps:
+                        stream_step.streamed = False
+
+    def __start_worker_pool(self, steps: List[AbstractStep]):
+        if not self.__max_workers or self.__max_workers < 2:
+            return None
+
+        # steps of a parallel step already run in their own processes
+        worker_pool = WorkerPool(self.__max_workers, self.__chunk_size)
+        for step in steps:
+            if not isinstance(step, Parallel):
+                register_step(step)
+                step.worker_pool = worker_pool
+
+        return worker_pool
+
+    def __stop_worker_pool(self, worker_pool: WorkerPool, steps: List[AbstractStep]) -> None:
+        worker_pool.shutdown()
+        for step in steps:
+            if step.worker_pool is worker_pool:
+                unregister_step(id(step))
+                step.worker_pool = None
+
 
 # Using context managers to implement orthogonal concerns of running a step
 # e.g. logging step execution, and tracking progress - a kind of aspect-
@@ -310,19 +680,21 @@ def logged_decorator(logger: Logger, step_name: str):
 def tracked_decorator(step_name: str,
                       control_data: Dict[str, Any],
                       accumulator: Dict[str, Any],
-                      temp_path: str):
+                      temp_path: str,
+                      journal: ControlJournal = None):
     """
 
     :param step_name: name of pipeline step in underscore format
     :param control_data: data loaded from the control file
     :param accumulator: working storage for job control or to accumulate output data
     :param temp_path: path to temp dir
+    :param journal: optional journal of control data
     :return:
     """
     try:
         yield
     finally:
-        write_control_file(step_name, control_data, accumulator, temp_path)
+        write_control_file(step_name, control_data, accumulator, temp_path, journal)
 
 
 def file_iter(file_paths: List[str]) -> Iterator[Tuple[IO[AnyStr], str]]:
@@ -331,6 +703,153 @@ def file_iter(file_paths: List[str]) -> Iterator[Tuple[IO[AnyStr], str]]:
             yield file, path
 
 
+def process_files(step: AbstractStep,
+                  source_iter: Callable[[List[str]], Iterator[Tuple[IO[AnyStr], str]]],
+                  file_paths: List[str],
+                  control_data: Dict[str, Any],
+                  logger: Logger,
+                  accumulator: Dict[str, Any],
+                  processed_file_paths: Dict[str, Dict[str, Any]] = None,
+                  max_file_count: int = None
+                  ) -> Iterator[Tuple[str, Any]]:
+    """
+    Call `step.process_file` for each file, yielding the path and result of each
+    processed file in input order.
+
+    A file in `processed_file_paths` is skipped unless the step overwrites, and its
+    previous output is recorded again in `accumulator['files_output']`.
+
+    If the step has a journal, the control info accumulated for each file is
+    journaled as soon as the file is processed.
+
+    If the step has a worker pool, files are processed in chunks by worker processes.
+    Each file then gets its own accumulator in the worker, of which the list values
+    are appended to the lists of `accumulator` in input order. Workers receive only
+    the `job` entry of `control_data`, and `source_iter` must be picklable.
+
+    :param step: pipeline step
+    :param source_iter: data source iterable
+    :param file_paths: paths of files to process
+    :param control_data: data loaded from control file
+    :param logger: Logger
+    :param accumulator: working storage for job control or to accumulate output data
+    :param processed_file_paths: output info by input path from a previous run
+    :param max_file_count: stop after processing more than this number of files
+    :return: iterator of path and result of `process_file`
+    """
+    processed_file_paths = processed_file_paths or {}
+    step_name = convert_name_to_underscore(step.name)
+    journal = step.journal
+    worker_pool = step.worker_pool
+    if not worker_pool:
+        file_count = 0
+        for file, path in source_iter(file_paths):
+            if not step.overwrite and path in processed_file_paths:
+                accumulator['files_output'].append(processed_file_paths[path])
+                continue
+
+            if max_file_count is not None and file_count > max_file_count:
+                break
+
+            result = step.process_file(file, path, control_data, logger, accumulator)
+            file_count += 1
+            if journal:
+                journal.sync(step_name, accumulator)
+
+            yield path, result
+
+        return
+
+    key = id(step)
+    job_data = {'job': control_data['job']}
+    list_keys = [k for k, v in accumulator.items() if isinstance(v, list)]
+
+    # futures of submitted chunks, and output info of skipped files, in input order
+    pending = deque()
+
+    def submit(chunk_paths):
+        pending.append(worker_pool.submit(_process_registered_chunk, key, source_iter, chunk_paths,
+                                          job_data, logger.name, list_keys))
+
+    def merge(item):
+        if isinstance(item, Future):
+            for path_, result_, a in item.result():
+                for k in list_keys:
+                    accumulator[k].extend(a[k])
+
+                if journal:
+                    journal.sync(step_name, accumulator)
+
+                yield path_, result_
+        else:
+            accumulator['files_output'].append(item)
+
+    try:
+        chunk = []
+        file_count = 0
+        for path in file_paths:
+            if not step.overwrite and path in processed_file_paths:
+                if chunk:
+                    submit(chunk)
+                    chunk = []
+
+                pending.append(processed_file_paths[path])
+                continue
+
+            if max_file_count is not None and file_count > max_file_count:
+                break
+
+            chunk.append(path)
+            file_count += 1
+            if len(chunk) == worker_pool.chunk_size:
+                submit(chunk)
+                chunk = []
+
+            # bound the number of chunks in flight
+            while len(pending) > 2 * worker_pool.max_workers:
+                yield from merge(pending.popleft())
+
+        if chunk:
+            submit(chunk)
+
+        while pending:
+            yield from merge(pending.popleft())
+
+    finally:
+        for item in pending:
+            if isinstance(item, Future):
+                item.cancel()
+
+
+def _process_registered_chunk(key: int,
+                              source_iter: Callable[[List[str]], Iterator[Tuple[IO[AnyStr], str]]],
+                              file_paths: List[str],
+                              control_data: Dict[str, Any],
+                              logger_name: str,
+                              list_keys: List[str]
+                              ) -> List[Tuple[str, Any, Dict[str, List[Any]]]]:
+    """
+    Process a chunk of files with a registered step. Called in a worker process.
+
+    :param key: registry key of step
+    :param source_iter: data source iterable
+    :param file_paths: paths of files to process
+    :param control_data: job entry of control data
+    :param logger_name: name of logger, as loggers cannot be pickled
+    :param list_keys: accumulator keys of lists to return
+    :return: list of path, result of `process_file` and accumulated lists for each file
+    """
+    step = _registered_steps[key]
+    logger = logging.getLogger(logger_name)
+    results = []
+    for file, path in source_iter(file_paths):
+        accumulator = {k: [] for k in list_keys}
+        result = step.process_file(file, path, control_data, logger, accumulator)
+        results.append((path, result, {k: accumulator[k] for k in list_keys}))
+
+    return results
+
+
 def json_output_handler(output_path: str, content: Dict[str, Any]) -> None:
     """
     Write output from step
@@ -393,358 +912,52 @@ def database_output_handler(output_path: str, content: Dict[str, Any], overwrite
     """
     Write text output from step.
 
+    Nodes and edges are written in one transaction per document, over a
+    connection kept by the process.
+
     :param output_path: path to output file
     :param content: JSON content
     :param overwrite: (bool) overwrite file contents if true otherwise append to file
     :return:
     """
-    conn = psycopg2.connect('dbname={} user={}'.format(DB_NAME, DB_USER))
-    cur = conn.cursor()
-    data = content['structured_content']
-    prev_item = None
-    prev_heading = None
-    links = {}
-    for item in data:
-        node_type = item['type']
-        if node_type in ['text', 'heading', 'link']:
-            node_text = item['text']
-            node_id = insert_node(cur, node_text, node_type, item.get('url', None), item.get('is_question', None))
-            if prev_item:
-                insert_edge(cur, prev_item['node_id'], node_id, 'before')
-                insert_edge(cur, node_id, prev_item['node_id'], 'after')
-
-            prev_item = dict(item, node_id=node_id)
-            if node_type == 'heading':
-                prev_heading = prev_item
-            elif prev_heading:
-                insert_edge(cur, node_id, prev_heading['node_id'], 'has_heading')
-
-            if node_type == 'link':
-                links[node_text] = item
-            else:
-                found_links = re.findall(r'\[\[(.*?)\]\]', node_text)
-                for link in found_links:
-                    if link[0] in links:
-                        insert_edge(cur, node_id, links[link[0]]['node_id'], 'has_link')
-
-        elif node_type == 'list':
-            list_node_id = insert_node(cur, None, 'list', None, None)
-            if prev_item:
-                insert_edge(cur, prev_item['node_id'], list_node_id, 'before')
-                insert_edge(cur, list_node_id, prev_item['node_id'], 'after')
-
-            if prev_heading:
-                insert_edge(cur, list_node_id, prev_heading['node_id'], 'has_heading')
-
-            prev_item = dict(item, node_id=list_node_id)
-
-            prev_list_item = None
-            for i, list_item in enumerate(item['items']):
-                list_item_node_id = insert_node(cur, list_item, 'list_item', None, item.get('is_question', None), i)
-                insert_edge(cur, list_item_node_id, list_node_id, 'item_of')
-                if prev_list_item:
-                    insert_edge(cur, prev_list_item['node_id'], list_item_node_id, 'before')
-                    insert_edge(cur, list_item_node_id, prev_list_item['node_id'], 'after')
-
-                prev_list_item = dict(node_id=list_item_node_id)
-                found_links = re.findall(r'\[\[(.*?)\]\]', list_item)
-                for link in found_links:
-                    if link[0] in links:
-                        insert_edge(cur, list_item_node_id, links[link[0]]['node_id'], 'has_link')
-
-        elif node_type == 'table':
-            table_node_id = insert_node(cur, None, 'table', None, None)
-            if prev_item:
-                insert_edge(cur, prev_item['node_id'], table_node_id, 'before')
-                insert_edge(cur, table_node_id, prev_item['node_id'], 'after')
-
-            if prev_heading:
-                insert_edge(cur, table_node_id, prev_heading['node_id'], 'has_heading')
-
-            prev_item = dict(item, node_id=table_node_id)
-
-            prev_row = None
-            prev_cell = None
-            row_node_id = None
-            for i, head_cell in enumerate(item['head']):
-                if isinstance(head_cell, list):
-                    row_node_id = insert_node(cur, None, 'table_head_row', None, None, i)
-                    insert_edge(cur, row_node_id, table_node_id, 'head_row_of')
-                    if prev_row:
-                        insert_edge(cur, prev_row['node_id'], row_node_id, 'before')
-                        insert_edge(cur, row_node_id, prev_row['node_id'], 'after')
-
-                    prev_row = dict(node_id=row_node_id)
-
-                    prev_cell = None
-                    for j, cell in enumerate(head_cell):
-                        cell_node_id = insert_node(cur, cell, 'table_head_cell', None, item.get('is_question', None), j)
-                        insert_edge(cur, cell_node_id, row_node_id, 'cell_of')
-                        if prev_cell:
-                            insert_edge(cur, prev_cell['node_id'], cell_node_id, 'before')
-                            insert_edge(cur, cell_node_id, prev_cell['node_id'], 'after')
-
-                        prev_cell = dict(node_id=cell_node_id)
-
-                else:
-                    if not row_node_id:
-                        row_node_id = insert_node(cur, None, 'table_head_row', None, None)
-                        insert_edge(cur, row_node_id, table_node_id, 'head_row_of')
-                        if prev_row:
-                            insert_edge(cur, prev_row['node_id'], row_node_id, 'before')
-                            insert_edge(cur, row_node_id, prev_row['node_id'], 'after')
-
-                    cell_node_id = insert_node(cur, head_cell, 'table_head_cell', None, item.get('is_question', None),
-                                               i)
-                    insert_edge(cur, cell_node_id, row_node_id, 'cell_of')
-                    if prev_cell:
-                        insert_edge(cur, prev_cell['node_id'], cell_node_id, 'before')
-                        insert_edge(cur, cell_node_id, prev_cell['node_id'], 'after')
-
-                    prev_cell = dict(node_id=cell_node_id)
-
-            prev_row = None
-            for i, row in enumerate(item['body']):
-                row_node_id = insert_node(cur, None, 'table_body_row', None, None, i)
-                insert_edge(cur, row_node_id, table_node_id, 'body_row_of')
-                if prev_row:
-                    insert_edge(cur, prev_row['node_id'], row_node_id, 'before')
-                    insert_edge(cur, row_node_id, prev_row['node_id'], 'after')
-
-                prev_row = dict(node_id=row_node_id)
-
-                prev_cell = None
-                for j, cell in enumerate(row):
-                    cell_node_id = insert_node(cur, cell, 'table_body_cell', None, item.get('is_question', None), j)
-                    insert_edge(cur, cell_node_id, row_node_id, 'cell_of')
-                    if prev_cell:
-                        insert_edge(cur, prev_cell['node_id'], cell_node_id, 'before')
-                        insert_edge(cur, cell_node_id, prev_cell['node_id'], 'after')
-
-                    prev_cell = dict(node_id=cell_node_id)
-
-    conn.commit()
-    cur.close()
-    conn.close()
-
-
-class ContentNode(GraphObject):
-    node_id = Property()
-    node_type = Property()
-    node_text = Property()
-    url = Property()
-    is_question = Property()
-    seq_index = Property()
-
-
-BEFORE = Relationship.type('before')
-AFTER = Relationship.type('after')
-HAS_HEADING = Relationship.type('has_heading')
-HAS_LINK = Relationship.type('has_link')
-ITEM_OF = Relationship.type('member_of')
-CELL_OF = Relationship.type('cell_of')
-HEAD_ROW_OF = Relationship.type('head_row_of')
-BODY_ROW_OF = Relationship.type('body_row_of')
+    # imported when used, so that the pipeline does not load database drivers
+    from postgres_writer import get_postgres_writer
+    writer = get_postgres_writer()
+    writer.write(content)
+    writer.flush()
 
 
 def neo4j_output_handler(output_path: str, content: Dict[str, Any], overwrite: bool = False) -> None:
     """
     Write text output from step.
 
+    Nodes and relationships are written in one transaction per document, over
+    a connection kept by the process.
+
     :param output_path: path to output file
     :param content: JSON content
     :param overwrite: (bool) overwrite file contents if true otherwise append to file
     :return:
     """
-    graph = Graph(NEO4J_HOST, auth=(NEO4J_USER, NEO4J_PASSWORD))
-    data = content['structured_content']
-    prev_item = None
-    prev_heading = None
-    links = {}
-    for item in data:
-        node_type = item['type']
-        if node_type in ['text', 'heading', 'link']:
-            node_text = item['text']
-            node = insert_neo4j_node(graph, node_text, node_type, item.get('url', None), item.get('is_question', None))
-            if prev_item:
-                insert_neo4j_edge(graph, prev_item, node, 'before')
-                insert_neo4j_edge(graph, node, prev_item, 'after')
-
-            prev_item = node
-            if node_type == 'heading':
-                prev_heading = prev_item
-            elif prev_heading:
-                insert_neo4j_edge(graph, node, prev_heading, 'has_heading')
-
-            if node_type == 'link':
-                links[node_text] = item
-            else:
-                found_links = re.findall(r'\[\[(.*?)\]\]', node_text)
-                for link in found_links:
-                    if link[0] in links:
-                        insert_neo4j_edge(graph, node, links[link[0]], 'has_link')
-
-        elif node_type == 'list':
-            list_node = insert_neo4j_node(graph, None, 'list', None, None)
-            if prev_item:
-                insert_neo4j_edge(graph, prev_item, list_node, 'before')
-                insert_neo4j_edge(graph, list_node, prev_item, 'after')
-
-            if prev_heading:
-                insert_neo4j_edge(graph, list_node, prev_heading, 'has_heading')
-
-            prev_item = list_node
-
-            prev_list_item = None
-            for i, list_item in enumerate(item['items']):
-                list_item_node = insert_neo4j_node(graph, list_item, 'list_item', None, item.get('is_question', None), i)
-                insert_neo4j_edge(graph, list_item_node, list_node, 'item_of')
-                if prev_list_item:
-                    insert_neo4j_edge(graph, prev_list_item, list_item_node, 'before')
-                    insert_neo4j_edge(graph, list_item_node, prev_list_item, 'after')
-
-                prev_list_item = list_item_node
-                found_links = re.findall(r'\[\[(.*?)\]\]', list_item)
-                for link in found_links:
-                    if link[0] in links:
-                        insert_neo4j_edge(graph, list_item_node, links[link[0]], 'has_link')
-
-        elif node_type == 'table':
-            table_node = insert_neo4j_node(graph, None, 'table', None, None)
-            if prev_item:
-                insert_neo4j_edge(graph, prev_item, table_node, 'before')
-                insert_neo4j_edge(graph, table_node, prev_item, 'after')
-
-            if prev_heading:
-                insert_neo4j_edge(graph, table_node, prev_heading, 'has_heading')
-
-            prev_item = table_node
-
-            prev_row = None
-            prev_cell = None
-            row_node = None
-            for i, head_cell in enumerate(item['head']):
-                if isinstance(head_cell, list):
-                    row_node = insert_neo4j_node(graph, None, 'table_head_row', None, None, i)
-                    insert_neo4j_edge(graph, row_node, table_node, 'head_row_of')
-                    if prev_row:
-                        insert_neo4j_edge(graph, prev_row, row_node, 'before')
-                        insert_neo4j_edge(graph, row_node, prev_row, 'after')
-
-                    prev_row = row_node
-
-                    prev_cell = None
-                    for j, cell in enumerate(head_cell):
-                        cell_node = insert_neo4j_node(graph, cell, 'table_head_cell', None, item.get('is_question', None), j)
-                        insert_neo4j_edge(graph, cell_node, row_node, 'cell_of')
-                        if prev_cell:
-                            insert_neo4j_edge(graph, prev_cell, cell_node, 'before')
-                            insert_neo4j_edge(graph, cell_node, prev_cell, 'after')
-
-                        prev_cell = cell_node
-
-                else:
-                    if not row_node:
-                        row_node = insert_neo4j_node(graph, None, 'table_head_row', None, None)
-                        insert_neo4j_edge(graph, row_node, table_node, 'head_row_of')
-                        if prev_row:
-                            insert_neo4j_edge(graph, prev_row, row_node, 'before')
-                            insert_neo4j_edge(graph, row_node, prev_row, 'after')
-
-                    cell_node = insert_neo4j_node(graph, head_cell, 'table_head_cell', None, item.get('is_question', None), i)
-                    insert_neo4j_edge(graph, cell_node, row_node, 'cell_of')
-                    if prev_cell:
-                        insert_neo4j_edge(graph, prev_cell, cell_node, 'before')
-                        insert_neo4j_edge(graph, cell_node, prev_cell, 'after')
-
-                    prev_cell = cell_node
-
-            prev_row = None
-            for i, row in enumerate(item['body']):
-                row_node = insert_neo4j_node(graph, None, 'table_body_row', None, None, i)
-                insert_neo4j_edge(graph, row_node, table_node, 'body_row_of')
-                if prev_row:
-                    insert_neo4j_edge(graph, prev_row, row_node, 'before')
-                    insert_neo4j_edge(graph, row_node, prev_row, 'after')
-
-                prev_row = row_node
-
-                prev_cell = None
-                for j, cell in enumerate(row):
-                    cell_node = insert_neo4j_node(graph, cell, 'table_body_cell', None, item.get('is_question', None), j)
-                    insert_neo4j_edge(graph, cell_node, row_node, 'cell_of')
-                    if prev_cell:
-                        insert_neo4j_edge(graph, prev_cell, cell_node, 'before')
-                        insert_neo4j_edge(graph, cell_node, prev_cell, 'after')
-
-                    prev_cell = cell_node
-
-
-def insert_node(cur, node_text, node_type, url, is_question, seq_index=0):
-    node_id = str(uuid.uuid4())
-    try:
-        cur.execute('INSERT INTO content_node(node_id, node_text, node_type, url, is_question, seq_index) '
-                    'VALUES (%s, %s, %s, %s, %s, %s)', (node_id, node_text, node_type, url, is_question, seq_index))
-    except Exception as e:
-        logging.error('DB err: {}'.format(e))
-        logging.error('node_id={}, node_text={}, node_type={}, url={}, is_question={}, seq_index={}'
-                      .format(node_id, node_text, node_type, url, is_question, seq_index))
-        raise e
-
-    return node_id
-
-
-def insert_edge(cur, node_id1, node_id2, edge_type):
-    try:
-        cur.execute('INSERT INTO content_edge(node_id1, node_id2, edge_type) VALUES (%s, %s, %s)',
-                    (node_id1, node_id2, edge_type))
-    except Exception as e:
-        logging.error('DB err: {}'.format(e))
-        logging.error('node_id1={}, node_id2={}, edge_type={}'.format(node_id1, node_id2, edge_type))
-        raise e
-
-
-def insert_neo4j_node(graph, node_text, node_type, url, is_question, seq_index=0):
-    node_id = str(uuid.uuid4())
-    try:
-        node = Node(node_id,
-                    node_type=node_type,
-                    node_text=node_text,
-                    url=url,
-                    is_question=is_question,
-                    seq_index=seq_index)
-        graph.create(node)
-    except Exception as e:
-        logging.error('Neo4J err: {}'.format(e))
-        logging.error('node_id={}, node_text={}, node_type={}, url={}, is_question={}, seq_index={}'
-                      .format(node_id, node_text, node_type, url, is_question, seq_index))
-        raise e
+    from neo4j_writer import get_neo4j_writer
+    writer = get_neo4j_writer()
+    writer.write(content)
+    writer.flush()
 
-    return node
 
-
-def insert_neo4j_edge(graph, node1, node2, edge_type):
-    try:
-        rel = Relationship(node1, edge_type, node2)
-        graph.create(rel)
-    except Exception as e:
-        logging.error('Neo4J err: {}'.format(e))
-        logging.error('node_id1={}, node_id2={}, edge_type={}'.format(node1, node2, edge_type))
-        raise e
-
-    return rel
-
-
-def get_temp_path(read_root_dir: str) -> str:
+def get_temp_path(read_root_dir: str, temp_dir: str = None) -> str:
     """
     Derive path of control file from location of input files.
     Each control file corresponds to a unique input location.
 
     :param read_root_dir: location of input files
+    :param temp_dir: dir of control files, defaults to the temp dir of the system
     :return: location of control file
     """
     control_filename = os.path.abspath(read_root_dir).replace('/', '-')[1:]
-    temp_dir = tempfile.gettempdir()
+    if not temp_dir:
+        temp_dir = tempfile.gettempdir()
+
     return os.path.join(temp_dir, control_filename + '.json')
 
 
@@ -752,13 +965,14 @@ def run_step(step: AbstractStep,
              control_data: Dict[str, Any],
              logger: Logger,
              accumulator: Dict[str, Any],
-             temp_path: str
+             temp_path: str,
+             journal: ControlJournal = None
              ) -> Dict[str, Any]:
     step_name = convert_name_to_underscore(step.name)
-    control_data = write_control_file_start(step_name, control_data, temp_path)
+    control_data = write_control_file_start(step_name, control_data, temp_path, journal)
 
     logged = logged_decorator(logger, step.name)
-    tracked = tracked_decorator(step_name, control_data, accumulator, temp_path)
+    tracked = tracked_decorator(step_name, control_data, accumulator, temp_path, journal)
 
     with logged, tracked:
         # noinspection PyBroadException
@@ -776,7 +990,8 @@ def run_step(step: AbstractStep,
 
 def write_control_file_start(step_name: str,
                              control_data: Dict[str, Any],
-                             temp_path: str = None
+                             temp_path: str = None,
+                             journal: ControlJournal = None
                              ) -> Dict[str, Any]:
     """
     Update control file for start of step.
@@ -784,11 +999,16 @@ def write_control_file_start(step_name: str,
     :param step_name: name of pipeline step in underscore format
     :param control_data: data loaded from current control file
     :param temp_path: output location of control file
+    :param journal: optional journal of control data, which updates `control_data` in place
     :return: updated control data
     """
     if not control_data:
         return {}
 
+    if journal:
+        journal.step_started(step_name)
+        return control_data
+
     if not temp_path:
         temp_path = get_temp_path(control_data['job']['read_root_dir'])
 
@@ -809,7 +1029,8 @@ def write_control_file_start(step_name: str,
 def write_control_file(step_name: str,
                        control_data: Dict[str, Any],
                        accumulator: Dict[str, Any],
-                       temp_path: str = None
+                       temp_path: str = None,
+                       journal: ControlJournal = None
                        ) -> Dict[str, Any]:
     """
     Write job control data at current moment to a file at `temp_path`.
@@ -818,11 +1039,17 @@ def write_control_file(step_name: str,
     :param control_data: data loaded from current control file
     :param accumulator: working storage for job control or to accumulate output data
     :param temp_path: output location of control file
+    :param journal: optional journal of control data, which only appends the
+           control info accumulated since the last sync
     :return: updated control data
     """
     if not control_data:
         return {}
 
+    if journal:
+        journal.sync(step_name, accumulator)
+        return control_data
+
     if not temp_path:
         temp_path = get_temp_path(control_data['job']['read_root_dir'])
 
@@ -856,7 +1083,8 @@ def write_control_file(step_name: str,
 
 def write_control_file_end(control_data: Dict[str, Any],
                            temp_path: str = None,
-                           error: Exception = None
+                           error: Exception = None,
+                           journal: ControlJournal = None
                            ) -> Dict[str, Any]:
     """
     Write job control data at end of job.
@@ -864,11 +1092,22 @@ def write_control_file_end(control_data: Dict[str, Any],
     :param control_data: data loaded from current control file
     :param temp_path: output location of control file
     :param error: optional exception object
+    :param journal: optional journal of control data, which is compacted into the control file
     :return: updated control data
     """
     if not control_data:
         return {}
 
+    if journal:
+        now = datetime.utcnow().isoformat()
+        if error:
+            journal.job_updated(end=now, status='error', message=repr(error))
+        else:
+            journal.job_updated(end=now, status='processed')
+
+        journal.compact()
+        return control_data
+
     if not temp_path:
         temp_path = get_temp_path(control_data['job']['read_root_dir'])
 
@@ -0,0 +1,344 @@
+from collections import OrderedDict
+from content_graph import add_content_graph, get_content_fingerprint
+from io import StringIO
+import logging
+from node_ids import get_node_id, get_random_node_id
+import os
+from psycopg2.pool import ThreadedConnectionPool
+import settings
+from typing import Any, Dict, List, Optional, Tuple
+
+DB_NAME = os.getenv('POSTGRES_DBNAME')
+DB_USER = os.getenv('POSTGRES_USER')
+
+# maximum number of connections in the pool of each process
+MAX_CONNECTIONS = 4
+
+# number of buffered nodes and edges after which a write is flushed
+DEFAULT_MAX_ROWS = 100000
+
+NODE_COLUMNS = ('node_id', 'node_text', 'node_type', 'url', 'is_question', 'seq_index', 'record_id')
+
+EDGE_COLUMNS = ('node_id1', 'node_id2', 'edge_type')
+
+DOCUMENT_COLUMNS = ('record_id', 'fingerprint')
+
+# nodes are keyed by ids derived from their document and position, and edges
+# by their nodes and type, so that writing a document again replaces its graph.
+# The fingerprint of each document is kept to skip documents that are unchanged.
+# Tables created before node ids were derived have uuid text ids and no record
+# id. Their ids are converted to BIGINT by hashing, which keeps their edges, and
+# the record id column is added. Their rows keep a NULL record id, so they are
+# not replaced when their documents are written again.
+CREATE_TABLES_SQL = """
+-- workers of a job may create the tables at the same time
+SELECT pg_advisory_xact_lock(1701736302);
+CREATE TABLE IF NOT EXISTS content_node (
+    node_id BIGINT PRIMARY KEY,
+    node_text TEXT,
+    node_type VARCHAR(32) NOT NULL,
+    url TEXT,
+    is_question BOOLEAN,
+    seq_index INTEGER,
+    record_id TEXT
+);
+CREATE TABLE IF NOT EXISTS content_edge (
+    node_id1 BIGINT NOT NULL,
+    node_id2 BIGINT NOT NULL,
+    edge_type VARCHAR(32) NOT NULL,
+    PRIMARY KEY (node_id1, node_id2, edge_type)
+);
+CREATE TABLE IF NOT EXISTS content_document (
+    record_id TEXT PRIMARY KEY,
+    fingerprint CHAR(64) NOT NULL
+);
+DO $$
+BEGIN
+    IF (SELECT data_type FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'content_node' AND column_name = 'node_id'
+        ) <> 'bigint' THEN
+        ALTER TABLE content_node
+            ALTER COLUMN node_id TYPE BIGINT USING ('x' || left(md5(node_id::text), 16))::bit(64)::bigint;
+        ALTER TABLE content_edge
+            ALTER COLUMN node_id1 TYPE BIGINT USING ('x' || left(md5(node_id1::text), 16))::bit(64)::bigint,
+            ALTER COLUMN node_id2 TYPE BIGINT USING ('x' || left(md5(node_id2::text), 16))::bit(64)::bigint;
+        CREATE UNIQUE INDEX IF NOT EXISTS content_node_node_id_idx ON content_node(node_id);
+        CREATE UNIQUE INDEX IF NOT EXISTS content_edge_key_idx ON content_edge(node_id1, node_id2, edge_type);
+    END IF;
+END $$;
+ALTER TABLE content_node ADD COLUMN IF NOT EXISTS record_id TEXT;
+CREATE INDEX IF NOT EXISTS content_node_record_id_idx ON content_node(record_id);
+"""
+
+SELECT_FINGERPRINTS_SQL = 'SELECT record_id, fingerprint FROM content_document WHERE record_id = ANY(%s)'
+
+# edges are deleted by their first node, which is always in the same document
+DELETE_EDGES_SQL = ('DELETE FROM content_edge e USING content_node n '
+                    'WHERE e.node_id1 = n.node_id AND n.record_id = ANY(%s)')
+
+DELETE_NODES_SQL = 'DELETE FROM content_node WHERE record_id = ANY(%s)'
+
+# COPY cannot upsert, so rows are copied to a temporary table then inserted
+CREATE_LOAD_TABLES_SQL = ('CREATE TEMP TABLE content_node_load (LIKE content_node) ON COMMIT DROP; '
+                          'CREATE TEMP TABLE content_edge_load (LIKE content_edge) ON COMMIT DROP; '
+                          'CREATE TEMP TABLE content_document_load (LIKE content_document) ON COMMIT DROP')
+
+COPY_NODES_SQL = 'COPY content_node_load({}) FROM STDIN'.format(', '.join(NODE_COLUMNS))
+
+COPY_EDGES_SQL = 'COPY content_edge_load({}) FROM STDIN'.format(', '.join(EDGE_COLUMNS))
+
+COPY_DOCUMENTS_SQL = 'COPY content_document_load({}) FROM STDIN'.format(', '.join(DOCUMENT_COLUMNS))
+
+UPSERT_NODES_SQL = ('INSERT INTO content_node({0}) SELECT {0} FROM content_node_load '
+                    'ON CONFLICT (node_id) DO UPDATE SET {1}').format(
+    ', '.join(NODE_COLUMNS),
+    ', '.join('{0} = EXCLUDED.{0}'.format(c) for c in NODE_COLUMNS[1:]))
+
+INSERT_EDGES_SQL = ('INSERT INTO content_edge({0}) SELECT {0} FROM content_edge_load '
+                    'ON CONFLICT DO NOTHING').format(', '.join(EDGE_COLUMNS))
+
+UPSERT_DOCUMENTS_SQL = ('INSERT INTO content_document({0}) SELECT {0} FROM content_document_load '
+                        'ON CONFLICT (record_id) DO UPDATE SET fingerprint = EXCLUDED.fingerprint').format(
+    ', '.join(DOCUMENT_COLUMNS))
+
+_pool = None
+_pool_pid = None
+_writer = None
+_writer_pid = None
+
+
+class BufferedDocument(object):
+    """
+    The nodes and edges of a document waiting to be written.
+    """
+
+    def __init__(self, fingerprint: str = None):
+        self.fingerprint = fingerprint
+
+        # rows by key, as ids may repeat
+        self.nodes: Dict[int, Tuple[Any, ...]] = OrderedDict()
+        self.edges: Dict[Tuple[int, int, str], None] = OrderedDict()
+
+    @property
+    def row_count(self) -> int:
+        return len(self.nodes) + len(self.edges)
+
+
+class PostgresBulkWriter(object):
+    """
+    Buffers the content nodes and edges of one or more documents, and writes
+    them with `COPY FROM STDIN` in one transaction per batch, using a connection
+    from a pool that is kept across documents.
+
+    Node ids are derived from the record id of the document, given by the
+    'record_id' key of the content, and the position of the node. A fingerprint
+    of the content of each document is stored with its graph. Documents with an
+    unchanged fingerprint are skipped, and the graph of a changed document is
+    deleted and inserted again in the same transaction.
+    """
+
+    def __init__(self, pool: Any = None, max_rows: int = DEFAULT_MAX_ROWS, skip_unchanged: bool = True):
+        """
+
+        :param pool: connection pool, with `getconn` and `putconn` methods,
+               defaults to the pool of the process
+        :param max_rows: flush once this number of nodes and edges are buffered
+        :param skip_unchanged: skip documents whose fingerprint is unchanged
+        """
+        self.max_rows = max_rows
+        self.skip_unchanged = skip_unchanged
+        self.node_count = 0
+        self.edge_count = 0
+        self.skipped_count = 0
+        self.__pool = pool
+        self.__record_id = None
+
+        # documents by record id, with documents without a record id under None
+        self.__documents: Dict[Optional[str], BufferedDocument] = OrderedDict()
+        self.__document = None
+        self.__row_count = 0
+        self.__schema_created = False
+
+    @property
+    def buffered_row_count(self) -> int:
+        return self.__row_count
+
+    def add_node(self, node_text, node_type, url, is_question, seq_index=0, position=None) -> int:
+        if self.__record_id is None or position is None:
+            node_id = get_random_node_id()
+        else:
+            node_id = get_node_id(self.__record_id, position)
+
+        self.__document.nodes[node_id] = (node_id, node_text, node_type, url, is_question, seq_index,
+                                          self.__record_id)
+        return node_id
+
+    def add_edge(self, node_id1, node_id2, edge_type) -> None:
+        self.__document.edges[(node_id1, node_id2, edge_type)] = None
+
+    def write(self, content: Dict[str, Any]) -> None:
+        """
+        Buffer the structured content of a document, flushing if the buffer is full.
+
+        :param content: JSON content
+        :return: None
+        """
+        record_id = content.get('record_id')
+        if record_id is None:
+            document = self.__documents.setdefault(None, BufferedDocument())
+        else:
+            # a later version of a document in the same batch replaces it
+            previous = self.__documents.pop(record_id, None)
+            if previous:
+                self.__row_count -= previous.row_count
+
+            document = self.__documents[record_id] = BufferedDocument(get_content_fingerprint(content))
+
+        row_count = document.row_count
+        self.__record_id = record_id
+        self.__document = document
+        add_content_graph(content, self.add_node, self.add_edge)
+        self.__record_id = None
+        self.__document = None
+        self.__row_count += document.row_count - row_count
+        if self.__row_count >= self.max_rows:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Write the buffered documents in one transaction.
+
+        :return: None
+        """
+        if not self.__documents:
+            return
+
+        documents = self.__documents
+        self.__documents = OrderedDict()
+        self.__row_count = 0
+        record_ids = [r for r in documents if r is not None]
+        nodes = []
+        edges = []
+        pool = self.__pool or get_connection_pool()
+        conn = pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                if not self.__schema_created:
+                    # created in the transaction of the first write, which
+                    # also migrates tables created before record ids
+                    cur.execute(CREATE_TABLES_SQL)
+
+                unchanged = set()
+                if record_ids and self.skip_unchanged:
+                    cur.execute(SELECT_FINGERPRINTS_SQL, (record_ids,))
+                    fingerprints = dict(cur.fetchall())
+                    unchanged = {r for r in record_ids if fingerprints.get(r) == documents[r].fingerprint}
+
+                changed = [r for r in record_ids if r not in unchanged]
+                if changed:
+                    cur.execute(DELETE_EDGES_SQL, (changed,))
+                    cur.execute(DELETE_NODES_SQL, (changed,))
+
+                for record_id, document in documents.items():
+                    if record_id not in unchanged:
+                        nodes.extend(document.nodes.values())
+                        edges.extend(document.edges)
+
+                cur.execute(CREATE_LOAD_TABLES_SQL)
+                cur.copy_expert(COPY_NODES_SQL, to_copy_file(nodes))
+                cur.copy_expert(COPY_EDGES_SQL, to_copy_file(edges))
+                cur.copy_expert(COPY_DOCUMENTS_SQL, to_copy_file([(r, documents[r].fingerprint) for r in changed]))
+                cur.execute(UPSERT_NODES_SQL)
+                cur.execute(INSERT_EDGES_SQL)
+                cur.execute(UPSERT_DOCUMENTS_SQL)
+
+            conn.commit()
+            self.__schema_created = True
+        except Exception as e:
+            conn.rollback()
+            logging.error('DB err: {}'.format(e))
+            logging.error('failed to write {} documents'.format(len(documents)))
+            raise e
+        finally:
+            pool.putconn(conn)
+
+        self.node_count += len(nodes)
+        self.edge_count += len(edges)
+        self.skipped_count += len(unchanged)
+
+    def create_tables(self) -> None:
+        """
+        Create the content tables if they do not exist, and migrate tables
+        created before record ids. The first flush does this if it was not called.
+
+        :return: None
+        """
+        pool = self.__pool or get_connection_pool()
+        conn = pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(CREATE_TABLES_SQL)
+
+            conn.commit()
+            self.__schema_created = True
+        finally:
+            pool.putconn(conn)
+
+
+def to_copy_file(rows: List[Tuple[Any, ...]]) -> StringIO:
+    """
+    Format rows in the text format of `COPY`.
+
+    :param rows: rows of values
+    :return: file-like object
+    """
+    file = StringIO()
+    for row in rows:
+        file.write('\t'.join(format_copy_value(value) for value in row))
+        file.write('\n')
+
+    file.seek(0)
+    return file
+
+
+def format_copy_value(value: Any) -> str:
+    if value is None:
+        return '\\N'
+
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+
+    return (str(value)
+            .replace('\\', '\\\\')
+            .replace('\t', '\\t')
+            .replace('\n', '\\n')
+            .replace('\r', '\\r'))
+
+
+def get_connection_pool() -> ThreadedConnectionPool:
+    """
+    Get the connection pool of this process, as connections cannot be shared
+    with forked worker processes.
+
+    :return: connection pool
+    """
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        _pool = ThreadedConnectionPool(1, MAX_CONNECTIONS, 'dbname={} user={}'.format(DB_NAME, DB_USER))
+        _pool_pid = os.getpid()
+
+    return _pool
+
+
+def get_postgres_writer() -> PostgresBulkWriter:
+    """
+    Get the writer shared by the documents written in this process.
+
+    :return: writer
+    """
+    global _writer, _writer_pid
+    if _writer is None or _writer_pid != os.getpid():
+        _writer = PostgresBulkWriter()
+        _writer_pid = os.getpid()
+
+    return _writer
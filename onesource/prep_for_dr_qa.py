@@ -1,16 +1,18 @@
 from datetime import datetime
 import json
 from logging import Logger
+from model_registry import get_model, load_spacy_en, register_model, SPACY_EN
 import os
 import pandas as pd
-from pipeline import AbstractStep, file_iter, json_lines_output_handler as oh
+from pipeline import AbstractStep, file_iter, json_lines_output_handler as oh, process_files
 import re
-import spacy
 from table_util import infer_schema, table_to_natural_text
-from typing import Any, AnyStr, Callable, Dict, Iterator, IO, List, Optional, Union
+from typing import Any, AnyStr, Callable, Dict, Iterator, IO, List, Optional, Tuple, Union
 from utils import convert_name_to_underscore
 import uuid
 
+register_model(SPACY_EN, load_spacy_en)
+
 
 class PrepForDrQAStep(AbstractStep):
     """
@@ -22,11 +24,12 @@ class PrepForDrQAStep(AbstractStep):
                  source_key: str = None,
                  overwrite: bool = False,
                  source_iter: Callable[[List[str]], Iterator[IO[AnyStr]]] = file_iter,
-                 output_handler: Callable[[str, List[Dict[str, Any]], Optional[bool]], None] = oh):
-        super().__init__(name, source_key, overwrite)
+                 output_handler: Callable[[str, List[Dict[str, Any]], Optional[bool]], None] = oh,
+                 persist: bool = True):
+        super().__init__(name, source_key, overwrite, persist=persist)
         self.__source_iter = source_iter
         self.__output_handler = output_handler
-        self._nlp = spacy.load('en')
+        self._nlp = get_model(SPACY_EN)
 
     def process_file(self,
                      file: IO[AnyStr],
@@ -36,13 +39,22 @@ class PrepForDrQAStep(AbstractStep):
                      accumulator: Dict[str, Any]
                      ) -> str:
         logger.debug('process file: {}'.format(file.name))
-        input_doc = json.load(file)
+        output_path, _ = self.process_content(json.load(file), path, control_data, logger, accumulator)
+        return output_path
+
+    def process_content(self,
+                        input_doc: Dict[str, Any],
+                        path: str,
+                        control_data: Dict[str, Any],
+                        logger: Logger,
+                        accumulator: Dict[str, Any]
+                        ) -> Tuple[str, List[Dict[str, Any]]]:
         metadata = input_doc['metadata']
         record_id = metadata['record_id']
         texts = []
         data = input_doc['data']
         accumulator['files_processed'].append({
-            'path': file.name,
+            'path': path,
             'time': datetime.utcnow().isoformat()
         })
         if 'structured_content' in data:
@@ -81,9 +93,11 @@ class PrepForDrQAStep(AbstractStep):
         step_name = convert_name_to_underscore(self.name)
         output_filename = '{}_{}.jsonl'.format(step_name, record_id)
         output_path = os.path.join(write_root_dir, step_name, output_filename)
-        update_control_info_(file.name, path, output_filename, output_path, accumulator)
-        self.__output_handler(output_path, formatted, self._overwrite)
-        return output_path
+        update_control_info_(path, path, output_filename, output_path, accumulator, self.output_status)
+        if self.persist:
+            self.__output_handler(output_path, formatted, self._overwrite)
+
+        return output_path, formatted
 
     def run(self, control_data: Dict[str, Any], logger: Logger, accumulator: Dict[str, Any]) -> None:
         file_paths = [x['path'] for x in control_data[self.source_key]]
@@ -94,12 +108,9 @@ class PrepForDrQAStep(AbstractStep):
                 if x['status'] == 'processed':
                     processed_file_paths[x['input']] = x
 
-        for file, path in self.__source_iter(file_paths):
-            if not self._overwrite and path in processed_file_paths:
-                accumulator['files_output'].append(processed_file_paths[path])
-                continue
-
-            self.process_file(file, path, control_data, logger, accumulator)
+        for _ in process_files(self, self.__source_iter, file_paths, control_data, logger, accumulator,
+                               processed_file_paths):
+            pass
 
     def infer_list_intro(self, text: str) -> Union[str, None]:
         doc = list(self._nlp(text))
@@ -145,7 +156,8 @@ def update_control_info_(source_filename: str,
                          source_path: str,
                          output_filename: str,
                          output_path: str,
-                         accumulator: Dict[str, Any]
+                         accumulator: Dict[str, Any],
+                         status: str = 'processed'
                          ) -> None:
     now = datetime.utcnow().isoformat()
     accumulator['files_processed'].append({
@@ -156,6 +168,6 @@ def update_control_info_(source_filename: str,
         'filename': output_filename,
         'input': source_path,
         'path': output_path,
-        'status': 'processed',
+        'status': status,
         'time': now
     })
@@ -0,0 +1,154 @@
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import json
+import os
+from queue import Queue
+import requests
+import settings
+from typing import Any, Dict, Iterable, Iterator, Tuple
+from urllib.parse import quote
+
+TIKA_SERVER_ENDPOINT = os.getenv('TIKA_SERVER_ENDPOINT', 'http://localhost:9998')
+
+# recursive metadata and XHTML content of the document and any embedded documents
+RMETA_XML_SERVICE = '/rmeta/xml'
+
+
+class TikaServerException(Exception):
+    pass
+
+
+class TikaClient(object):
+    """
+    Client for a running Tika server, which keeps a pool of keep-alive sessions
+    so that each parse does not pay for a new connection, and runs a bounded
+    number of parses concurrently.
+
+    The client must be created in the process that uses it, as open connections
+    cannot be shared with forked processes.
+    """
+
+    def __init__(self, endpoint: str = None, max_connections: int = 4, timeout: int = 60):
+        """
+
+        :param endpoint: URL of Tika server, defaults to env var TIKA_SERVER_ENDPOINT
+        :param max_connections: maximum number of concurrent requests
+        :param timeout: request timeout in seconds
+        """
+        self.endpoint = (endpoint or TIKA_SERVER_ENDPOINT).rstrip('/')
+        self.max_connections = max_connections
+        self.__timeout = timeout
+        self.__sessions = Queue()
+        for _ in range(max_connections):
+            self.__sessions.put(requests.Session())
+
+        self.__executor = None
+
+    def parse(self, path: str) -> Dict[str, Any]:
+        """
+        Parse a file, blocking until a session is free if `max_connections`
+        requests are already in flight.
+
+        :param path: path of file
+        :return: dict of 'metadata' and XHTML 'content', as returned by
+                 `tika.parser.from_file(path, xmlContent=True)`
+        """
+        headers = {
+            'Accept': 'application/json',
+            'Content-Disposition': 'attachment; filename*=UTF-8\'\'{}'.format(quote(os.path.basename(path)))
+        }
+        session = self.__sessions.get()
+        try:
+            with open(path, 'rb') as file:
+                resp = session.put(self.endpoint + RMETA_XML_SERVICE, data=file, headers=headers,
+                                   timeout=self.__timeout)
+        finally:
+            self.__sessions.put(session)
+
+        if resp.status_code != 200:
+            raise TikaServerException('Tika server returned status {} for {}'.format(resp.status_code, path))
+
+        resp.encoding = 'utf-8'
+        return parse_response(resp.status_code, resp.text)
+
+    def submit(self, path: str) -> Future:
+        """
+        Parse a file in a background thread.
+
+        :param path: path of file
+        :return: future of parse result
+        """
+        if not self.__executor:
+            self.__executor = ThreadPoolExecutor(max_workers=self.max_connections)
+
+        return self.__executor.submit(self.parse, path)
+
+    def parse_iter(self, paths: Iterable[str], max_in_flight: int = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Parse files in order, keeping up to `max_in_flight` parses running ahead
+        of the file being returned, so that the caller's processing of each result
+        overlaps with the parses of the next files.
+
+        :param paths: paths of files
+        :param max_in_flight: maximum number of parses submitted ahead, defaults
+               to `max_connections`
+        :return: iterator of path and parse result
+        """
+        max_in_flight = max_in_flight or self.max_connections
+        pending = deque()
+        try:
+            for path in paths:
+                pending.append((path, self.submit(path)))
+                if len(pending) >= max_in_flight:
+                    path_, future = pending.popleft()
+                    yield path_, future.result()
+
+            while pending:
+                path_, future = pending.popleft()
+                yield path_, future.result()
+
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+    def close(self) -> None:
+        if self.__executor:
+            self.__executor.shutdown()
+            self.__executor = None
+
+        while not self.__sessions.empty():
+            self.__sessions.get().close()
+
+
+def parse_response(status: int, text: str) -> Dict[str, Any]:
+    """
+    Combine the content and metadata of each document in a recursive metadata
+    response, in the same way as `tika.parser`.
+
+    :param status: HTTP status code
+    :param text: response body
+    :return: dict of 'metadata', 'content' and 'status'
+    """
+    parsed = {'metadata': None, 'content': None, 'status': status}
+    if not text:
+        return parsed
+
+    docs = json.loads(text)
+    content = ''.join(doc.get('X-TIKA:content', '') for doc in docs)
+    metadata = {}
+    for doc in docs:
+        for k, v in doc.items():
+            if k == 'X-TIKA:content':
+                continue
+
+            if k in metadata:
+                if not isinstance(metadata[k], list):
+                    metadata[k] = [metadata[k]]
+
+                metadata[k].append(v)
+            else:
+                metadata[k] = v
+
+    parsed['metadata'] = metadata
+    parsed['content'] = content or None
+    return parsed
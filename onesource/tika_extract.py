@@ -1,17 +1,22 @@
+from cache import ContentCache, get_cache_key, get_file_hash
 from datetime import datetime
-from extractors import AbstractExtractor, HeadingExtractor, ListExtractor, TableExtractor, TextExtractor
-from extractors import maybe_heading, is_bullet, is_ordered_list_item
+from extractors import (DEFAULT_NLP_BATCH_SIZE, EXTRACTORS_VERSION, HtmlExtractor, is_bullet,
+                        is_ordered_list_item, maybe_heading, reextract_layout_tables, token_feature_cache)
+import hashlib
 from io import BytesIO
 from logging import Logger
 from lxml import etree
-import lxml.html
+from model_registry import get_model, register_model
 import os
-from pipeline import AbstractStep, file_iter, HIDDEN_FILE_PREFIXES, json_output_handler as oh
+from pipeline import AbstractStep, file_iter, HIDDEN_FILE_PREFIXES, json_output_handler as oh, process_files
 from spacy.lang.en import English
 from spacy import pipeline as spacy_pipeline
-from tika import parser
+from tika_client import RMETA_XML_SERVICE, TikaClient
 from typing import Any, AnyStr, Callable, Dict, IO, Iterator, List, Tuple
-from utils import convert_name_to_underscore, fix_content, flatten
+from utils import convert_name_to_underscore, fix_content
+
+# spaCy English tokenizer with sentences split by `split_sentences`
+SENTENCE_NLP = 'sentence_nlp'
 
 
 def split_sentences(doc):
@@ -78,6 +83,21 @@ def split_sentences(doc):
             yield doc[start:n]
 
 
+def create_sentence_nlp() -> English:
+    # The sentencizer component is a pipeline component that splits sentences
+    # on punctuation like ., ! or ?. You can plug it into your pipeline if you
+    # only need sentence boundaries without the dependency parse. Note that
+    # Doc.sents will raise an error if no sentence boundaries are set.
+    nlp = English()  # just the language with no model
+    # sbd = nlp.create_pipe('sentencizer')
+    sbd = spacy_pipeline.SentenceSegmenter(nlp.vocab, strategy=split_sentences)
+    nlp.add_pipe(sbd)
+    return nlp
+
+
+register_model(SENTENCE_NLP, create_sentence_nlp)
+
+
 class TikaExtractStep(AbstractStep):
     """
     Read One Source files, extract required data, and output as tidy JSON files.
@@ -91,7 +111,13 @@ class TikaExtractStep(AbstractStep):
                  output_handler: Callable[[str, Dict[str, Any]], None] = oh,
                  excluded_tags: List[str] = None,
                  max_file_count: int = 100000,
-                 delete: bool = False):
+                 delete: bool = False,
+                 persist: bool = True,
+                 tika_endpoint: str = None,
+                 max_in_flight: int = 4,
+                 cache: ContentCache = None,
+                 nlp_batch_size: int = DEFAULT_NLP_BATCH_SIZE,
+                 nlp_n_process: int = 1):
         """
 
         :param name: human-readable name of step
@@ -101,22 +127,48 @@ class TikaExtractStep(AbstractStep):
         :param output_handler: receives output
         :param excluded_tags: do not extract from these tags
         :param max_file_count: maximum number of files to process
+        :param delete: delete file after processing flag
+        :param persist: write output when streamed to the next step
+        :param tika_endpoint: URL of Tika server, defaults to env var TIKA_SERVER_ENDPOINT
+        :param max_in_flight: maximum number of concurrent parses by Tika server
+        :param cache: optional cache of Tika parses and extracted content
+        :param nlp_batch_size: number of blocks of text processed by Spacy at a
+               time, or 0 to process each block when reached
+        :param nlp_n_process: number of processes used by Spacy, if not run in
+               the worker pool
         """
-        super().__init__(name, source_key, overwrite, delete)
+        super().__init__(name, source_key, overwrite, delete, persist)
         self.__source_iter = source_iter
         self.__output_handler = output_handler
         self.__excluded_tags = excluded_tags or ['GUID']
         self.__max_file_count = max_file_count
-
-        # The sentencizer component is a pipeline component that splits sentences
-        # on punctuation like ., ! or ?. You can plug it into your pipeline if you
-        # only need sentence boundaries without the dependency parse. Note that
-        # Doc.sents will raise an error if no sentence boundaries are set.
-        nlp = English()  # just the language with no model
-        # sbd = nlp.create_pipe('sentencizer')
-        sbd = spacy_pipeline.SentenceSegmenter(nlp.vocab, strategy=split_sentences)
-        nlp.add_pipe(sbd)
-        self.__nlp = nlp
+        self.__tika_endpoint = tika_endpoint
+        self.__max_in_flight = max_in_flight
+        self.__tika_client = None
+        self.__tika_client_pid = None
+        self.__cache = cache
+        self.__nlp_batch_size = nlp_batch_size
+        self.__nlp_n_process = nlp_n_process
+
+        # path and result of the parse prefetched for the current file
+        self.__parsed = None
+
+        # cache keys of parses by path, computed when prefetching
+        self.__parse_keys = {}
+
+    @property
+    def nlp(self) -> English:
+        # loaded once per process, and shared by steps
+        return get_model(SENTENCE_NLP)
+
+    @property
+    def tika_client(self) -> TikaClient:
+        # connections cannot be shared with forked worker processes
+        if not self.__tika_client or self.__tika_client_pid != os.getpid():
+            self.__tika_client = TikaClient(self.__tika_endpoint, self.__max_in_flight)
+            self.__tika_client_pid = os.getpid()
+
+        return self.__tika_client
 
     def element_iterator(self,
                          stream: IO[AnyStr],
@@ -131,49 +183,16 @@ class TikaExtractStep(AbstractStep):
         # lxml will automatically wrap plain text in a para, body and html tags
         structured_content = []
         text_list = []
-        extractors = [
-            ListExtractor(excluded_tags=['table']),
-            TableExtractor(),
-            TextExtractor(excluded_tags=['ul', 'ol', 'table', 'title', 'h1', 'h2', 'h3', 'h4']),
-            HeadingExtractor(excluded_tags=['ul', 'ol', 'table'])
-        ]
+        extractor = HtmlExtractor()
         stream: IO[AnyStr] = BytesIO(fix_content(text).encode('utf-8'))
-        for ev, elem in self.element_iterator(stream, html=True):
-            process_html_element(elem, ev, extractors, structured_content, text_list, self.__nlp)
+        events = list(self.element_iterator(stream, html=True))
+        extractor.extract_events(events, structured_content, text_list,
+                                 self.nlp, self.__nlp_batch_size, self.__nlp_n_process)
 
         # re-extract content in single column tables used for layout purposes only
-        html = None  # memoize
-        k = []
-        for i, c in enumerate(structured_content):
-            typ = c['type']
-            if typ in ['text', 'heading']:
-                k.append(1)
-            elif typ == 'list':
-                k.append(len(c.get('items', [])))
-            elif typ == 'table':
-                k.append(len(c.get('head', [])) + len(c.get('body', [])))
-                if len(c.get('fields', [])) == 1:
-                    if not html:
-                        # reset stream to reiterate
-                        stream.seek(0)
-
-                        # read stream into str and parse as html
-                        html = lxml.html.fromstring(stream.read())
-
-                    # find single column layout table
-                    contents = html.xpath(('/descendant::table[{0}]/tbody/tr/td/*|' +
-                                           '/descendant::table[{0}]/tr/td/*').format(c['index']))
-                    root = etree.Element('div')
-                    root.extend(contents)
-                    sc = []
-                    tl = []
-                    for evt, ele in etree.iterwalk(root, events=('start', 'end')):
-                        process_html_element(ele, evt, extractors, sc, tl, self.__nlp)
-
-                    j = len(c.get('references', []))
-                    structured_content = flatten([structured_content[:(i - j)], sc,
-                                                  structured_content[(i + 1):]])
-                    text_list = flatten([text_list[:sum(k[:(i - j)])], tl, text_list[sum(k[:(i + 1)]):]])
+        structured_content, text_list = reextract_layout_tables(extractor, events, structured_content, text_list,
+                                                                self.nlp, self.__nlp_batch_size,
+                                                                self.__nlp_n_process)
 
         data = {}
         if len(text_list) == 1:
@@ -194,8 +213,51 @@ class TikaExtractStep(AbstractStep):
                      accumulator: Dict[str, Any]
                      ) -> str:
         logger.debug('process file: {}'.format(file.name))
+        output_path, _ = self.process_content(self.load_content(file, path), path, control_data, logger, accumulator)
+        return output_path
+
+    def load_content(self, file: IO[AnyStr], path: str) -> Dict[str, Any]:
+        parse_key = self.__parse_keys.pop(path, None) or self.__get_parse_key(path)
+        if self.__parsed and self.__parsed[0] == path:
+            parsed = self.__parsed[1]
+            self.__parsed = None
+        else:
+            parsed = self.__cache.get(parse_key) if parse_key else None
+            if parsed is not None:
+                return parsed
+
+            parsed = self.tika_client.parse(path)
+
+        if parse_key:
+            self.__cache.put(parse_key, parsed)
+
+        return parsed
+
+    def __get_parse_key(self, path: str) -> str:
+        if not self.__cache:
+            return None
+
+        return get_cache_key(get_file_hash(path), {'service': RMETA_XML_SERVICE})
+
+    def __get_content_key(self, content: str) -> str:
+        if not self.__cache or not isinstance(content, str):
+            return None
+
+        content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
+        return get_cache_key(content_hash, {
+            'step': 'tika_extract',
+            'version': EXTRACTORS_VERSION,
+            'excluded_tags': self.__excluded_tags
+        })
+
+    def process_content(self,
+                        parsed: Dict[str, Any],
+                        path: str,
+                        control_data: Dict[str, Any],
+                        logger: Logger,
+                        accumulator: Dict[str, Any]
+                        ) -> Tuple[str, Dict[str, Any]]:
         write_root_dir = control_data['job']['write_root_dir']
-        parsed = parser.from_file(path, xmlContent=True)
         filename = os.path.basename(path)
         nameparts = os.path.splitext(filename)
         name = nameparts[0]
@@ -226,14 +288,23 @@ class TikaExtractStep(AbstractStep):
                 'word_count': word_count
             }
         })
-        self.process_doc(parsed['content'], accumulator)
+        content_key = self.__get_content_key(parsed['content'])
+        data = self.__cache.get(content_key) if content_key else None
+        if data is None:
+            self.process_doc(parsed['content'], accumulator)
+            if content_key:
+                self.__cache.put(content_key, accumulator['data'])
+        else:
+            accumulator['data'] = data
 
         step_name = convert_name_to_underscore(self.name)
         output_filename = '{}_{}.json'.format(step_name, record_id)
         output_path = os.path.join(write_root_dir, step_name, output_filename)
-        update_control_info_(file.name, path, output_filename, output_path, accumulator)
-        self.write_output(accumulator, output_path)
-        return output_path
+        update_control_info_(path, path, output_filename, output_path, accumulator, self.output_status)
+        if self.persist:
+            self.write_output(accumulator, output_path)
+
+        return output_path, {'metadata': accumulator['metadata'], 'data': accumulator['data']}
 
     def write_output(self, accumulator: Dict[str, Any], output_path: str) -> None:
         content = {'metadata': accumulator['metadata'], 'data': accumulator['data']}
@@ -252,40 +323,67 @@ class TikaExtractStep(AbstractStep):
             # processed_file_paths = [x['input'] for x in control_data[step_name]
             #                         if x['status'] == 'processed']
 
+        file_paths = [p for p in file_paths if not os.path.basename(p).startswith(HIDDEN_FILE_PREFIXES)]
         accumulator['file_count'] = 0
-        for file, path in self.__source_iter(file_paths):
-            filename = os.path.basename(path)
-            if not filename.startswith(HIDDEN_FILE_PREFIXES):
-                if path in processed_file_paths.keys() and not self._overwrite:
-                    accumulator['files_output'].append(processed_file_paths[path])
-                    continue
 
-                if accumulator['file_count'] > self.__max_file_count:
-                    break
+        # worker processes each parse one file at a time
+        source_iter = self.__source_iter if self.worker_pool else self.__prefetch_iter(processed_file_paths)
+        for path, _ in process_files(self, source_iter, file_paths, control_data, logger, accumulator,
+                                     processed_file_paths, self.__max_file_count):
+            if self._delete:
+                os.remove(path)
 
-                self.process_file(file, path, control_data, logger, accumulator)
-                if self._delete:
-                    os.remove(path)
+            accumulator['file_count'] += 1
 
-                accumulator['file_count'] += 1
+        if not self.worker_pool:
+            logger.debug('token feature cache hits: {}, misses: {}'.format(
+                token_feature_cache.hits, token_feature_cache.misses))
 
+    def __prefetch_iter(self,
+                        processed_file_paths: Dict[str, Dict[str, Any]]
+                        ) -> Callable[[List[str]], Iterator[Tuple[IO[AnyStr], str]]]:
+        """
+        Wrap the source iterable to parse files ahead of the file being processed,
+        so that the HTML processing of each file overlaps with the parses of the
+        next files by Tika server.
 
-def process_html_element(el: etree.ElementBase,
-                         event: str,
-                         extractors: List[AbstractExtractor],
-                         structured_content: List[Dict[str, Any]],
-                         text_list: List[str],
-                         nlp
-                         ) -> None:
-    for extractor in extractors:
-        extractor.extract(el, event, structured_content, text_list, nlp)
+        :param processed_file_paths: output info by input path from a previous run,
+               files that will be skipped or are cached are not parsed
+        :return: data source iterable
+        """
+        def source_iter(file_paths: List[str]) -> Iterator[Tuple[IO[AnyStr], str]]:
+            paths_to_parse = []
+            for path in file_paths:
+                if self.overwrite or path not in processed_file_paths:
+                    parse_key = self.__get_parse_key(path)
+                    if parse_key:
+                        self.__parse_keys[path] = parse_key
+
+                    if not parse_key or parse_key not in self.__cache:
+                        paths_to_parse.append(path)
+
+            parses = self.tika_client.parse_iter(paths_to_parse, self.__max_in_flight)
+            paths_to_parse = set(paths_to_parse)
+            try:
+                for file, path in self.__source_iter(file_paths):
+                    if path in paths_to_parse:
+                        self.__parsed = next(parses)
+
+                    yield file, path
+            finally:
+                parses.close()
+                self.__parsed = None
+                self.__parse_keys = {}
+
+        return source_iter
 
 
 def update_control_info_(source_filename: str,
                          source_path: str,
                          output_filename: str,
                          output_path: str,
-                         accumulator: Dict[str, Any]
+                         accumulator: Dict[str, Any],
+                         status: str = 'processed'
                          ) -> None:
     now = datetime.utcnow().isoformat()
     accumulator['files_processed'].append({
@@ -296,6 +394,6 @@ def update_control_info_(source_filename: str,
         'filename': output_filename,
         'input': source_path,
         'path': output_path,
-        'status': 'processed',
+        'status': status,
         'time': now
     })
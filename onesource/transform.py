@@ -1,15 +1,18 @@
 from datetime import datetime
 import json
 from logging import Logger
+from model_registry import get_model, load_spacy_en, register_model, SPACY_EN
 import os
-from pipeline import AbstractStep, file_iter, json_output_handler as oh
-import spacy
+from pipeline import AbstractStep, file_iter, json_output_handler as oh, process_files
 from spacy.matcher import Matcher
 from spacy.attrs import TAG
 from typing import Any, AnyStr, Callable, Dict, Iterator, IO, List
 from utils import convert_name_to_underscore
 
 
+register_model(SPACY_EN, load_spacy_en)
+
+
 class TransformStep(AbstractStep):
     """
     Extract NLP features from collected text.
@@ -26,7 +29,7 @@ class TransformStep(AbstractStep):
         self.__output_handler = output_handler
 
         # nlp = spacy.load('xx_ent_wiki_sm')
-        nlp = spacy.load('en')
+        nlp = get_model(SPACY_EN)
         matcher = Matcher(nlp.vocab)
         matcher.add('Q1', None, [
             {TAG: 'WDT'}, {TAG: 'NN', 'OP': '+'}, {TAG: 'VBZ'}, {TAG: 'JJ'},
@@ -42,6 +45,7 @@ class TransformStep(AbstractStep):
 
     def process_file(self,
                      file: IO[AnyStr],
+                     path: str,
                      control_data: Dict[str, Any],
                      logger: Logger,
                      accumulator: Dict[str, Any]
@@ -103,6 +107,7 @@ class TransformStep(AbstractStep):
         content = {'metadata': metadata, 'data': {'sentences': sentences}}
         accumulator['files_output'].append({
             'filename': output_filename,
+            'input': path,
             'path': output_path,
             'status': 'processed',
             'time': now
@@ -112,13 +117,12 @@ class TransformStep(AbstractStep):
     def run(self, control_data: Dict[str, Any], logger: Logger, accumulator: Dict[str, Any]) -> None:
         file_paths = [x['path'] for x in control_data[self.source_key]]
         step_name = convert_name_to_underscore(self.name)
-        processed_file_paths = []
+        processed_file_paths = {}
         if step_name in control_data:
-            processed_file_paths = [x['path'] for x in control_data[step_name]
-                                    if x['status'] == 'processed']
-
-        for file, path in self.__source_iter(file_paths):
-            if not self._overwrite and path in processed_file_paths:
-                continue
+            for x in control_data[step_name]:
+                if x['status'] == 'processed' and 'input' in x:
+                    processed_file_paths[x['input']] = x
 
-            self.process_file(file, control_data, logger, accumulator)
+        for _ in process_files(self, self.__source_iter, file_paths, control_data, logger, accumulator,
+                               processed_file_paths):
+            pass
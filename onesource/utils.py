@@ -1,6 +1,8 @@
+from concurrent.futures import ProcessPoolExecutor
 from copy import copy, deepcopy
 from datetime import datetime
 import itertools
+import multiprocessing
 import re
 import sys
 from typing import Callable
@@ -317,3 +319,25 @@ class MakeIter(object):
 
     def __iter__(self):
         return self.generator(*self.args, **self.kwargs)
+
+
+def create_fork_pool(max_workers: int = None) -> ProcessPoolExecutor:
+    """
+    Create a process pool of which the workers are forked, so that they inherit
+    the state of this process, such as registered steps and loaded models,
+    whatever the default start method of the platform.
+
+    :param max_workers: number of processes, defaults to the number of CPUs
+    :return: process pool
+    :raises RuntimeError: if processes cannot be forked on this platform
+    """
+    try:
+        context = multiprocessing.get_context('fork')
+    except ValueError:
+        raise RuntimeError('worker processes are forked, which is not supported on {}'.format(sys.platform))
+
+    if sys.version_info < (3, 7):
+        # the context cannot be passed, and fork is the default start method on POSIX
+        return ProcessPoolExecutor(max_workers=max_workers)
+
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=context)
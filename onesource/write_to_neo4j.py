@@ -1,14 +1,11 @@
+from config_service import ConfigService, get_config_service
 from datetime import datetime
 import json
 from logging import Logger
-import os
-from pipeline import AbstractStep, file_iter, neo4j_output_handler as oh
+from neo4j_writer import Neo4jBatchWriter
+from pipeline import AbstractStep, file_iter, neo4j_output_handler as oh, process_files
 from typing import Any, AnyStr, Callable, Dict, Iterator, IO, List, Optional
 from utils import convert_name_to_underscore
-import yaml
-
-dir_path = os.path.dirname(os.path.realpath(__file__))
-CONFIG_FILE_PATH = os.path.join(dir_path, '../config/config.yml')
 
 FLUSH_FILE_COUNT = 100
 
@@ -23,10 +20,25 @@ class WriteToNeo4JStep(AbstractStep):
                  source_key: str = None,
                  overwrite: bool = False,
                  source_iter: Callable[[List[str]], Iterator[IO[AnyStr]]] = file_iter,
-                 output_handler: Callable[[str, List[str], Optional[bool]], None] = oh):
+                 output_handler: Callable[[str, List[str], Optional[bool]], None] = oh,
+                 writer: Neo4jBatchWriter = None,
+                 config: ConfigService = None):
+        """
+
+        :param name: human-readable name of step
+        :param source_key: `control_data` key for source list
+        :param overwrite: overwrite files flag
+        :param source_iter: data source iterable
+        :param output_handler: receives output
+        :param writer: optional writer to batch many documents in each
+               transaction, used instead of `output_handler`
+        :param config: config service, defaults to the service of the process
+        """
         super().__init__(name, source_key, overwrite)
         self.__source_iter = source_iter
         self.__output_handler = output_handler
+        self.__writer = writer
+        self.__config = config or get_config_service()
 
     def process_file(self,
                      file: IO[AnyStr],
@@ -36,17 +48,25 @@ class WriteToNeo4JStep(AbstractStep):
                      accumulator: Dict[str, Any]
                      ) -> None:
         logger.debug('process file: {}'.format(file.name))
-        config = load_config()
-        doc_types_with_text = config['doc_types_with_text']
+        doc_types_with_text = self.__config.get().doc_types_with_text
         input_doc = json.load(file)
         doc_type = input_doc['metadata']['doc_type']
         if doc_type in doc_types_with_text:
-            data = input_doc['data']
+            # the record id gives the nodes of the document stable ids
+            data = dict(input_doc['data'], record_id=input_doc['metadata'].get('record_id'))
             accumulator['files_processed'].append({
                 'path': file.name,
                 'time': datetime.utcnow().isoformat()
             })
-            self.__output_handler(None, data, self._overwrite)
+            if self.__writer:
+                self.__writer.write(data)
+
+                # worker processes have no end of run at which to flush
+                if self.worker_pool:
+                    self.__writer.flush()
+
+            else:
+                self.__output_handler(None, data, self._overwrite)
 
     def run(self, control_data: Dict[str, Any], logger: Logger, accumulator: Dict[str, Any]) -> None:
         file_paths = [x['path'] for x in control_data[self.source_key]]
@@ -57,16 +77,9 @@ class WriteToNeo4JStep(AbstractStep):
                 if x['status'] == 'processed':
                     processed_file_paths[x['input']] = x
 
-        for file, path in self.__source_iter(file_paths):
-            if not self._overwrite and path in processed_file_paths.keys():
-                accumulator['files_output'].append(processed_file_paths[path])
-                continue
-
-            self.process_file(file, path, control_data, logger, accumulator)
-
-
-def load_config() -> Dict[str, Any]:
-    with open(CONFIG_FILE_PATH, 'r') as f:
-        config = yaml.load(f)
+        for _ in process_files(self, self.__source_iter, file_paths, control_data, logger, accumulator,
+                               processed_file_paths):
+            pass
 
-    return config
+        if self.__writer:
+            self.__writer.flush()
@@ -0,0 +1,35 @@
+import os
+import subprocess
+import sys
+import pytest
+
+root_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+# the loaders of registered models are replaced by stand-ins
+PRELOAD_SCRIPT = '''
+{}
+import model_registry
+from tika_extract import SENTENCE_NLP
+for name in list(model_registry._loaders):
+    model_registry._loaders[name] = lambda: 'model'
+
+model_registry.preload_models()
+print(model_registry.is_model_loaded(SENTENCE_NLP))
+'''
+
+
+def preload_in_new_interpreter(import_statement):
+    # in a new interpreter, as this one has already imported the modules of other tests
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([root_path, os.path.join(root_path, 'onesource')]))
+    output = subprocess.check_output([sys.executable, '-c', PRELOAD_SCRIPT.format(import_statement)], env=env,
+                                     cwd=root_path, universal_newlines=True)
+    return output.strip().splitlines()[-1]
+
+
+def test_preload_loads_models_of_pipeline_steps():
+    assert preload_in_new_interpreter('import onesource\nonesource.import_pipeline_steps()') == 'True'
+
+
+def test_preload_after_importing_app_loads_models_of_pipeline_steps():
+    pytest.importorskip('flask')
+    assert preload_in_new_interpreter('import app') == 'True'
@@ -0,0 +1,66 @@
+from cache import ContentCache, get_cache_key, get_file_hash
+import hashlib
+import os
+
+
+def test_get_and_put(tmp_path):
+    cache = ContentCache(str(tmp_path))
+    assert cache.get('abc') is None
+    cache.put('abc', {'text': ['a', 'b']})
+
+    assert 'abc' in cache
+    assert cache.get('abc') == {'text': ['a', 'b']}
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_evicts_least_recently_used(tmp_path):
+    value = 'x' * 100
+    cache = ContentCache(str(tmp_path), max_size=350)
+    for key in ['aa', 'bb', 'cc']:
+        cache.put(key, value)
+
+    cache.get('aa')
+    cache.put('dd', value)
+
+    assert 'bb' not in cache
+    assert all(key in cache for key in ['aa', 'cc', 'dd'])
+    assert cache.size <= 350
+    assert not os.path.exists(str(tmp_path / 'bb' / 'bb.json'))
+
+
+def test_reopened_cache_keeps_entries_in_order_of_use(tmp_path):
+    cache = ContentCache(str(tmp_path))
+    cache.put('aa', 'x' * 100)
+    os.utime(str(tmp_path / 'aa' / 'aa.json'), (1, 1))
+    cache.put('bb', 'x' * 100)
+
+    cache = ContentCache(str(tmp_path), max_size=cache.size)
+    cache.put('cc', 'x')
+
+    assert 'aa' not in cache
+    assert cache.get('bb') == 'x' * 100
+
+
+def test_cache_key_depends_on_content_and_config(tmp_path):
+    path = tmp_path / 'doc.pdf'
+    path.write_bytes(b'content')
+    file_hash = get_file_hash(str(path))
+
+    assert file_hash == hashlib.sha256(b'content').hexdigest()
+    assert get_cache_key(file_hash, {'version': 1}) == get_cache_key(file_hash, {'version': 1})
+    assert get_cache_key(file_hash, {'version': 1}) != get_cache_key(file_hash, {'version': 2})
+
+
+def test_size_is_bounded_when_shared(tmp_path):
+    value = 'x' * 100
+    caches = [ContentCache(str(tmp_path), max_size=1600) for _ in range(2)]
+    for i in range(20):
+        for j, cache in enumerate(caches):
+            cache.put('{:02d}{}'.format(i, j), value)
+
+    # entries of the other process count towards the size of each
+    dir_size = sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(str(tmp_path)) for f in files)
+    assert dir_size <= 1600 + 2 * 1600 // 16
+    assert all(cache.size <= 1600 for cache in caches)
+    assert caches[0].get('190') == value
+    assert not os.path.exists(str(tmp_path / '00' / '001.json'))
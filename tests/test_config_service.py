@@ -0,0 +1,44 @@
+from config_service import ConfigService, CONFIG_FILE_PATH
+import os
+import pytest
+
+
+def write_config(path, text):
+    with open(path, 'w') as f:
+        f.write(text)
+
+
+def test_config_is_loaded_once_and_precompiled():
+    service = ConfigService(CONFIG_FILE_PATH)
+    config = service.get()
+    for _ in range(3):
+        assert service.get() is config
+
+    assert service.load_count == 1
+    assert isinstance(config.doc_types_with_text, frozenset)
+    assert 'CHANNEL_WEBFORMS' in config.doc_types_with_text
+    assert config.text_props['CHANNEL_WEBFORMS'] == frozenset(['webform_title', 'webform_description',
+                                                               'webform_url'])
+
+
+def test_config_is_reloaded_when_file_changes(tmpdir):
+    path = str(tmpdir.join('config.yml'))
+    write_config(path, 'doc_types_with_text:\n  - A\ndoc_types:\n  A:\n    text_props:\n      - title\n')
+    service = ConfigService(path)
+    assert service.get().doc_types_with_text == frozenset(['A'])
+
+    write_config(path, 'doc_types_with_text:\n  - A\n  - B\ndoc_types:\n  B:\n    text_props:\n      - name\n')
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+    config = service.get()
+
+    assert service.load_count == 2
+    assert config.doc_types_with_text == frozenset(['A', 'B'])
+    assert config.text_props == {'B': frozenset(['name'])}
+
+
+def test_invalid_config_is_rejected(tmpdir):
+    path = str(tmpdir.join('config.yml'))
+    write_config(path, 'doc_types:\n  A:\n    text_props: title\n')
+    with pytest.raises(ValueError):
+        ConfigService(path).get()
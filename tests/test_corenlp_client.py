@@ -0,0 +1,131 @@
+from corenlp_client import CoreNLPClient, CoreNLPServerException
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import re
+from socketserver import ThreadingMixIn
+import threading
+from urllib.parse import parse_qs, urlparse
+import pytest
+
+
+class StandInCoreNLPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('localhost', 0), CoreNLPRequestHandler)
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.connections = set()
+
+    @property
+    def endpoint(self):
+        return 'http://localhost:{}'.format(self.server_address[1])
+
+
+def annotate(text):
+    # tokens are split at spaces, and sentences at periods and blank lines,
+    # with offsets in UTF-16 code units as counted by CoreNLP
+    sentences = []
+    tokens = []
+    for match in re.finditer(r'\S+|\n\n', text):
+        if match.group() == '\n\n':
+            if tokens:
+                sentences.append({'tokens': tokens})
+                tokens = []
+
+            continue
+
+        begin = len(text[:match.start()].encode('utf-16-le')) // 2
+        word = match.group()
+        tokens.append({
+            'originalText': word,
+            'characterOffsetBegin': begin,
+            'ner': 'PERSON' if word.istitle() else 'O',
+            'pos': 'NNP' if word.istitle() else 'NN'
+        })
+        if word.endswith('.'):
+            sentences.append({'tokens': tokens})
+            tokens = []
+
+    if tokens:
+        sentences.append({'tokens': tokens})
+
+    return {'sentences': sentences}
+
+
+class CoreNLPRequestHandler(BaseHTTPRequestHandler):
+    # keep-alive
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        server = self.server
+        with server.lock:
+            server.connections.add(self.client_address)
+            server.request_count += 1
+
+        properties = json.loads(parse_qs(urlparse(self.path).query)['properties'][0])
+        text = self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8')
+        if 'ner' not in properties['annotators'] or text == 'bad':
+            self.send_response(500)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        content = json.dumps(annotate(text)).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = StandInCoreNLPServer()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_tag_returns_sentences_of_each_text(server):
+    client = CoreNLPClient(server.endpoint)
+    tagged = client.tag(['Alice met Bob. They talked.', '', 'A \U0001F600 smile.\n\nNew paragraph'])
+    client.close()
+
+    assert tagged == [
+        [
+            [('Alice', 'PERSON', 'NNP'), ('met', 'O', 'NN'), ('Bob.', 'PERSON', 'NNP')],
+            [('They', 'PERSON', 'NNP'), ('talked.', 'O', 'NN')]
+        ],
+        [],
+        [
+            [('A', 'PERSON', 'NNP'), ('\U0001F600', 'O', 'NN'), ('smile.', 'O', 'NN')],
+            [('New', 'PERSON', 'NNP'), ('paragraph', 'O', 'NN')]
+        ]
+    ]
+    assert server.request_count == 1
+
+
+def test_tag_batches_texts_over_pooled_connections(server):
+    texts = ['Text {} here.'.format(i) for i in range(100)]
+    client = CoreNLPClient(server.endpoint, max_connections=2, max_batch_chars=200)
+    tagged = client.tag(texts)
+    client.close()
+
+    assert [sentences[0][1][0] for sentences in tagged] == [str(i) for i in range(100)]
+    assert 1 < server.request_count < 20
+    assert len(server.connections) <= 2
+
+
+def test_tag_raises_on_error_status(server):
+    client = CoreNLPClient(server.endpoint)
+    with pytest.raises(CoreNLPServerException):
+        client.tag(['bad'])
+
+    client.close()
@@ -0,0 +1,29 @@
+from entity_patterns import compile_regexprs, match_regexprs
+import re
+import pytest
+
+
+def test_match_compiled_regexprs():
+    regexprs = compile_regexprs({
+        'sku': [r'SKU-(\d+)', r'PART (\d+)-(\d+)'],
+        'price': [r'\$\d+']
+    })
+    matches = match_regexprs('SKU-12 costs $5, PART 3-4 costs $60', regexprs)
+
+    assert [(m['value'], m['location']) for m in matches] == [
+        ('sku', [0, 6]),
+        ('sku', [17, 25]),
+        ('price', [13, 15]),
+        ('price', [32, 35])
+    ]
+    assert matches[1]['groups'] == [
+        {'group': 'group_0', 'location': [17, 25]},
+        {'group': 'group_1', 'location': [22, 23]},
+        {'group': 'group_2', 'location': [24, 25]}
+    ]
+    assert all(m['confidence'] == 1.0 for m in matches)
+
+
+def test_invalid_regexpr_fails_on_compile():
+    with pytest.raises(re.error):
+        compile_regexprs({'bad': [r'(\d+']})
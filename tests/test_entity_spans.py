@@ -0,0 +1,60 @@
+from entity_spans import is_valid_date_value, is_valid_entity, prune_contained_entities
+import random
+
+
+def is_contained(entity, entities):
+    # definition by comparison with every other entity
+    start, end = entity['location']
+    for ent in entities:
+        s, e = ent['location']
+        if (start == s and end < e) or (start > s and end == e) or (start > s and end < e):
+            return True
+
+    return False
+
+
+def test_prune_keeps_longest_spans():
+    entities = [
+        {'value': 'a', 'location': [0, 10]},
+        {'value': 'b', 'location': [0, 4]},
+        {'value': 'c', 'location': [6, 10]},
+        {'value': 'd', 'location': [2, 5]},
+        {'value': 'e', 'location': [8, 14]},
+        {'value': 'f', 'location': [8, 14]},
+        {'value': 'g', 'location': [20, 22]}
+    ]
+    assert [ent['value'] for ent in prune_contained_entities(entities)] == ['a', 'e', 'f', 'g']
+
+
+def test_prune_matches_pairwise_comparison():
+    rnd = random.Random(0)
+    for _ in range(200):
+        entities = []
+        for i in range(rnd.randint(0, 30)):
+            start = rnd.randint(0, 40)
+            entities.append({'value': i, 'location': [start, start + rnd.randint(0, 10)]})
+
+        expected = [ent for ent in entities if not is_contained(ent, entities)]
+        assert prune_contained_entities(entities) == expected
+
+
+def test_is_valid_entity():
+    def date(value, location=(0, 10)):
+        return {'entity': 'sys-date', 'location': list(location), 'value': value}
+
+    assert is_valid_entity(date('2019-05-01'))
+    assert not is_valid_entity(date('1975-05-01'))
+    assert not is_valid_entity(date('not a date'))
+    assert not is_valid_entity(date('2019-05-01', (0, 5)))
+    assert is_valid_entity(date({'from': '2019-05-01'}))
+    assert is_valid_entity({'entity': 'sys-number', 'location': [0, 1], 'value': 1})
+
+
+def test_date_validation_is_memoized():
+    is_valid_date_value.cache_clear()
+    for _ in range(10):
+        is_valid_date_value('1 June 2018')
+
+    info = is_valid_date_value.cache_info()
+    assert info.misses == 1
+    assert info.hits == 9
@@ -0,0 +1,167 @@
+import json
+import logging
+import os
+import pytest
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'v2'))
+
+from executors import create_executor, LocalExecutor  # noqa: E402
+from workers import start, TaskError  # noqa: E402
+
+XML = '<CONTENT RECORDID="{}"><TYPE>CHANNEL_ALERTS</TYPE></CONTENT>'
+
+
+# tasks are pickled by reference, so are defined at module level
+
+def add(x, y):
+    return x + y
+
+
+def slow_add(x, y):
+    time.sleep(0.2)
+    return x + y
+
+
+def fail(message):
+    raise ValueError(message)
+
+
+class CountingExecutor(LocalExecutor):
+    """
+    Counts the tasks submitted and not yet returned by `wait`.
+    """
+
+    def __init__(self, max_workers=None):
+        super().__init__(max_workers)
+        self.pending_count = 0
+        self.max_pending_count = 0
+
+    def submit(self, fn, *args):
+        self.pending_count += 1
+        self.max_pending_count = max(self.max_pending_count, self.pending_count)
+        return super().submit(fn, *args)
+
+    def wait(self, tasks):
+        ready, remaining = super().wait(tasks)
+        self.pending_count -= len(ready)
+        return ready, remaining
+
+
+def wait_all(executor, tasks):
+    remaining = tasks
+    while remaining:
+        _, remaining = executor.wait(remaining)
+
+
+def test_dependent_task_runs_with_results_of_dependencies():
+    with LocalExecutor(2) as executor:
+        a = executor.submit(slow_add, 1, 2)
+        b = executor.submit(add, a, 10)
+        c = executor.submit(add, b, a)
+
+        # dependent tasks are deferred until their dependencies complete
+        assert b.future is None and c.future is None
+
+        wait_all(executor, [c])
+        assert executor.get(a) == 3
+        assert executor.get(b) == 13
+        assert executor.get(c) == 16
+
+
+def test_wait_returns_completed_tasks():
+    with LocalExecutor(2) as executor:
+        fast = executor.submit(add, 1, 1)
+        slow = executor.submit(slow_add, 2, 2)
+        dependent = executor.submit(add, slow, 1)
+        ready, remaining = executor.wait([dependent, fast])
+        assert ready == [fast]
+        assert remaining == [dependent]
+
+        wait_all(executor, remaining)
+        assert executor.get(dependent) == 5
+
+
+def test_dependent_of_failed_task_fails_in_its_own_future():
+    with LocalExecutor(2) as executor:
+        failed = executor.submit(fail, 'failed')
+        dependent = executor.submit(add, failed, 1)
+        wait_all(executor, [failed, dependent])
+
+        assert dependent.future is not failed.future
+        for task in (failed, dependent):
+            with pytest.raises(ValueError, match='failed'):
+                executor.get(task)
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        create_executor('unknown')
+
+
+def test_start_bounds_files_in_flight(tmp_path):
+    paths = []
+    for i in range(6):
+        path = tmp_path / '{}.xml'.format(i)
+        path.write_text(XML.format(i))
+        paths.append(str(path))
+
+    control_data = {
+        'job': {'read_root_dir': str(tmp_path), 'write_root_dir': str(tmp_path)},
+        'files': [{'path': path, 'status': 'started'} for path in paths]
+    }
+    outputs = []
+    executor = CountingExecutor(2)
+    with executor:
+        result = start(control_data, str(tmp_path / 'control.json'), lambda path, content: outputs.append(path),
+                       logging.getLogger(), executor, max_in_flight=2)
+
+    # an extract and a collect task for each file
+    assert executor.max_pending_count == 4
+    assert result['file_count'] == 12
+    assert [x['input'] for x in result['files_output_collect']] == paths
+    assert len(outputs) == 12
+
+
+def put_event(channel, i):
+    channel.put({'i': i})
+    return i
+
+
+def test_channel_drains_events_put_by_tasks():
+    with LocalExecutor(2) as executor:
+        channel = executor.create_channel()
+        tasks = [executor.submit(put_event, channel, i) for i in range(5)]
+        wait_all(executor, tasks)
+
+        assert sorted(e['i'] for e in channel.drain()) == list(range(5))
+        assert channel.drain() == []
+
+
+def test_start_counts_one_error_per_failed_file(tmp_path, caplog):
+    paths = []
+    for i in range(2):
+        path = tmp_path / '{}.xml'.format(i)
+        path.write_text(XML.format(i))
+        paths.append(str(path))
+
+    # the extract task of a missing file fails, and so its collect task
+    paths.append(str(tmp_path / 'missing.xml'))
+    temp_path = str(tmp_path / 'control.json')
+    control_data = {
+        'job': {'read_root_dir': str(tmp_path), 'write_root_dir': str(tmp_path)},
+        'files': [{'path': path, 'status': 'started'} for path in paths]
+    }
+    with LocalExecutor(2) as executor:
+        with pytest.raises(TaskError) as exc_info:
+            start(control_data, temp_path, lambda path, content: None, logging.getLogger(), executor)
+
+    assert exc_info.value.path == paths[2]
+    assert '1 of 3 files failed' in caplog.text
+    with open(temp_path) as f:
+        data = json.load(f)
+
+    assert data['job']['status'] == 'error'
+    assert [x['status'] for x in data['extract']] == ['processed', 'processed', 'error']
+    assert [x['status'] for x in data['collect']] == ['processed', 'processed']
@@ -0,0 +1,116 @@
+import json
+import logging
+import pytest
+import re
+
+pytest.importorskip('duckling')
+pytest.importorskip('flair')
+pytest.importorskip('flashtext')
+
+import extract_entities  # noqa: E402
+from extract_entities import ExtractEntitiesStep  # noqa: E402
+
+NAMES = ('Alice', 'Bob')
+
+
+class FakeSpan(object):
+
+    def __init__(self, text, start_pos):
+        self.tag = 'PER'
+        self.text = text
+        self.start_pos = start_pos
+        self.end_pos = start_pos + len(text)
+        self.score = 0.9
+
+
+class FakeSentence(object):
+
+    def __init__(self, text):
+        self.text = text
+        self.spans = []
+
+    def get_spans(self, label_type):
+        return self.spans if label_type == 'ner' else []
+
+
+class FakeTagger(object):
+    """
+    Tags names as persons, recording the sentences of each call to `predict`.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def predict(self, sentences, mini_batch_size=None):
+        self.calls.append((sentences, mini_batch_size))
+        for sentence in sentences if isinstance(sentences, list) else [sentences]:
+            for name in NAMES:
+                for match in re.finditer(name, sentence.text):
+                    sentence.spans.append(FakeSpan(name, match.start()))
+
+
+class FakeDuckling(object):
+
+    def parse_time(self, text):
+        return []
+
+    def parse_number(self, text):
+        return []
+
+
+@pytest.fixture
+def tagger(monkeypatch):
+    tagger = FakeTagger()
+
+    # no entities of config/entities.csv, so that only system entities are matched
+    monkeypatch.setattr(extract_entities, 'load_entities', lambda path: ({}, {}, {}))
+    monkeypatch.setattr(extract_entities, 'Sentence', FakeSentence)
+    monkeypatch.setattr(ExtractEntitiesStep, 'tagger', property(lambda self: tagger))
+    monkeypatch.setattr(ExtractEntitiesStep, 'd', property(lambda self: FakeDuckling()))
+    return tagger
+
+
+def get_persons(entities):
+    return [(e['value'], e['location']) for e in entities if e['entity'] == 'sys-person']
+
+
+def test_texts_of_document_are_tagged_in_one_batch(tmp_path, tagger):
+    texts = ['Alice met Bob.', 'No names here.', 'Then Bob left.']
+    path = tmp_path / 'collect_1.json'
+    path.write_text(json.dumps({'metadata': {'record_id': '1'}, 'data': {'text': texts}}))
+    outputs = []
+    step = ExtractEntitiesStep('Extract Entities', output_handler=lambda p, content: outputs.append(content),
+                               ner_batch_size=2)
+    control_data = {'job': {'write_root_dir': str(tmp_path)}}
+    with open(str(path)) as f:
+        step.process_file(f, str(path), control_data, logging.getLogger(), {'files_output': []})
+
+    assert len(tagger.calls) == 1
+    sentences, mini_batch_size = tagger.calls[0]
+    assert [s.text for s in sentences] == texts
+    assert mini_batch_size == 2
+
+    # spans are relative to the text they are in
+    nlp_text = outputs[0]['data']['nlp_text']
+    assert [x['text'] for x in nlp_text] == texts
+    assert [get_persons(x['entities']) for x in nlp_text] == [
+        [('Alice', [0, 5]), ('Bob', [10, 13])],
+        [],
+        [('Bob', [5, 8])]
+    ]
+
+
+def test_no_texts_are_not_tagged(tagger):
+    step = ExtractEntitiesStep('Extract Entities')
+    assert step.tag_sentences([]) == []
+    assert tagger.calls == []
+
+
+def test_text_without_sentence_is_tagged_alone(tagger):
+    step = ExtractEntitiesStep('Extract Entities')
+    matches = step.match_system_entities('Ask Alice')
+
+    assert len(tagger.calls) == 1
+    sentence, mini_batch_size = tagger.calls[0]
+    assert sentence.text == 'Ask Alice'
+    assert get_persons(matches) == [('Alice', [4, 9])]
@@ -2,6 +2,8 @@ from extract import ExtractStep
 from io import BytesIO
 from mock import Mock
 from pipeline import Pipeline
+import pytest
+from test_extractors import create_nlp
 from typing import Any, AnyStr, Callable, Dict, IO, Iterator, List
 from utils import MakeIter
 
@@ -65,13 +67,14 @@ def mock_file_gen(file_paths):
     yield file, ''
 
 
+@pytest.mark.xfail(strict=True, reason='lines that are not headings are joined by `continues`')
 def test_extract():
     source_iter: Callable[[List[str]], Iterator[IO[AnyStr]]] = lambda file_paths: MakeIter(mock_file_gen)(file_paths)
     mock_output_handler = Mock()
     output_handler: Callable[[str, Dict[str, Any]], None] = mock_output_handler
     pipeline = Pipeline(CONTROL_DATA)
     pipeline.add_steps([
-        ExtractStep('Extract text', 'files', source_iter=source_iter, output_handler=output_handler)
+        ExtractStep('Extract text', 'files', source_iter=source_iter, output_handler=output_handler, nlp=create_nlp())
     ])
     pipeline.run()
     call_args = mock_output_handler.call_args[0]
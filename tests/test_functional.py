@@ -0,0 +1,18 @@
+from functional import load_config
+import os
+import pytest
+import yaml
+
+CONFIG_FILE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'config', 'config.yml')
+
+
+def test_load_config():
+    config = load_config(CONFIG_FILE_PATH)
+    assert 'text_props' in config['doc_types']['CHANNEL_ALERTS']
+
+
+def test_load_config_does_not_construct_objects(tmp_path):
+    path = tmp_path / 'config.yml'
+    path.write_text('doc_types: !!python/object/apply:os.getcwd []\n')
+    with pytest.raises(yaml.YAMLError):
+        load_config(str(path))
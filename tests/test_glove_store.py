@@ -0,0 +1,54 @@
+from glove_store import ALL_ZEROES, UNKNOWN, convert_glove, is_glove_store, load_glove_store
+import numpy as np
+
+
+def write_glove(path, words, dim=3):
+    vectors = {}
+    with open(str(path), 'w', encoding='utf8') as f:
+        for i, word in enumerate(words):
+            vector = [round(i + j / 10, 1) for j in range(dim)]
+            vectors[word] = vector
+            f.write('{} {}\n'.format(word, ' '.join(str(x) for x in vector)))
+
+    return vectors
+
+
+def test_convert_and_load(tmp_path):
+    words = ['the', ',', 'Zürich', 'über', 'a'] + ['w{}'.format(i) for i in range(200)]
+    vectors = write_glove(tmp_path / 'glove.txt', words)
+    store_dir = str(tmp_path / 'glove')
+
+    assert not is_glove_store(store_dir)
+    assert convert_glove(str(tmp_path / 'glove.txt'), store_dir) == (len(words) + 2, 3)
+    assert is_glove_store(store_dir)
+
+    matrix, word2idx = load_glove_store(store_dir)
+    assert isinstance(matrix, np.memmap)
+    assert matrix.dtype == np.float32
+    assert matrix.shape == (len(words) + 2, 3)
+    assert len(word2idx) == len(words) + 2
+
+    # rows in file order after the zero vector, as `embeddings.load`
+    for i, word in enumerate(words, 1):
+        assert word2idx[word] == i
+        assert np.allclose(matrix[i], vectors[word])
+
+    assert word2idx[ALL_ZEROES] == 0
+    assert not matrix[0].any()
+    assert word2idx[UNKNOWN] == len(words) + 1
+    assert np.allclose(matrix[-1], np.average(matrix[len(words) - 100:len(words)], axis=0))
+
+
+def test_vocab_index_misses(tmp_path):
+    write_glove(tmp_path / 'glove.txt', ['cat', 'dog'])
+    convert_glove(str(tmp_path / 'glove.txt'), str(tmp_path / 'glove'))
+    _, word2idx = load_glove_store(str(tmp_path / 'glove'))
+
+    assert 'dog' in word2idx
+    assert 'Dog' not in word2idx
+    assert 'ca' not in word2idx
+    assert 'dogs' not in word2idx
+    assert 'a-much-longer-word-than-any-in-the-vocab' not in word2idx
+    assert '' not in word2idx
+    assert word2idx.get('zebra') is None
+    assert sorted(word2idx) == sorted([ALL_ZEROES, UNKNOWN, 'cat', 'dog'])
@@ -0,0 +1,26 @@
+import os
+import subprocess
+import sys
+
+root_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+HEAVY_MODULES = ['duckling', 'dotenv', 'flair', 'pandas', 'psycopg2', 'py2neo', 'pycorenlp', 'ray', 'spacy',
+                 'tensorflow']
+
+
+def get_loaded_heavy_modules(module):
+    # in a new interpreter, as this one has already imported the modules of other tests
+    script = 'import sys\nimport {}\nprint(",".join(m for m in {!r} if m in sys.modules))'.format(
+        module, HEAVY_MODULES)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([root_path, os.path.join(root_path, 'onesource')]))
+    output = subprocess.check_output([sys.executable, '-c', script], env=env, cwd=root_path,
+                                     universal_newlines=True)
+    return [m for m in output.strip().split(',') if m]
+
+
+def test_pipeline_does_not_import_backends():
+    assert get_loaded_heavy_modules('pipeline') == []
+
+
+def test_package_does_not_import_steps():
+    assert get_loaded_heavy_modules('onesource') == []
@@ -0,0 +1,98 @@
+from job_queue import JOB_ERROR, JOB_PROCESSED, JOB_QUEUED, JobQueue
+import multiprocessing
+import os
+
+# set by tests before workers start, and seen by workers only if they are forked
+loaded_state = {}
+
+
+def copy_job(read_dir, write_dir, temp_dir):
+    output_paths = []
+    for filename in os.listdir(read_dir):
+        with open(os.path.join(read_dir, filename)) as f:
+            text = f.read()
+
+        output_path = os.path.join(write_dir, 'copy', filename)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        with open(output_path, 'w') as f:
+            f.write(text.upper())
+
+        output_paths.append(output_path)
+
+    return output_paths
+
+
+def state_job(read_dir, write_dir, temp_dir):
+    output_path = os.path.join(write_dir, 'state.txt')
+    with open(output_path, 'w') as f:
+        f.write(loaded_state.get('model', 'not loaded'))
+
+    return [output_path]
+
+
+def failing_job(read_dir, write_dir, temp_dir):
+    raise ValueError('bad input')
+
+
+def test_jobs_run_in_background_with_own_dirs(tmpdir):
+    queue = JobQueue(str(tmpdir), copy_job)
+    try:
+        job_ids = []
+        for text in ('one', 'two'):
+            job_id = queue.create_job()
+            assert queue.get_status(job_id)['status'] == JOB_QUEUED
+            with open(os.path.join(queue.get_input_dir(job_id), 'file.txt'), 'w') as f:
+                f.write(text)
+
+            queue.submit(job_id)
+            job_ids.append(job_id)
+
+        for job_id, text in zip(job_ids, ('ONE', 'TWO')):
+            status = queue.wait(job_id, 10)
+            assert status['status'] == JOB_PROCESSED
+            assert status['outputs'] == [os.path.join('copy', 'file.txt')]
+            with open(os.path.join(queue.get_output_dir(job_id), status['outputs'][0])) as f:
+                assert f.read() == text
+    finally:
+        queue.shutdown()
+
+
+def test_failed_job_records_error(tmpdir):
+    queue = JobQueue(str(tmpdir), failing_job)
+    try:
+        job_id = queue.create_job()
+        queue.submit(job_id)
+        status = queue.wait(job_id, 10)
+    finally:
+        queue.shutdown()
+
+    assert status['status'] == JOB_ERROR
+    assert 'bad input' in status['message']
+    assert 'end' in status
+
+
+def test_unknown_job_has_no_status(tmpdir):
+    queue = JobQueue(str(tmpdir), copy_job)
+    assert queue.get_status('0' * 32) is None
+    assert queue.get_status('../etc') is None
+    assert queue.wait('0' * 32, 1) is None
+
+
+def test_workers_are_forked_when_default_is_spawn(tmpdir):
+    start_method = multiprocessing.get_start_method(allow_none=True)
+    multiprocessing.set_start_method('spawn', force=True)
+    loaded_state['model'] = 'preloaded'
+    queue = JobQueue(str(tmpdir), state_job)
+    try:
+        job_id = queue.create_job()
+        queue.submit(job_id)
+        status = queue.wait(job_id, 10)
+        with open(os.path.join(queue.get_output_dir(job_id), 'state.txt')) as f:
+            state = f.read()
+    finally:
+        queue.shutdown()
+        loaded_state.clear()
+        multiprocessing.set_start_method(start_method, force=True)
+
+    assert status['status'] == JOB_PROCESSED
+    assert state == 'preloaded'
@@ -0,0 +1,96 @@
+from journal import ControlJournal, get_journal_path, load_control_data, write_control_snapshot
+import os
+
+
+def create_control_data():
+    return {
+        'job': {'read_root_dir': 'in', 'write_root_dir': 'out', 'status': 'started'},
+        'files': [{'path': 'in/{}.xml'.format(i), 'status': 'started', 'time': ''} for i in range(3)]
+    }
+
+
+def test_load_control_data_replays_journal(tmp_path):
+    temp_path = str(tmp_path / 'control.json')
+    control_data = create_control_data()
+    write_control_snapshot(temp_path, control_data)
+    journal = ControlJournal(temp_path, control_data)
+    journal.step_started('extract')
+    accumulator = {'files_processed': [], 'files_output': []}
+    for i in range(2):
+        accumulator['files_processed'].append({'path': 'in/{}.xml'.format(i), 'time': 't{}'.format(i)})
+        accumulator['files_output'].append({'input': 'in/{}.xml'.format(i), 'path': 'out/{}.json'.format(i),
+                                            'status': 'processed'})
+        journal.sync('extract', accumulator)
+
+    # simulate a crash while writing an event
+    journal.close()
+    with open(get_journal_path(temp_path), 'a') as f:
+        f.write('{"op": "fi')
+
+    loaded = load_control_data(temp_path)
+
+    assert loaded == control_data
+    assert loaded['job']['steps'] == ['extract']
+    assert [x['status'] for x in loaded['files']] == ['processed', 'processed', 'started']
+    assert [x['path'] for x in loaded['extract']] == ['out/0.json', 'out/1.json']
+
+
+def test_journal_upserts_outputs_and_compacts(tmp_path):
+    temp_path = str(tmp_path / 'control.json')
+    control_data = create_control_data()
+    control_data['extract'] = [{'input': 'in/0.xml', 'path': 'out/0.json', 'status': 'processed'}]
+    write_control_snapshot(temp_path, control_data)
+    journal = ControlJournal(temp_path, control_data, compact_event_count=2)
+    accumulator = {
+        'files_processed': [],
+        'files_output': [
+            {'input': 'in/1.xml', 'path': 'out/1.json', 'status': 'processed'},
+            {'input': 'in/0.xml', 'path': 'out/0-rerun.json', 'status': 'processed'}
+        ]
+    }
+    journal.sync('extract', accumulator)
+
+    assert not os.path.exists(get_journal_path(temp_path))
+    assert [x['path'] for x in load_control_data(temp_path)['extract']] == ['out/0-rerun.json', 'out/1.json']
+
+
+def test_resume_after_partial_last_line(tmp_path):
+    temp_path = str(tmp_path / 'control.json')
+    control_data = create_control_data()
+    write_control_snapshot(temp_path, control_data)
+    journal = ControlJournal(temp_path, control_data)
+    journal.step_started('extract')
+    journal.sync('extract', {'files_processed': [{'path': 'in/0.xml', 'time': 't0'}], 'files_output': []})
+    journal.close()
+    with open(get_journal_path(temp_path), 'a') as f:
+        f.write('{"op": "fi')
+
+    # resume, journaling the remaining files
+    resumed = load_control_data(temp_path)
+    journal = ControlJournal(temp_path, resumed)
+    accumulator = {'files_processed': [{'path': 'in/{}.xml'.format(i), 'time': 't'} for i in (1, 2)],
+                   'files_output': []}
+    journal.sync('extract', accumulator)
+    journal.close()
+
+    assert [x['status'] for x in load_control_data(temp_path)['files']] == ['processed'] * 3
+
+
+def test_compact_orders_outputs_by_input(tmp_path):
+    temp_path = str(tmp_path / 'control.json')
+    control_data = create_control_data()
+    control_data['job']['steps'] = ['extract', 'collect']
+    control_data['extract'] = [{'input': 'in/2.xml', 'path': 'out/2.json', 'status': 'processed'}]
+    write_control_snapshot(temp_path, control_data)
+    journal = ControlJournal(temp_path, control_data)
+    journal.sync('extract', {'files_processed': [], 'files_output': [
+        {'input': 'in/{}.xml'.format(i), 'path': 'out/{}.json'.format(i), 'status': 'processed'} for i in (1, 0)
+    ]})
+    journal.sync('collect', {'files_processed': [], 'files_output': [
+        {'input': 'out/{}.json'.format(i), 'path': 'out/c{}.json'.format(i), 'status': 'processed'} for i in (2, 0, 1)
+    ]})
+    journal.compact()
+    loaded = load_control_data(temp_path)
+
+    assert [x['path'] for x in loaded['extract']] == ['out/0.json', 'out/1.json', 'out/2.json']
+    assert [x['path'] for x in loaded['collect']] == ['out/c0.json', 'out/c1.json', 'out/c2.json']
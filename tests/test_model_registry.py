@@ -0,0 +1,63 @@
+import model_registry
+from model_registry import get_model, is_model_loaded, preload_models, register_model, unload_models
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch):
+    # isolated from the models registered by the modules of steps
+    for name in ('_loaders', '_fork_safe', '_models', '_model_pids'):
+        monkeypatch.setattr(model_registry, name, {})
+
+
+class Loader(object):
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self):
+        self.count += 1
+        return object()
+
+
+def test_model_is_loaded_once_and_shared():
+    loader = Loader()
+    register_model('test_shared', loader)
+    model = get_model('test_shared')
+    assert get_model('test_shared') is model
+    assert loader.count == 1
+
+    unload_models()
+    assert get_model('test_shared') is not model
+
+
+def test_registering_another_loader_with_same_name_fails():
+    loader = Loader()
+    register_model('test_duplicate', loader)
+    register_model('test_duplicate', loader)
+    with pytest.raises(ValueError):
+        register_model('test_duplicate', Loader())
+
+
+def test_preload_loads_fork_safe_models_only(monkeypatch):
+    shared_loader = Loader()
+    session_loader = Loader()
+    register_model('test_preload_shared', shared_loader)
+    register_model('test_preload_session', session_loader, fork_safe=False)
+    preload_models()
+    assert is_model_loaded('test_preload_shared')
+    assert not is_model_loaded('test_preload_session')
+    session = get_model('test_preload_session')
+    shared = get_model('test_preload_shared')
+
+    # in a forked process
+    pid = model_registry.os.getpid()
+    monkeypatch.setattr(model_registry.os, 'getpid', lambda: pid + 1)
+    assert get_model('test_preload_shared') is shared
+    assert get_model('test_preload_session') is not session
+    assert (shared_loader.count, session_loader.count) == (1, 2)
+
+
+def test_unregistered_model_fails():
+    with pytest.raises(KeyError):
+        get_model('test_unregistered')
@@ -0,0 +1,166 @@
+from neo4j_writer import Neo4jBatchWriter
+import pytest
+
+
+class FakeResult(object):
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def data(self):
+        return self.rows
+
+
+class FakeTransaction(object):
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.statements = []
+
+    def run(self, cypher, **parameters):
+        if self.graph.fail:
+            raise Exception('statement failed')
+
+        self.statements.append((cypher, parameters))
+        if cypher.startswith('MATCH (d:ContentDocument)'):
+            return FakeResult([{'record_id': r, 'fingerprint': self.graph.fingerprints[r]}
+                               for r in parameters['record_ids'] if r in self.graph.fingerprints])
+
+        return FakeResult([])
+
+    def commit(self):
+        self.graph.committed.append(self.statements)
+        for cypher, parameters in self.statements:
+            if 'MERGE (d:ContentDocument' in cypher:
+                self.graph.fingerprints.update((row['record_id'], row['fingerprint']) for row in parameters['rows'])
+
+    def rollback(self):
+        self.graph.rollback_count += 1
+
+
+class FakeGraph(object):
+
+    def __init__(self):
+        self.fail = False
+        self.schema_statements = []
+        self.committed = []
+        self.rollback_count = 0
+        self.fingerprints = {}
+
+    def run(self, cypher):
+        self.schema_statements.append(cypher)
+
+    def begin(self):
+        return FakeTransaction(self)
+
+
+def test_write_creates_nodes_and_relationships_in_batches():
+    graph = FakeGraph()
+    writer = Neo4jBatchWriter(graph, batch_size=4)
+    writer.write({'structured_content': [
+        {'type': 'heading', 'text': 'Results'},
+        {'type': 'text', 'text': 'First'},
+        {'type': 'text', 'text': 'Second'}
+    ]})
+
+    # flushed once 4 nodes and relationships are buffered
+    assert len(graph.committed) == 1
+    statements = graph.committed[0]
+    assert [cypher.split(' MERGE ')[-1] for cypher, _ in statements] == [
+        '(n:ContentNode {node_id: row.node_id}) SET n = row',
+        '(a)-[:before]->(b)',
+        '(a)-[:after]->(b)',
+        '(a)-[:has_heading]->(b)'
+    ]
+    nodes = statements[0][1]['rows']
+    assert [n['node_text'] for n in nodes] == ['Results', 'First', 'Second']
+    before = statements[1][1]['rows']
+    assert [(r['node_id1'], r['node_id2']) for r in before] == [(nodes[0]['node_id'], nodes[1]['node_id']),
+                                                                (nodes[1]['node_id'], nodes[2]['node_id'])]
+    assert len(graph.schema_statements) == 3
+    assert (writer.node_count, writer.relationship_count) == (3, 6)
+
+
+def test_flush_splits_statements_by_batch_size():
+    graph = FakeGraph()
+    writer = Neo4jBatchWriter(graph, batch_size=1000)
+    writer.write({'structured_content': [{'type': 'list', 'items': ['item {}'.format(i) for i in range(5)]}]})
+    writer.batch_size = 2
+    writer.flush()
+    writer.flush()
+
+    assert len(graph.committed) == 1
+    node_statements = [p['rows'] for c, p in graph.committed[0] if 'SET n = row' in c]
+    assert [len(rows) for rows in node_statements] == [2, 2, 2]
+
+
+def test_node_ids_are_stable_for_record():
+    content = {'record_id': '1234', 'structured_content': [{'type': 'text', 'text': 'one'}]}
+    graph = FakeGraph()
+    writer = Neo4jBatchWriter(graph, skip_unchanged=False)
+    for _ in range(2):
+        writer.write(content)
+        writer.flush()
+
+    first, second = [[p['rows'] for c, p in statements if 'SET n = row' in c][0] for statements in graph.committed]
+    assert first == second
+    assert isinstance(first[0]['node_id'], int)
+
+
+def test_write_flushes_after_interval():
+    graph = FakeGraph()
+    writer = Neo4jBatchWriter(graph, flush_interval=0)
+    writer.write({'structured_content': [{'type': 'text', 'text': 'one'}]})
+
+    assert len(graph.committed) == 1
+    assert writer.buffered_row_count == 0
+
+
+def test_flush_rolls_back_on_error():
+    graph = FakeGraph()
+    graph.fail = True
+    writer = Neo4jBatchWriter(graph)
+    writer.write({'structured_content': [{'type': 'text', 'text': 'one'}]})
+    with pytest.raises(Exception):
+        writer.flush()
+
+    assert graph.rollback_count == 1
+    assert graph.committed == []
+
+
+def test_unchanged_documents_are_skipped():
+    content = {'record_id': '1234', 'structured_content': [{'type': 'text', 'text': 'one'}]}
+    graph = FakeGraph()
+    writer = Neo4jBatchWriter(graph)
+    writer.write(content)
+    writer.flush()
+    writer.write(content)
+    writer.flush()
+
+    assert writer.skipped_count == 1
+    assert writer.node_count == 1
+    statements = graph.committed[1]
+    assert len(statements) == 1
+    assert statements[0][0].startswith('MATCH (d:ContentDocument)')
+
+
+def test_changed_documents_are_replaced():
+    graph = FakeGraph()
+    writer = Neo4jBatchWriter(graph)
+    writer.write({'record_id': '1234', 'structured_content': [{'type': 'text', 'text': 'one'}]})
+    writer.flush()
+    writer.write({'record_id': '1234', 'structured_content': [{'type': 'text', 'text': 'two'}]})
+    writer.write({'record_id': '5678', 'structured_content': [{'type': 'text', 'text': 'three'}]})
+    writer.flush()
+
+    assert writer.skipped_count == 0
+    statements = graph.committed[1]
+    deleted = [p['record_ids'] for c, p in statements if 'DETACH DELETE' in c]
+    assert deleted == [['1234', '5678']]
+
+    # nodes are deleted before they are created again, in the same transaction
+    assert [i for i, (c, _) in enumerate(statements) if 'DETACH DELETE' in c][0] < \
+        [i for i, (c, _) in enumerate(statements) if 'SET n = row' in c][0]
+    nodes = [p['rows'] for c, p in statements if 'SET n = row' in c][0]
+    assert [(n['node_text'], n['record_id']) for n in nodes] == [('two', '1234'), ('three', '5678')]
+    assert len(set(graph.fingerprints.values())) == 2
@@ -1,5 +1,9 @@
-from pipeline import AbstractStep, Pipeline
+import json
+import multiprocessing
+import os
+from pipeline import AbstractStep, create_streams, file_iter, get_temp_path, Parallel, Pipeline, process_files, Stream
 import pytest
+import tempfile
 
 
 # Fake Exception to test successful run - do not use Exception
@@ -8,6 +12,15 @@ class Success(BaseException):
     pass
 
 
+@pytest.fixture
+def spawn_by_default():
+    # the default on macOS, and on Linux from Python 3.14
+    start_method = multiprocessing.get_start_method(allow_none=True)
+    multiprocessing.set_start_method('spawn', force=True)
+    yield
+    multiprocessing.set_start_method(start_method, force=True)
+
+
 # TODO
 # I could achieve the above with mock
 
@@ -41,3 +54,280 @@ def test_pipeline_add_and_run_multiple_steps():
 
     with pytest.raises(Success):
         pipeline.run()
+
+
+def test_parallel_merges_child_steps_in_order(tmp_path):
+    class TestStep(AbstractStep):
+        def run(self, ctrl, log, acc):
+            acc['files_output'].append({
+                'filename': self.name,
+                'input': ctrl['job']['read_root_dir'],
+                'path': self.name,
+                'status': 'processed',
+                'time': ''
+            })
+
+    temp_path = str(tmp_path / 'control.json')
+    control_data = {'job': {'read_root_dir': 'in', 'write_root_dir': 'out'}, 'files': []}
+    pipeline = Pipeline(control_data, temp_path=temp_path)
+    pipeline.add_step(Parallel(source_key='files', max_workers=2)([
+        TestStep('Test Step 1'),
+        TestStep('Test Step 2')
+    ]))
+    pipeline.run()
+
+    with open(temp_path) as f:
+        data = json.load(f)
+
+    assert data['job']['status'] == 'processed'
+    assert data['job']['steps'] == ['test_step_1', 'test_step_2']
+    assert data['test_step_1'][0]['filename'] == 'Test Step 1'
+    assert data['test_step_2'][0]['filename'] == 'Test Step 2'
+
+
+def test_parallel_forks_workers_when_default_is_spawn(tmp_path, spawn_by_default):
+    class TestStep(AbstractStep):
+        def run(self, ctrl, log, acc):
+            acc['files_output'].append({'input': self.name, 'path': self.name, 'status': 'processed'})
+
+    temp_path = str(tmp_path / 'control.json')
+    control_data = {'job': {'read_root_dir': 'in', 'write_root_dir': 'out'}, 'files': []}
+    pipeline = Pipeline(control_data, temp_path=temp_path)
+    pipeline.add_step(Parallel(source_key='files', max_workers=2)([
+        TestStep('Test Step 1'),
+        TestStep('Test Step 2')
+    ]))
+    pipeline.run()
+
+    with open(temp_path) as f:
+        data = json.load(f)
+
+    assert data['job']['status'] == 'processed'
+    assert data['test_step_2'][0]['path'] == 'Test Step 2'
+
+
+def test_parallel_propagates_errors(tmp_path):
+    class TestStep(AbstractStep):
+        def run(self, ctrl, log, acc):
+            pass
+
+    class FailingStep(AbstractStep):
+        def run(self, ctrl, log, acc):
+            raise ValueError('failed')
+
+    temp_path = str(tmp_path / 'control.json')
+    control_data = {'job': {'read_root_dir': 'in', 'write_root_dir': 'out'}, 'files': []}
+    pipeline = Pipeline(control_data, temp_path=temp_path)
+    pipeline.add_step(Parallel(source_key='files')([
+        TestStep('Test Step'),
+        FailingStep('Failing Step')
+    ]))
+    pipeline.run()
+
+    with open(temp_path) as f:
+        data = json.load(f)
+
+    assert data['job']['status'] == 'error'
+    assert 'failed' in data['job']['message']
+    assert data['test_step'] == []
+
+
+def test_process_files_in_worker_pool_keeps_input_order(tmp_path):
+    class TestStep(AbstractStep):
+        def process_file(self, file, path, ctrl, log, acc):
+            acc['files_output'].append({'input': path, 'status': 'processed', 'text': file.read().decode()})
+            return path
+
+        def run(self, ctrl, log, acc):
+            processed_file_paths = {x['input']: x for x in ctrl['test_step']}
+            file_paths = [x['path'] for x in ctrl[self.source_key]]
+            for _ in process_files(self, file_iter, file_paths, ctrl, log, acc, processed_file_paths):
+                pass
+
+            self.files_output = acc['files_output']
+
+    paths = []
+    for i in range(10):
+        path = tmp_path / 'file_{}.txt'.format(i)
+        path.write_text(str(i))
+        paths.append(str(path))
+
+    resumed = {'input': paths[3], 'status': 'processed', 'text': 'resumed'}
+    step = TestStep('Test Step', 'files')
+    control_data = {
+        'job': {'read_root_dir': str(tmp_path), 'write_root_dir': str(tmp_path)},
+        'files': [{'path': path, 'status': 'started'} for path in paths],
+        'test_step': [resumed]
+    }
+    pipeline = Pipeline(control_data, temp_path=str(tmp_path / 'control.json'), max_workers=3, chunk_size=2)
+    pipeline.add_step(step)
+    pipeline.run()
+
+    with open(str(tmp_path / 'control.json')) as f:
+        data = json.load(f)
+
+    assert data['job']['status'] == 'processed'
+    assert [x['input'] for x in data['test_step']] == paths
+    assert [x['input'] for x in step.files_output] == paths
+    assert [x['text'] for x in step.files_output] == ['0', '1', '2', 'resumed', '4', '5', '6', '7', '8', '9']
+    assert step.worker_pool is None
+
+
+def test_worker_pool_forks_workers_when_default_is_spawn(tmp_path, spawn_by_default):
+    class TestStep(AbstractStep):
+        def process_file(self, file, path, ctrl, log, acc):
+            acc['files_output'].append({'input': path, 'status': 'processed', 'text': file.read().decode()})
+
+        def run(self, ctrl, log, acc):
+            file_paths = [x['path'] for x in ctrl[self.source_key]]
+            for _ in process_files(self, file_iter, file_paths, ctrl, log, acc):
+                pass
+
+    paths = []
+    for i in range(4):
+        path = tmp_path / 'file_{}.txt'.format(i)
+        path.write_text(str(i))
+        paths.append(str(path))
+
+    control_data = {
+        'job': {'read_root_dir': str(tmp_path), 'write_root_dir': str(tmp_path)},
+        'files': [{'path': path, 'status': 'started'} for path in paths]
+    }
+    pipeline = Pipeline(control_data, temp_path=str(tmp_path / 'control.json'), max_workers=2, chunk_size=1)
+    pipeline.add_step(TestStep('Test Step', 'files'))
+    pipeline.run()
+
+    with open(str(tmp_path / 'control.json')) as f:
+        data = json.load(f)
+
+    assert data['job']['status'] == 'processed'
+    assert [x['text'] for x in data['test_step']] == ['0', '1', '2', '3']
+
+
+class UpperStep(AbstractStep):
+    def load_content(self, file, path):
+        return {'text': file.read().decode()}
+
+    def process_file(self, file, path, ctrl, log, acc):
+        return self.process_content(self.load_content(file, path), path, ctrl, log, acc)[0]
+
+    def process_content(self, content, path, ctrl, log, acc):
+        output_path = path + '.' + self.name
+        content = {'text': content['text'].upper() + self.name}
+        acc['files_processed'].append({'path': path, 'time': ''})
+        acc['files_output'].append({'input': path, 'path': output_path, 'status': self.output_status})
+        if self.persist:
+            with open(output_path, 'w') as f:
+                json.dump(content, f)
+
+        return output_path, content
+
+    def run(self, ctrl, log, acc):
+        for _ in process_files(self, file_iter, [x['path'] for x in ctrl[self.source_key]], ctrl, log, acc):
+            pass
+
+
+def test_streaming_passes_content_between_steps(tmp_path):
+    paths = []
+    for i in range(3):
+        path = tmp_path / 'file_{}.txt'.format(i)
+        path.write_text('text {}'.format(i))
+        paths.append(str(path))
+
+    def create_pipeline(control_data):
+        return Pipeline(control_data, temp_path=str(tmp_path / 'control.json'), streaming=True)([
+            UpperStep('a', 'files', persist=False),
+            UpperStep('b')
+        ])
+
+    create_pipeline({
+        'job': {'read_root_dir': str(tmp_path), 'write_root_dir': str(tmp_path)},
+        'files': [{'path': path, 'status': 'started'} for path in paths]
+    }).run()
+
+    with open(str(tmp_path / 'control.json')) as f:
+        data = json.load(f)
+
+    assert data['job']['status'] == 'processed'
+    assert data['job']['steps'] == ['a', 'b']
+    assert [x['status'] for x in data['files']] == ['processed'] * 3
+    assert [x['status'] for x in data['a']] == ['streamed'] * 3
+    assert [x['input'] for x in data['b']] == [x['path'] for x in data['a']]
+    assert not any(os.path.exists(x['path']) for x in data['a'])
+    with open(data['b'][0]['path']) as f:
+        assert json.load(f) == {'text': 'TEXT 0Ab'}
+
+    # resume skips files streamed through every step
+    os.remove(data['b'][1]['path'])
+    data['b'] = data['b'][:1]
+    create_pipeline(data).run()
+
+    assert os.path.exists(data['b'][1]['path'])
+    assert len(data['b']) == 3
+
+
+def test_non_streaming_resume_writes_streamed_outputs(tmp_path):
+    paths = []
+    for i in range(2):
+        path = tmp_path / 'file_{}.txt'.format(i)
+        path.write_text('text {}'.format(i))
+        paths.append(str(path))
+
+    def create_pipeline(control_data, streaming):
+        return Pipeline(control_data, temp_path=str(tmp_path / 'control.json'), streaming=streaming)([
+            UpperStep('a', 'files', persist=False),
+            UpperStep('b')
+        ])
+
+    create_pipeline({
+        'job': {'read_root_dir': str(tmp_path), 'write_root_dir': str(tmp_path)},
+        'files': [{'path': path, 'status': 'started'} for path in paths]
+    }, True).run()
+
+    with open(str(tmp_path / 'control.json')) as f:
+        data = json.load(f)
+
+    assert [x['status'] for x in data['a']] == ['streamed'] * 2
+
+    # the output of 'a' is read from file by 'b' when not streamed
+    data['b'] = []
+    create_pipeline(data, False).run()
+
+    assert data['job']['status'] == 'processed'
+    assert [x['status'] for x in data['a']] == ['processed'] * 2
+    assert all(os.path.exists(x['path']) for x in data['a'])
+    assert len(data['b']) == 2
+
+
+def test_last_step_of_stream_writes_output(tmp_path):
+    path = tmp_path / 'file.txt'
+    path.write_text('text')
+    control_data = {
+        'job': {'read_root_dir': str(tmp_path), 'write_root_dir': str(tmp_path)},
+        'files': [{'path': str(path), 'status': 'started'}]
+    }
+    Pipeline(control_data, temp_path=str(tmp_path / 'control.json'), streaming=True)([
+        UpperStep('a', 'files', persist=False),
+        UpperStep('b', persist=False)
+    ]).run()
+
+    with open(str(tmp_path / 'control.json')) as f:
+        data = json.load(f)
+
+    assert [x['status'] for x in data['a']] == ['streamed']
+    assert [x['status'] for x in data['b']] == ['processed']
+    assert os.path.exists(data['b'][0]['path'])
+
+
+def test_stream_is_not_created_for_unchained_steps():
+    steps = [UpperStep('a', 'files'), UpperStep('b', 'files'), UpperStep('c', 'b')]
+    streams = create_streams(steps)
+    assert streams[0] is steps[0]
+    assert isinstance(streams[1], Stream)
+    assert streams[1].steps == steps[1:]
+
+
+def test_control_file_is_named_after_read_dir(tmp_path):
+    temp_path = get_temp_path('/data/in/job-1', str(tmp_path))
+    assert temp_path == str(tmp_path / 'data-in-job-1.json')
+    assert os.path.dirname(get_temp_path('/data/in/job-1')) == tempfile.gettempdir()
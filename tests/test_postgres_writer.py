@@ -0,0 +1,244 @@
+from postgres_writer import CREATE_TABLES_SQL, PostgresBulkWriter
+import pytest
+
+
+class FakeCursor(object):
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, sql, params=None):
+        if self.conn.fail:
+            raise Exception('execute failed')
+
+        self.conn.pending.append((sql, params or []))
+        if sql.startswith('SELECT record_id, fingerprint'):
+            self.rows = [(r, self.conn.fingerprints[r]) for r in params[0] if r in self.conn.fingerprints]
+
+    def fetchall(self):
+        return self.rows
+
+    def copy_expert(self, sql, file):
+        if self.conn.fail:
+            raise Exception('copy failed')
+
+        rows = [line.split('\t') for line in file.read().splitlines()]
+        self.conn.pending.append((sql, rows))
+
+
+class FakeConnection(object):
+
+    def __init__(self):
+        self.fail = False
+        self.pending = []
+        self.committed = []
+        self.commit_count = 0
+        self.rollback_count = 0
+        self.fingerprints = {}
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.committed.extend(self.pending)
+        for sql, rows in self.pending:
+            if sql.startswith('COPY content_document_load('):
+                self.fingerprints.update(rows)
+
+        self.pending = []
+        self.commit_count += 1
+
+    def rollback(self):
+        self.pending = []
+        self.rollback_count += 1
+
+
+class FakePool(object):
+
+    def __init__(self):
+        self.conn = FakeConnection()
+        self.in_use = 0
+
+    def getconn(self):
+        self.in_use += 1
+        return self.conn
+
+    def putconn(self, conn):
+        self.in_use -= 1
+
+
+def get_rows(conn, table):
+    return [row for sql, rows in conn.committed if 'COPY {}_load('.format(table) in sql for row in rows]
+
+
+def test_write_buffers_documents_and_copies_in_one_transaction():
+    pool = FakePool()
+    writer = PostgresBulkWriter(pool)
+    writer.write({'structured_content': [
+        {'type': 'heading', 'text': 'Results'},
+        {'type': 'text', 'text': 'Tab\there,\nnew line and back\\slash'}
+    ]})
+    writer.write({'structured_content': [
+        {'type': 'table', 'head': [['Name', 'Value']], 'body': [['a', '1'], ['b', '2']]}
+    ]})
+    assert pool.conn.commit_count == 0
+
+    writer.flush()
+    writer.flush()
+
+    assert pool.conn.commit_count == 1
+    assert pool.in_use == 0
+    nodes = get_rows(pool.conn, 'content_node')
+    edges = get_rows(pool.conn, 'content_edge')
+    assert [n[2] for n in nodes] == ['heading', 'text', 'table', 'table_head_row', 'table_head_cell',
+                                     'table_head_cell', 'table_body_row', 'table_body_cell', 'table_body_cell',
+                                     'table_body_row', 'table_body_cell', 'table_body_cell']
+    assert nodes[1][1] == 'Tab\\there,\\nnew line and back\\\\slash'
+    assert nodes[2][1] == '\\N'
+    assert (writer.node_count, writer.edge_count) == (len(nodes), len(edges))
+
+    node_ids = [n[0] for n in nodes]
+    assert [node_ids.index(e[0]) for e in edges if e[2] == 'cell_of'] == [4, 5, 7, 8, 10, 11]
+    assert (edges[0][0], edges[0][1], edges[0][2]) == (node_ids[0], node_ids[1], 'before')
+    assert [sql.split(' SELECT ')[0] for sql, _ in pool.conn.committed if sql.startswith('INSERT')] == [
+        'INSERT INTO content_node(node_id, node_text, node_type, url, is_question, seq_index, record_id)',
+        'INSERT INTO content_edge(node_id1, node_id2, edge_type)',
+        'INSERT INTO content_document(record_id, fingerprint)'
+    ]
+
+
+def test_writing_document_again_gives_same_ids():
+    content = {
+        'record_id': '1234',
+        'structured_content': [
+            {'type': 'text', 'text': 'Intro'},
+            {'type': 'list', 'items': ['one', 'two']},
+            {'type': 'table', 'head': ['a', 'b'], 'body': [['1', '2']]}
+        ]
+    }
+    pool = FakePool()
+    writer = PostgresBulkWriter(pool)
+    writer.write(content)
+    writer.write(content)
+    writer.flush()
+    nodes = get_rows(pool.conn, 'content_node')
+    edges = get_rows(pool.conn, 'content_edge')
+
+    # a document in a batch twice is written once
+    assert len(nodes) == 11
+    assert len(set(n[0] for n in nodes)) == 11
+    assert len(set(tuple(e) for e in edges)) == len(edges)
+
+    writer.write(content)
+    writer.flush()
+    assert writer.skipped_count == 1
+
+    writer = PostgresBulkWriter(pool, skip_unchanged=False)
+    writer.write(content)
+    writer.flush()
+    assert get_rows(pool.conn, 'content_node')[11:] == nodes
+
+    other_pool = FakePool()
+    other = PostgresBulkWriter(other_pool)
+    other.write(dict(content, record_id='5678'))
+    other.flush()
+    assert not set(n[0] for n in nodes) & set(n[0] for n in get_rows(other_pool.conn, 'content_node'))
+
+
+def test_write_flushes_when_buffer_is_full():
+    pool = FakePool()
+    writer = PostgresBulkWriter(pool, max_rows=3)
+    writer.write({'structured_content': [{'type': 'text', 'text': 'one'}]})
+    assert pool.conn.commit_count == 0
+
+    writer.write({'structured_content': [{'type': 'text', 'text': 'two'}, {'type': 'text', 'text': 'three'}]})
+    assert pool.conn.commit_count == 1
+    assert writer.buffered_row_count == 0
+
+
+def test_flush_rolls_back_on_error():
+    pool = FakePool()
+    pool.conn.fail = True
+    writer = PostgresBulkWriter(pool)
+    writer.write({'structured_content': [{'type': 'text', 'text': 'one'}]})
+    with pytest.raises(Exception):
+        writer.flush()
+
+    assert pool.conn.rollback_count == 1
+    assert pool.conn.committed == []
+    assert pool.in_use == 0
+
+
+def test_unchanged_documents_are_skipped_and_changed_replaced():
+    pool = FakePool()
+    writer = PostgresBulkWriter(pool)
+    writer.write({'record_id': '1234', 'structured_content': [{'type': 'text', 'text': 'one'}]})
+    writer.write({'record_id': '5678', 'structured_content': [{'type': 'text', 'text': 'two'}]})
+    writer.flush()
+    assert len(pool.conn.fingerprints) == 2
+
+    pool.conn.committed = []
+    writer.write({'record_id': '1234', 'structured_content': [{'type': 'text', 'text': 'one'}]})
+    writer.write({'record_id': '5678', 'structured_content': [{'type': 'text', 'text': 'changed'}]})
+    writer.flush()
+
+    assert pool.conn.commit_count == 2
+    assert writer.skipped_count == 1
+    assert [n[1] for n in get_rows(pool.conn, 'content_node')] == ['changed']
+    assert [r[0] for r in get_rows(pool.conn, 'content_document')] == ['5678']
+
+    # the changed document is deleted before it is loaded, in the same transaction
+    statements = [sql.split(' ')[0] for sql, _ in pool.conn.committed]
+    assert statements[:4] == ['SELECT', 'DELETE', 'DELETE', 'CREATE']
+    assert [params for sql, params in pool.conn.committed if sql.startswith('DELETE')] == [(['5678'],)] * 2
+
+
+def test_later_version_in_batch_replaces_document():
+    pool = FakePool()
+    writer = PostgresBulkWriter(pool)
+    writer.write({'record_id': '1234', 'structured_content': [{'type': 'text', 'text': 'a'},
+                                                             {'type': 'text', 'text': 'b'}]})
+    writer.write({'record_id': '1234', 'structured_content': [{'type': 'text', 'text': 'c'}]})
+    assert writer.buffered_row_count == 1
+
+    writer.flush()
+    assert [n[1] for n in get_rows(pool.conn, 'content_node')] == ['c']
+
+
+def test_first_flush_creates_tables_in_its_transaction():
+    pool = FakePool()
+    writer = PostgresBulkWriter(pool)
+    writer.write({'structured_content': [{'type': 'text', 'text': 'one'}]})
+    writer.flush()
+    writer.write({'structured_content': [{'type': 'text', 'text': 'two'}]})
+    writer.flush()
+
+    statements = [sql for sql, _ in pool.conn.committed]
+    assert statements[0] == CREATE_TABLES_SQL
+    assert statements.count(CREATE_TABLES_SQL) == 1
+    assert pool.conn.commit_count == 2
+
+    # tables created before record ids are migrated
+    assert 'ALTER COLUMN node_id TYPE BIGINT' in CREATE_TABLES_SQL
+    assert 'ADD COLUMN IF NOT EXISTS record_id' in CREATE_TABLES_SQL
+
+
+def test_tables_are_created_again_after_failed_flush():
+    pool = FakePool()
+    pool.conn.fail = True
+    writer = PostgresBulkWriter(pool)
+    writer.write({'structured_content': [{'type': 'text', 'text': 'one'}]})
+    with pytest.raises(Exception):
+        writer.flush()
+
+    pool.conn.fail = False
+    writer.write({'structured_content': [{'type': 'text', 'text': 'two'}]})
+    writer.flush()
+    assert [sql for sql, _ in pool.conn.committed].count(CREATE_TABLES_SQL) == 1
@@ -0,0 +1,49 @@
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'v2'))
+
+import progress  # noqa: E402
+from progress import Progress  # noqa: E402
+
+
+def create_event(step, duration=1., byte_count=None, error=None):
+    return {'file': 'in/0.xml', 'step': step, 'duration': duration, 'bytes': byte_count, 'error': error}
+
+
+def test_eta_from_files_done(monkeypatch, caplog):
+    now = [100.]
+    monkeypatch.setattr(progress, 'timer', lambda: now[0])
+    tracker = Progress(10, 'collect', logging.getLogger(), report_interval=5.)
+    caplog.set_level(logging.INFO)
+    assert tracker.eta is None
+
+    now[0] = 110.
+    tracker.update([
+        create_event('extract', byte_count=1 << 20),
+        create_event('collect'),
+        create_event('extract', error='ValueError()')
+    ])
+
+    # a file is done when its last step completes, or any step fails
+    assert (tracker.done_count, tracker.error_count) == (2, 1)
+    assert tracker.files_per_second == 0.2
+    assert tracker.eta == 40.
+    assert tracker.durations == {'extract': 2., 'collect': 1.}
+
+    tracker.report()
+    assert 'progress: 2/10 files (20.0%), 1 errors, 0.2 files/s, 0.10 MB/s, eta 0:00:40' in caplog.text
+
+
+def test_report_interval(monkeypatch, caplog):
+    now = [0.]
+    monkeypatch.setattr(progress, 'timer', lambda: now[0])
+    tracker = Progress(1, 'collect', logging.getLogger(), report_interval=5.)
+    caplog.set_level(logging.INFO)
+    now[0] = 1.
+    tracker.report()
+    assert 'progress' not in caplog.text
+
+    tracker.report(force=True)
+    assert 'eta ?' in caplog.text
@@ -0,0 +1,113 @@
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+from socketserver import ThreadingMixIn
+import threading
+import time
+from tika_client import TikaClient, TikaServerException
+import pytest
+
+
+class StandInTikaServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('localhost', 0), TikaRequestHandler)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.connections = set()
+
+    @property
+    def endpoint(self):
+        return 'http://localhost:{}'.format(self.server_address[1])
+
+
+class TikaRequestHandler(BaseHTTPRequestHandler):
+    # keep-alive
+    protocol_version = 'HTTP/1.1'
+
+    def do_PUT(self):
+        server = self.server
+        with server.lock:
+            server.connections.add(self.client_address)
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+
+        body = self.rfile.read(int(self.headers['Content-Length'])).decode()
+        time.sleep(0.05)
+        with server.lock:
+            server.in_flight -= 1
+
+        if self.path != '/rmeta/xml' or body == 'bad':
+            self.send_response(422)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        docs = [
+            {'X-TIKA:content': '<html><body><p>{}</p></body></html>'.format(body), 'dc:title': body},
+            {'X-TIKA:content': '<p>embedded</p>', 'dc:title': 'embedded'}
+        ]
+        content = json.dumps(docs).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = StandInTikaServer()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def create_files(tmp_path, n):
+    paths = []
+    for i in range(n):
+        path = tmp_path / 'doc_{}.pdf'.format(i)
+        path.write_text('doc {}'.format(i))
+        paths.append(str(path))
+
+    return paths
+
+
+def test_parse_combines_documents(server, tmp_path):
+    path = create_files(tmp_path, 1)[0]
+    client = TikaClient(server.endpoint, max_connections=1)
+    parsed = client.parse(path)
+    client.close()
+
+    assert parsed['status'] == 200
+    assert parsed['content'] == '<html><body><p>doc 0</p></body></html><p>embedded</p>'
+    assert parsed['metadata'] == {'dc:title': ['doc 0', 'embedded']}
+
+
+def test_parse_iter_bounds_concurrent_parses_and_reuses_connections(server, tmp_path):
+    paths = create_files(tmp_path, 12)
+    client = TikaClient(server.endpoint, max_connections=3)
+    results = list(client.parse_iter(paths))
+    client.close()
+
+    assert [path for path, _ in results] == paths
+    assert [parsed['metadata']['dc:title'][0] for _, parsed in results] == ['doc {}'.format(i) for i in range(12)]
+    assert 1 < server.max_in_flight <= 3
+    assert len(server.connections) <= 3
+
+
+def test_parse_raises_on_error_status(server, tmp_path):
+    path = tmp_path / 'bad.pdf'
+    path.write_text('bad')
+    client = TikaClient(server.endpoint)
+    with pytest.raises(TikaServerException):
+        client.parse(str(path))
+
+    client.close()
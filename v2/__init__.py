@@ -1,22 +1,26 @@
 from argparse import ArgumentParser
 from datetime import datetime
+from executors import BACKEND_LOCAL, BACKEND_RAY, create_executor
 from functional import deep_update_
-import json
+from journal import load_control_data, write_control_snapshot
 import logging
 from logging import Logger
 import os
-from pipeline import json_output_handler as oh
+from pipeline import get_temp_path, json_output_handler as oh
 import sys
 import tempfile
 from timeit import default_timer as timer
-from workers import start
+from workers import DEFAULT_MAX_IN_FLIGHT, start
 
 
 def create_and_run_job(read_root_dir: str,
                        write_root_dir: str,
                        temp_dir: str,
                        overwrite: bool,
-                       logger: Logger = None
+                       logger: Logger = None,
+                       backend: str = BACKEND_LOCAL,
+                       max_workers: int = None,
+                       max_in_flight: int = DEFAULT_MAX_IN_FLIGHT
                        ):
     if not os.path.exists(read_root_dir):
         sys.exit("read dir '{}' not found".format(read_root_dir))
@@ -51,15 +55,13 @@ def create_and_run_job(read_root_dir: str,
                 'status': 'started'
             })
 
-    control_filename = os.path.abspath(read_root_dir).replace('/', '-')[1:]
-    temp_path = os.path.join(temp_dir, control_filename + '.json')
+    temp_path = get_temp_path(read_root_dir, temp_dir)
     if not overwrite and os.path.isfile(temp_path):
-        with open(temp_path, 'r') as control_file:
-            control_data = json.load(control_file)
-            control_paths = [x['path'] for x in control_data['files']]
-            diff = set(control_paths).symmetric_difference(set(paths))
-            if diff:
-                sys.exit('control fileset differs from input fileset')
+        control_data = load_control_data(temp_path)
+        control_paths = [x['path'] for x in control_data['files']]
+        diff = set(control_paths).symmetric_difference(set(paths))
+        if diff:
+            sys.exit('control fileset differs from input fileset')
 
     else:
         control_data = {
@@ -71,8 +73,7 @@ def create_and_run_job(read_root_dir: str,
             },
             'files': files
         }
-        with open(temp_path, 'w') as output_file:
-            json.dump(control_data, output_file)
+        write_control_snapshot(temp_path, control_data)
 
     files_processed = []
     files_output = []
@@ -84,7 +85,9 @@ def create_and_run_job(read_root_dir: str,
     }
 
     start_time = timer()
-    a_update = start(control_data, temp_path, oh, logger)
+    with create_executor(backend, max_workers) as executor:
+        a_update = start(control_data, temp_path, oh, logger, executor, max_in_flight)
+
     end_time = timer()
     print('elapsed: {}'.format(end_time - start_time))
     deep_update_(accumulator, a_update)
@@ -98,7 +101,13 @@ if __name__ == "__main__":
     parser.add_argument('--temp', dest='temp_dir', help='temp dir', default=tempfile.gettempdir())
     parser.add_argument('--overwrite', dest='overwrite', help='overwrite any processed files', action='store_true')
     parser.add_argument('--no-overwrite', dest='overwrite', help='overwrite any processed files', action='store_false')
+    parser.add_argument('--executor', dest='backend', help='executor backend',
+                        choices=[BACKEND_LOCAL, BACKEND_RAY], default=BACKEND_LOCAL)
+    parser.add_argument('--workers', dest='max_workers', help='number of local processes', type=int)
+    parser.add_argument('--max-in-flight', dest='max_in_flight', help='maximum number of files processed at a time',
+                        type=int, default=DEFAULT_MAX_IN_FLIGHT)
     parser.set_defaults(overwrite=False)
     args = parser.parse_args()
 
-    create_and_run_job(args.read_root_dir, args.write_root_dir, args.temp_dir, args.overwrite)
+    create_and_run_job(args.read_root_dir, args.write_root_dir, args.temp_dir, args.overwrite,
+                       backend=args.backend, max_workers=args.max_workers, max_in_flight=args.max_in_flight)
@@ -0,0 +1,305 @@
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from multiprocessing import Manager
+from queue import Empty
+from typing import Any, Callable, Dict, List, Tuple
+
+BACKEND_LOCAL = 'local'
+BACKEND_RAY = 'ray'
+
+
+class Channel(object):
+    """
+    Carries events from tasks to the driver. Tasks put events without waiting
+    for the driver, which drains them periodically. Channels are passed to
+    tasks as arguments.
+    """
+
+    def put(self, event: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def drain(self) -> List[Dict[str, Any]]:
+        """
+        Take the events put since the last drain.
+
+        :return: events
+        """
+        raise NotImplementedError
+
+
+class LocalChannel(Channel):
+    """
+    Channel over a queue served by a manager process.
+    """
+
+    def __init__(self, queue: Any):
+        self.__queue = queue
+
+    def put(self, event: Dict[str, Any]) -> None:
+        self.__queue.put_nowait(event)
+
+    def drain(self) -> List[Dict[str, Any]]:
+        events = []
+        while True:
+            try:
+                events.append(self.__queue.get_nowait())
+            except Empty:
+                return events
+
+
+class EventBuffer(object):
+    """
+    Ray actor that holds events until drained.
+    """
+
+    def __init__(self):
+        self.events = []
+
+    def put(self, event: Dict[str, Any]) -> None:
+        self.events.append(event)
+
+    def drain(self) -> List[Dict[str, Any]]:
+        events, self.events = self.events, []
+        return events
+
+
+class RayChannel(Channel):
+    """
+    Channel over an actor. Putting an event submits a call to the actor
+    without waiting for it to complete.
+    """
+
+    def __init__(self, ray: Any, actor: Any):
+        self.__ray = ray
+        self.__actor = actor
+
+    def __getstate__(self):
+        # Ray is imported again by workers
+        return {'actor': self.__actor}
+
+    def __setstate__(self, state):
+        import ray
+        self.__ray = ray
+        self.__actor = state['actor']
+
+    def put(self, event: Dict[str, Any]) -> None:
+        self.__actor.put.remote(event)
+
+    def drain(self) -> List[Dict[str, Any]]:
+        return self.__ray.get(self.__actor.drain.remote())
+
+
+class Executor(object):
+    """
+    Runs tasks in parallel. A task may be passed the handles of other tasks
+    of the same executor as arguments, and is then run once they complete,
+    with their results in place of the handles.
+    """
+
+    def put(self, value: Any) -> Any:
+        """
+        Share a value with many tasks.
+
+        :param value: value
+        :return: value, or handle to pass as the argument of tasks
+        """
+        return value
+
+    def submit(self, fn: Callable[..., Any], *args) -> Any:
+        """
+        Schedule a task.
+
+        :param fn: function, defined at module level so it can be pickled
+        :param args: arguments, which may be the handles of other tasks
+        :return: task handle
+        """
+        raise NotImplementedError
+
+    def wait(self, tasks: List[Any]) -> Tuple[List[Any], List[Any]]:
+        """
+        Wait for at least one task to complete.
+
+        :param tasks: task handles
+        :return: handles of completed tasks, and of remaining tasks
+        """
+        raise NotImplementedError
+
+    def get(self, task: Any) -> Any:
+        """
+        Get the result of a completed task, raising any exception of the task.
+
+        :param task: task handle
+        :return: result
+        """
+        raise NotImplementedError
+
+    def create_channel(self) -> Channel:
+        """
+        Create a channel of events from tasks to the driver.
+
+        :return: channel
+        """
+        raise NotImplementedError
+
+    def shutdown(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+
+
+class LocalTask(object):
+    """
+    Task of a local executor, which is deferred until its dependencies complete.
+    """
+
+    def __init__(self, fn: Callable[..., Any], args: Tuple[Any, ...]):
+        self.fn = fn
+        self.args = args
+        self.future: Future = None
+
+    @property
+    def dependencies(self) -> List['LocalTask']:
+        return [arg for arg in self.args or [] if isinstance(arg, LocalTask)]
+
+
+class LocalExecutor(Executor):
+    """
+    Runs tasks in a pool of processes on this machine.
+    """
+
+    def __init__(self, max_workers: int = None):
+        """
+
+        :param max_workers: number of processes, defaults to the number of CPUs
+        """
+        self.__pool = ProcessPoolExecutor(max_workers=max_workers)
+        self.__deferred: List[LocalTask] = []
+        self.__manager = None
+
+    def submit(self, fn: Callable[..., Any], *args) -> LocalTask:
+        task = LocalTask(fn, args)
+        self.__deferred.append(task)
+        self.__start_ready_tasks()
+        return task
+
+    def wait(self, tasks: List[LocalTask]) -> Tuple[List[LocalTask], List[LocalTask]]:
+        while True:
+            self.__start_ready_tasks()
+            ready = [t for t in tasks if t.future and t.future.done()]
+            if ready:
+                return ready, [t for t in tasks if not (t.future and t.future.done())]
+
+            # wait for the tasks, or for the dependencies of tasks not yet started
+            futures = set()
+            for task in tasks:
+                if task.future:
+                    futures.add(task.future)
+                else:
+                    futures.update(d.future for d in iter_dependencies(task) if d.future and not d.future.done())
+
+            if not futures:
+                raise ValueError('tasks cannot complete')
+
+            wait(futures, return_when=FIRST_COMPLETED)
+
+    def get(self, task: LocalTask) -> Any:
+        return task.future.result()
+
+    def create_channel(self) -> LocalChannel:
+        if self.__manager is None:
+            self.__manager = Manager()
+
+        return LocalChannel(self.__manager.Queue())
+
+    def shutdown(self) -> None:
+        self.__pool.shutdown()
+        if self.__manager is not None:
+            self.__manager.shutdown()
+            self.__manager = None
+
+    def __start_ready_tasks(self) -> None:
+        deferred = []
+        for task in self.__deferred:
+            dependencies = task.dependencies
+            if all(d.future and d.future.done() for d in dependencies):
+                failed = next((d.future for d in dependencies if d.future.exception()), None)
+                if failed:
+                    # fail with the exception of the dependency, as Ray does,
+                    # in a future of its own
+                    task.future = Future()
+                    task.future.set_exception(failed.exception())
+                else:
+                    args = [arg.future.result() if isinstance(arg, LocalTask) else arg for arg in task.args]
+                    task.future = self.__pool.submit(task.fn, *args)
+
+                task.args = None
+            else:
+                deferred.append(task)
+
+        self.__deferred = deferred
+
+
+class RayExecutor(Executor):
+    """
+    Runs tasks with Ray, locally or on a cluster. Ray passes the results of
+    tasks to dependent tasks through its object store.
+    """
+
+    def __init__(self, **init_args):
+        """
+
+        :param init_args: arguments of `ray.init` if Ray is not yet initialized,
+               e.g. the `address` of a cluster
+        """
+        import ray
+        self.__ray = ray
+        if not ray.is_initialized():
+            ray.init(**init_args)
+
+        self.__remote_fns: Dict[Callable[..., Any], Any] = {}
+
+    def put(self, value: Any) -> Any:
+        return self.__ray.put(value)
+
+    def submit(self, fn: Callable[..., Any], *args) -> Any:
+        remote_fn = self.__remote_fns.get(fn)
+        if remote_fn is None:
+            remote_fn = self.__remote_fns[fn] = self.__ray.remote(fn)
+
+        return remote_fn.remote(*args)
+
+    def wait(self, tasks: List[Any]) -> Tuple[List[Any], List[Any]]:
+        return self.__ray.wait(tasks)
+
+    def get(self, task: Any) -> Any:
+        return self.__ray.get(task)
+
+    def create_channel(self) -> RayChannel:
+        return RayChannel(self.__ray, self.__ray.remote(EventBuffer).remote())
+
+
+def iter_dependencies(task: LocalTask):
+    for d in task.dependencies:
+        yield d
+        if not d.future:
+            yield from iter_dependencies(d)
+
+
+def create_executor(backend: str = BACKEND_LOCAL, max_workers: int = None) -> Executor:
+    """
+    Create an executor.
+
+    :param backend: 'local' or 'ray'
+    :param max_workers: number of processes of a local executor
+    :return: executor
+    """
+    if backend == BACKEND_LOCAL:
+        return LocalExecutor(max_workers)
+
+    if backend == BACKEND_RAY:
+        return RayExecutor()
+
+    raise ValueError("unknown executor backend '{}'".format(backend))
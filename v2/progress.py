@@ -0,0 +1,95 @@
+from datetime import timedelta
+from logging import Logger
+from timeit import default_timer as timer
+from typing import Any, Dict, List
+
+# seconds between progress reports
+DEFAULT_REPORT_INTERVAL = 5.0
+
+
+class Progress(object):
+    """
+    Throughput and estimated time remaining of a job, from the events of its
+    tasks. A file is done when its last step completes, or when any step fails.
+    """
+
+    def __init__(self,
+                 file_count: int,
+                 last_step: str,
+                 logger: Logger,
+                 report_interval: float = DEFAULT_REPORT_INTERVAL):
+        """
+
+        :param file_count: number of files in job
+        :param last_step: name of the last step of each file
+        :param logger: receives progress reports
+        :param report_interval: minimum seconds between reports
+        """
+        self.file_count = file_count
+        self.last_step = last_step
+        self.report_interval = report_interval
+        self.done_count = 0
+        self.error_count = 0
+        self.byte_count = 0
+        self.durations: Dict[str, float] = {}
+        self.__logger = logger
+        self.__start = timer()
+        self.__reported = self.__start
+
+    @property
+    def elapsed(self) -> float:
+        return timer() - self.__start
+
+    @property
+    def files_per_second(self) -> float:
+        elapsed = self.elapsed
+        return self.done_count / elapsed if elapsed else 0.
+
+    @property
+    def bytes_per_second(self) -> float:
+        elapsed = self.elapsed
+        return self.byte_count / elapsed if elapsed else 0.
+
+    @property
+    def eta(self) -> float:
+        """
+        Estimated seconds until all files are done, or None if unknown.
+        """
+        rate = self.files_per_second
+        if not rate:
+            return None
+
+        return (self.file_count - self.done_count) / rate
+
+    def update(self, events: List[Dict[str, Any]]) -> None:
+        for event in events:
+            step = event['step']
+            self.durations[step] = self.durations.get(step, 0.) + event['duration']
+            self.byte_count += event.get('bytes') or 0
+            if event.get('error'):
+                self.error_count += 1
+                self.done_count += 1
+            elif step == self.last_step:
+                self.done_count += 1
+
+    def report(self, force: bool = False) -> None:
+        """
+        Log progress if the report interval has passed.
+
+        :param force: log regardless of interval
+        :return: None
+        """
+        now = timer()
+        if not force and now - self.__reported < self.report_interval:
+            return
+
+        self.__reported = now
+        eta = self.eta
+        self.__logger.info('progress: {}/{} files ({:.1f}%), {} errors, {:.1f} files/s, {:.2f} MB/s, eta {}'.format(
+            self.done_count,
+            self.file_count,
+            100. * self.done_count / self.file_count if self.file_count else 100.,
+            self.error_count,
+            self.files_per_second,
+            self.bytes_per_second / (1 << 20),
+            timedelta(seconds=round(eta)) if eta is not None else '?'))
@@ -1,157 +1,244 @@
-from copy import deepcopy
 from datetime import datetime
-from functional import file_iter, load_config, process_file_collect, process_file_extract
-from io import BytesIO
-import json
+from executors import Channel, Executor, LocalExecutor
+from functional import load_config, process_file_collect, process_file_extract
+from journal import ControlJournal
 from logging import Logger
 import os
-from pipeline import get_temp_path, write_control_file_start
-import ray
-from typing import Any, Callable, Dict, List
+from progress import DEFAULT_REPORT_INTERVAL, Progress
+from timeit import default_timer as timer
+from typing import Any, Callable, Dict, List, Optional
 
 CONFIG_FILE_PATH = '../config/config.yml'
 STEP_EXTRACT = 'extract'
 STEP_COLLECT = 'collect'
 
+# maximum number of files being processed at a time, bounding the results
+# waiting in memory when workers are faster than output
+DEFAULT_MAX_IN_FLIGHT = 100
 
-ray.init()
 
+class TaskError(Exception):
+    """
+    Failure of a task, which unlike the exceptions of some parsers can be
+    pickled to return it to the driver.
+    """
 
-@ray.remote
-def extract_file(filename: str,
-                 data: bytes,
-                 excluded_xml_tags: List[str],
-                 excluded_html_tags: List[str],
-                 log: List[str]
-                 ) -> Dict[str, Any]:
-    log.append('process file: {}'.format(filename))
-    return process_file_extract(BytesIO(data), excluded_xml_tags, excluded_html_tags)
-
-
-@ray.remote
-def collect_data(filename: str,
-                 input_doc: Dict[str, Any],
-                 config: Dict[str, Any],
-                 log: List[str]
-                 ) -> Dict[str, Any]:
-    log.append('collect data: {}'.format(filename))
-    return process_file_collect(input_doc, config)
-
-
-# I don't think queues are really needed. I believe the Ray scheduler
-# takes care of allocating tasks to available workers.
-
-def create_q() -> str:
-    return ray.put([])
+    def __init__(self, step: str, path: str, error: str):
+        super().__init__(step, path, error)
+        self.step = step
+        self.path = path
+        self.error = error
 
+    def __str__(self):
+        return '{} failed: {}: {}'.format(self.step, self.path, self.error)
 
-def enq(q_id, f):
-    q = ray.get(q_id)
-    q[:-1] = q[1:]
-    q[-1] = f
-    return ray.put(q)
 
+def extract_file(path: str,
+                 excluded_xml_tags: List[str],
+                 excluded_html_tags: List[str],
+                 channel: Channel = None
+                 ) -> Dict[str, Any]:
+    start_time = timer()
+    try:
+        # read by the worker, so that the driver does not hold the content of files
+        with open(path, 'rb') as file:
+            result = process_file_extract(file, excluded_xml_tags, excluded_html_tags)
+            byte_count = file.tell()
 
-def deq(q_id):
-    q = ray.get(q_id)
-    f = q[0]
-    q[:-1] = q[1:-1]
-    return f, ray.put(q)
-
-
-def q_has_items(q_id):
-    q = ray.get(q_id)
-    return len(q)
-
-
-def create_log() -> str:
-    return ray.put([])
-
+    except Exception as e:
+        put_event(channel, path, STEP_EXTRACT, start_time, error=e)
+        raise TaskError(STEP_EXTRACT, path, repr(e)) from e
 
-def print_log(log_id: str, logger: Logger) -> None:
-    log = ray.get(log_id)
-    for entry in log:
-        logger.debug(entry)
-    log.clear()
+    put_event(channel, path, STEP_EXTRACT, start_time, result['metadata']['record_id'], byte_count)
+    return result
 
 
-def create_excluded_tags(excluded_tags: List[str]) -> str:
-    return ray.put(excluded_tags)
+def collect_data(input_doc: Dict[str, Any],
+                 config: Dict[str, Any],
+                 path: str,
+                 channel: Channel = None
+                 ) -> Dict[str, Any]:
+    start_time = timer()
+    record_id = input_doc['metadata']['record_id']
+    try:
+        result = process_file_collect(input_doc, config)
+    except Exception as e:
+        put_event(channel, path, STEP_COLLECT, start_time, record_id, error=e)
+        raise TaskError(STEP_COLLECT, path, repr(e)) from e
+
+    put_event(channel, path, STEP_COLLECT, start_time, record_id)
+    return result
+
+
+def put_event(channel: Optional[Channel],
+              path: str,
+              step: str,
+              start_time: float,
+              record_id: str = None,
+              byte_count: int = None,
+              error: Exception = None
+              ) -> None:
+    if channel:
+        channel.put({
+            'file': path,
+            'step': step,
+            'record_id': record_id,
+            'duration': timer() - start_time,
+            'bytes': byte_count,
+            'error': repr(error) if error else None,
+            'time': datetime.utcnow().isoformat()
+        })
 
 
 def start(control_data: Dict[str, Any],
           temp_path: str,
           output_handler: Callable[[str, Dict[str, Any]], None],
-          logger: Logger
+          logger: Logger,
+          executor: Executor = None,
+          max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+          report_interval: float = DEFAULT_REPORT_INTERVAL
           ) -> Dict[str, Any]:
+    """
+    Extract and collect the data of each file, collecting from a file as soon
+    as it is extracted.
+
+    Tasks put an event on a channel as they complete or fail, which the driver
+    uses to report progress, and to journal the files that failed. Remaining
+    files are processed after a failure, then the job ends with the error.
+
+    :param control_data: job control data
+    :param temp_path: path to control file
+    :param output_handler: receives output
+    :param logger: logger
+    :param executor: runs tasks, defaults to a local process pool
+    :param max_in_flight: maximum number of files being processed at a time
+    :param report_interval: minimum seconds between progress reports
+    :return: updates to accumulator
+    """
     file_count = 0
     files_processed = []
     files_output_extract = []
     files_output_collect = []
+    files_output = {STEP_EXTRACT: files_output_extract, STEP_COLLECT: files_output_collect}
     write_root_dir = control_data['job']['write_root_dir']
     config = load_config(CONFIG_FILE_PATH)
-
-    excluded_xml_tags_id = create_excluded_tags(['GUID'])
-    excluded_html_tags_id = create_excluded_tags([])
-    log_id = create_log()
-    config_id = ray.put(config)
-
-    steps_initialized = {}
-    remaining_ids = []
+    if executor is None:
+        executor = LocalExecutor()
+        owns_executor = True
+    else:
+        owns_executor = False
+
+    excluded_xml_tags = executor.put(['GUID'])
+    excluded_html_tags = executor.put([])
+    config = executor.put(config)
+    channel = executor.create_channel()
+
+    journal = ControlJournal(temp_path, control_data)
     file_paths = [x['path'] for x in control_data['files']]
-    for file, _ in file_iter(file_paths):
-        # logger.debug('process file: {}'.format(file.name))
-        extract_id = extract_file.remote(file.name, file.read(),
-                                         excluded_xml_tags_id, excluded_html_tags_id,
-                                         log_id)
-        remaining_ids.append(extract_id)
-        files_processed.append({
-            'path': file.name,
-            'time': datetime.utcnow().isoformat()
-        })
-        collect_id = collect_data.remote(file.name, extract_id, config_id, log_id)
-        remaining_ids.append(collect_id)
+    progress = Progress(len(file_paths), STEP_COLLECT, logger, report_interval)
+    steps_initialized = {}
+    remaining = []
+    task_paths = {}
+
+    # a file is in flight until its collect task, which depends on its extract task, completes
+    collect_tasks = set()
+    errors = []
+    failed_paths = set()
+
+    def start_step(step):
+        if step not in steps_initialized:
+            journal.step_started(step)
+            steps_initialized[step] = True
+
+    def process_events(is_done=False):
+        events = channel.drain()
+        progress.update(events)
+        for event in events:
+            if event['error']:
+                logger.error('{} failed: {}: {}'.format(event['step'], event['file'], event['error']))
+                start_step(event['step'])
+                files_output[event['step']].append({
+                    'input': event['file'],
+                    'path': None,
+                    'status': 'error',
+                    'error': event['error'],
+                    'time': event['time']
+                })
+            else:
+                logger.debug('{} {} in {:.3f}s: {}'.format(event['step'], event['record_id'], event['duration'],
+                                                           event['file']))
+
+        progress.report(force=is_done)
+
+    def process_ready_tasks():
+        nonlocal file_count, remaining
+        ready, remaining = executor.wait(remaining)
+        process_events()
+        for task in ready:
+            path = task_paths.pop(task)
+            collect_tasks.discard(task)
+            try:
+                accumulator = executor.get(task)
+            except Exception as e:
+                # journaled from the event of the task. The collect task of a
+                # file fails with the error of its extract task, counted once
+                if path not in failed_paths:
+                    failed_paths.add(path)
+                    errors.append(e)
+
+                continue
 
-    while remaining_ids:
-        ready_ids, remaining_ids = ray.wait(remaining_ids)
-        for accumulator_id in ready_ids:
-            accumulator = ray.get(accumulator_id)
             step = accumulator['step']
             record_id = accumulator['metadata']['record_id']
             output_filename = '{}_{}.json'.format(step, record_id)
             output_path = os.path.join(write_root_dir, output_filename)
-            if step not in steps_initialized:
-                control_data = write_control_file_start(step, control_data, temp_path)
-                steps_initialized[step] = True
-
-            if step == STEP_EXTRACT:
-                files_output_extract.append({
-                    'filename': output_filename,
-                    'path': output_path,
-                    'status': 'processed',
-                    'time': datetime.utcnow().isoformat()
-                })
-
-            elif step == STEP_COLLECT:
-                files_output_collect.append({
-                    'filename': output_filename,
-                    'path': output_path,
-                    'status': 'processed',
-                    'time': datetime.utcnow().isoformat()
-                })
-
+            start_step(step)
+            files_output[step].append({
+                'filename': output_filename,
+                'input': path,
+                'path': output_path,
+                'status': 'processed',
+                'time': datetime.utcnow().isoformat()
+            })
             output_handler(output_path, accumulator)
             file_count += 1
-            if file_count % 50 == 0:
-                print_log(log_id, logger)
-                write_control_file(control_data,
-                                   files_processed, files_output_extract, files_output_collect,
-                                   temp_path)
 
-    print_log(log_id, logger)
-    write_control_file(control_data,
-                       files_processed, files_output_extract, files_output_collect,
-                       temp_path, is_done=True)
+        write_control_file(journal, files_processed, files_output_extract, files_output_collect)
+
+    try:
+        for path in file_paths:
+            # each file has an extract and a collect task
+            while len(collect_tasks) >= max_in_flight:
+                process_ready_tasks()
+
+            extract_task = executor.submit(extract_file, path, excluded_xml_tags, excluded_html_tags, channel)
+            collect_task = executor.submit(collect_data, extract_task, config, path, channel)
+            remaining.extend([extract_task, collect_task])
+            task_paths[extract_task] = path
+            task_paths[collect_task] = path
+            collect_tasks.add(collect_task)
+            files_processed.append({
+                'path': path,
+                'time': datetime.utcnow().isoformat()
+            })
+
+        while remaining:
+            process_ready_tasks()
+
+        process_events(is_done=True)
+
+    finally:
+        if owns_executor:
+            executor.shutdown()
+
+    error = errors[0] if errors else None
+    if error:
+        logger.error('{} of {} files failed'.format(len(errors), len(file_paths)))
+
+    write_control_file(journal, files_processed, files_output_extract, files_output_collect, is_done=True,
+                       error=error)
+    if error:
+        raise error
 
     return {
         'file_count': file_count,
@@ -161,37 +248,23 @@ def start(control_data: Dict[str, Any],
     }
 
 
-def write_control_file(control_data: Dict[str, Any],
+def write_control_file(journal: ControlJournal,
                        files_processed: List[Dict[str, Any]],
                        files_output_extract: List[Dict[str, Any]],
                        files_output_collect: List[Dict[str, Any]],
-                       temp_path: str = None,
-                       is_done: bool = False
+                       is_done: bool = False,
+                       error: Exception = None
                        ) -> None:
-    if not control_data:
-        return
-
-    if not temp_path:
-        temp_path = get_temp_path(control_data['job']['read_root_dir'])
-
-    data = deepcopy(control_data)
-    processed = {x['path']: x['time'] for x in files_processed}
-    files = []
-    for file in control_data['files']:
-        path = file['path']
-        if path in processed:
-            time = processed[path]
-            file['status'] = 'processed'
-            file['time'] = time
-
-        files.append(file)
-
-    data['files'] = files
-    data[STEP_EXTRACT] = files_output_extract
-    data[STEP_COLLECT] = files_output_collect
+    """
+    Journal the control info accumulated since the last call, which costs O(1)
+    per file. The journal is compacted into the control file when done.
+    """
+    journal.sync(STEP_EXTRACT, {'files_processed': files_processed, 'files_output': files_output_extract})
+    journal.sync(STEP_COLLECT, {'files_processed': [], 'files_output': files_output_collect})
     if is_done:
-        data['job']['status'] = 'processed'
-        data['job']['end'] = datetime.utcnow().isoformat()
+        if error:
+            journal.job_updated(status='error', message=repr(error), end=datetime.utcnow().isoformat())
+        else:
+            journal.job_updated(status='processed', end=datetime.utcnow().isoformat())
 
-    with open(temp_path, 'w') as output_file:
-        json.dump(data, output_file)
+        journal.compact()
@@ -1,4 +1,9 @@
 from app import app
+from model_registry import preload_models
+
+# load models before gunicorn forks workers when run with `--preload`, so
+# that workers and their job processes share them instead of each loading them
+preload_models()
 
 
 if __name__ == '__main__':